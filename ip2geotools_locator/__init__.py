@@ -3,11 +3,35 @@
 """Top-level package for ip2geotools-locator."""
 
 import logging
+import sys
+import types
+# Imported first, so profiler measures time of all following imports
+import ip2geotools_locator.profiling
 import ip2geotools_locator.database_connectors
 import ip2geotools_locator.calculations
 
 from ip2geotools_locator.main import Locator
 
+
+class _PackageModule(types.ModuleType):
+    """
+    Class of this package, which imports AsyncLocator (and asyncio with it) when it is accessed
+    for the first time. Module level __getattr__ needs Python 3.7.
+    """
+    def __getattr__(self, name):
+        if name != "AsyncLocator":
+            raise AttributeError("module %r has no attribute %r" % (self.__name__, name))
+
+        from ip2geotools_locator.async_locator import AsyncLocator
+        setattr(self, name, AsyncLocator)
+        return AsyncLocator
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | {"AsyncLocator"})
+
+
+sys.modules[__name__].__class__ = _PackageModule
+
 __author__ = """Oldřich Klíma"""
 __email__ = 'xklima27@vutbr.cz'
 __version__ = '1.6.0'
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio application module
+==========================
+
+This module contains asyncio counterpart of Locator class
+
+"""
+import asyncio
+import functools
+import time
+
+from ip2geotools.errors import LocationError
+
+from ip2geotools_locator import metrics, profiling
+from ip2geotools_locator.main import Locator
+from ip2geotools_locator.utils import DB_TYPES
+from ip2geotools_locator.utils import LOGGER as logger
+
+# Native coroutines of web databases by database name: (coroutine, names of settings it takes).
+# They need optional aiohttp package, which takes long to import, so they are loaded by the
+# first AsyncLocator.
+ASYNC_DATABASES = {}
+
+
+def _load_async_databases():
+    """Function loads native coroutines of web databases into ASYNC_DATABASES. Returns False if aiohttp is not installed."""
+    try:
+        from ip2geotools_locator.database_connectors import async_web
+    except ImportError:
+        return False
+
+    for db_name, database in async_web.ASYNC_DATABASES.items():
+        ASYNC_DATABASES.setdefault(db_name, database)
+    return True
+
+
+def _task_result(task):
+    """Function returns result of finished task, or its exception if it has failed or has been cancelled."""
+    if task.cancelled():
+        return asyncio.CancelledError()
+    return task.exception() or task.result()
+
+
+class AsyncLocator(Locator):
+    """
+    Asyncio counterpart of Locator class.
+
+    Web databases are queried with non-blocking HTTP requests (aiohttp package is needed),
+    local file databases and databases without native implementation are offloaded into executor.
+    One AsyncLocator can serve many concurrent lookups. Use locations returned by
+    fetch_locations() in that case, because self.locations holds only the last lookup.
+    """
+    # fetch_locations() and calculate() are coroutine counterparts of blocking methods of Locator
+    # pylint: disable=invalid-overridden-method
+    def __init__(self, generate_map=False, map_file_name="locations"):
+        super().__init__(generate_map, map_file_name)
+
+        # HTTP session shared by all lookups, created in running event loop
+        self._session = None
+
+        if not _load_async_databases():
+            logger.warning("Package aiohttp is not installed. All databases will be queried in executor.")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    def _get_session(self):
+        """Method returns aiohttp session with connection pool shared by all lookups."""
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            http_settings = self.settings["http"]
+            connector = aiohttp.TCPConnector(limit=0, limit_per_host=http_settings["pool_size"])
+            timeout = aiohttp.ClientTimeout(sock_connect=http_settings["connect_timeout"], sock_read=http_settings["read_timeout"])
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+        return self._session
+
+    async def fetch_locations(self, ip_address):
+        """
+        Coroutine searches through selected databases for location of given IP address.
+        All active databases are queried concurrently. Returns dictionary of locations,
+        which is also stored in "locations" variable. In quorum mode remaining requests
+        are cancelled as soon as enough databases agree.
+        """
+        logger.info("Gathering location records for IP address %s.", ip_address)
+        databases = []
+        coroutines = []
+
+        for db_type in DB_TYPES:
+            for db_name, db_settings in self.settings[db_type].items():
+                if not db_settings["active"]:
+                    continue
+
+                connector = self._get_connector(db_name, db_settings)
+                if connector is None:
+                    continue
+
+                logger.debug("Database %s is set as Active in settings. Gathering location.", db_name)
+                databases.append((connector, db_settings))
+                coroutines.append(self._lookup_database(db_name, connector, db_settings, ip_address))
+
+        responses, quorum = await self._gather(databases, coroutines)
+        locations = {}
+
+        for (connector, db_settings), location in zip(databases, responses):
+            # Add location to the map?
+            if location is not None and db_settings["generate_marker"] is True and self.generate_map is True:
+                connector.add_to_map(location)
+
+            locations[connector.location_name] = location
+
+        # Clean all tangling None values
+        self.ip_address = ip_address
+        self.quorum = quorum
+        self.locations = {key: value for key, value in locations.items() if value is not None}
+        return self.locations
+
+    async def _gather(self, databases, coroutines):
+        """
+        Coroutine awaits database coroutines and returns list of their responses (None for
+        cancelled and failed ones) and list of databases in quorum. Failure of one database
+        does not stop lookups in the others.
+        """
+        if not self.settings["quorum"]["active"]:
+            responses = await asyncio.gather(*coroutines, return_exceptions=True)
+            return [self._response(connector, response) for (connector, _), response in zip(databases, responses)], None
+
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        pending = set(tasks)
+        quorum = None
+
+        while pending and quorum is None:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            quorum = self._find_quorum({connector.location_name: self._response(connector, _task_result(task))
+                                        for (connector, _), task in zip(databases, tasks) if task.done()})
+
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.info("Quorum of %s reached, %i requests cancelled.", ", ".join(quorum), len(pending))
+
+        return [self._response(connector, _task_result(task)) if task.done() else None for (connector, _), task in zip(databases, tasks)], quorum
+
+    @staticmethod
+    def _response(connector, response):
+        """
+        Method returns location from result of database coroutine. Exception raised by
+        the coroutine (unexpected response of web database) is logged and None is returned.
+        """
+        if isinstance(response, asyncio.CancelledError):
+            return None
+        if isinstance(response, Exception):
+            logger.error("Lookup in database %s has failed: %r", connector.location_name, response)
+            return None
+        return response
+
+    async def _lookup_database(self, db_name, connector, db_settings, ip_address):
+        """
+        Coroutine returns location of IP address from one database. Caches set as Active in
+        settings are searched before the database is queried, like in Locator._lookup().
+        Web databases with native coroutine are queried with aiohttp, others in executor.
+        """
+        name = connector.location_name
+        location = self._lookup_cached(name, db_settings, ip_address)
+        if location is not None:
+            return location
+
+        if db_name in ASYNC_DATABASES:
+            fetch, setting_names = ASYNC_DATABASES[db_name]
+            location = await self._fetch_native(fetch, ip_address, [db_settings.get(setting) for setting in setting_names], connector)
+        else:
+            location = await self._fetch_in_executor(connector, ip_address)
+
+        if location is not None:
+            self._store_cached(name, db_settings, ip_address, location)
+        return location
+
+    async def _fetch_native(self, fetch, ip_address, arguments, connector):
+        """
+        Coroutine awaits native database coroutine with settings given in arguments (API key,
+        login, ...). Circuit breaker, rate limiting, validation and outcomes of requests are
+        handled by connector like in its get_location() method. Unexpected exceptions (response
+        the coroutine cannot parse) are logged as service errors and None is returned.
+        """
+        wait = connector.reserve_request()
+        if wait is None:
+            return None
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        # Exceptions not handled below mean unavailable service
+        outcome = metrics.SERVICE_ERROR
+        started = time.perf_counter()
+        try:
+            with profiling.span("database %s" % connector.location_name):
+                location = await fetch(self._get_session(), ip_address, *arguments)
+            outcome = metrics.INVALID_RESPONSE
+            connector.accept_location(location)
+            outcome = metrics.SUCCESS
+            return location
+
+        except asyncio.CancelledError:
+            # Request cancelled in quorum mode is neither success nor failure
+            outcome = metrics.CANCELLED
+            raise
+
+        except LocationError as exception:
+            outcome = connector.error_outcome(exception)
+
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.error("Database %s returned unexpected response: %r", connector.location_name, exception)
+
+        finally:
+            connector.record_outcome(outcome, time.perf_counter() - started)
+
+        return None
+
+    @staticmethod
+    async def _fetch_in_executor(connector, ip_address):
+        """Coroutine runs blocking connector in default executor of event loop."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, connector.get_location, ip_address)
+
+    async def calculate(self, average=True, clustering=False, median=False, centroid=False, geometric_median=False, *, locations=None):
+        """
+        Coroutine calculates more acurate location of given locations (defaultly from last
+        fetch_locations() call). Methods are selected like in Locator.calculate(), locations
+        are given by keyword. Calculations are CPU bound, so they run in executor.
+        Map file is generated only for locations of the last lookup.
+        """
+        loop = asyncio.get_event_loop()
+
+        if locations is None:
+            return await loop.run_in_executor(None, functools.partial(Locator.calculate, self, average, clustering, median, centroid, geometric_median))
+
+        if len(locations) < 2:
+            logger.error("Not enough locations to start calculation!")
+            return None
+
+        return await loop.run_in_executor(None, self.calculate_locations, locations, average, clustering, median, centroid, geometric_median)
+
+    async def aclose(self):
+        """Coroutine closes HTTP session and worker threads."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self.close()
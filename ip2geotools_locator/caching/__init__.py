@@ -0,0 +1,4 @@
+"""Modules for caching responses of Geolocation databases"""
+from ip2geotools_locator.caching.memory import LRUCache
+from ip2geotools_locator.caching.persistent import PersistentCache
+from ip2geotools_locator.caching.prefix import PrefixCache
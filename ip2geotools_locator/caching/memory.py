@@ -0,0 +1,109 @@
+"""Module for in-process LRU caching of database responses and calculations"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from ip2geotools_locator.utils import LOGGER as logger
+
+
+def estimate_size(value):
+    """
+    Function estimates memory used by cached value in bytes.
+    Objects, tuples and dictionaries are walked one level deep, which covers
+    IpLocation objects and dictionaries of calculated Locations.
+    """
+    size = sys.getsizeof(value)
+
+    if isinstance(value, dict):
+        size += sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    elif isinstance(value, tuple):
+        size += sum(sys.getsizeof(item) for item in value)
+    elif hasattr(value, "__dict__"):
+        size += sum(sys.getsizeof(item) for item in vars(value).values())
+
+    return size
+
+
+class LRUCache:
+    """
+    Thread-safe least recently used cache bounded by number of entries and estimated size in bytes.
+    Entries older than ttl seconds are not returned (ttl 0 means no expiration).
+    Hits, misses, evictions and expirations are counted.
+    """
+    def __init__(self, max_entries=10000, max_bytes=16 * 1024 * 1024, ttl=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        # key: (value, size, stored_at)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Method returns cached value or None."""
+        return self.get_first((key,))
+
+    def get_first(self, keys):
+        """Method returns cached value of the first of keys found or None. One hit or miss is counted."""
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+
+                if self.ttl and entry[2] < time.monotonic() - self.ttl:
+                    self._remove(key)
+                    self.expirations += 1
+                    continue
+
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        """Method stores value. Least recently used entries are evicted to fit limits."""
+        size = estimate_size(key) + estimate_size(value)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            # Value bigger than whole cache is not stored
+            if size > self.max_bytes:
+                logger.debug("Value of size %i B exceeds memory cache limit.", size)
+                return
+
+            self._entries[key] = (value, size, time.monotonic())
+            self.size += size
+
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        """Method removes entry. Lock must be held by caller."""
+        self.size -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """Method removes all entries. Counters are kept."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """Method returns dictionary of cache counters."""
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "expirations": self.expirations}
@@ -0,0 +1,124 @@
+"""Module for persistent caching of database responses in SQLite file"""
+import sqlite3
+import threading
+import time
+
+from ip2geotools.models import IpLocation
+
+from ip2geotools_locator.utils import LOGGER as logger
+
+
+class PersistentCache:
+    """
+    Class for storing locations returned by databases in SQLite file.
+
+    Records are keyed by (database, IP address) and expire by TTL given on read, so TTL can
+    be set for each database separately. Database file is opened in WAL mode, so it can be
+    shared by many threads and processes on the same host. File also keeps used daily quotas
+    of databases, so rate limiters of all processes share them.
+    """
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS locations (
+        db_name TEXT NOT NULL,
+        ip_address TEXT NOT NULL,
+        latitude REAL,
+        longitude REAL,
+        country TEXT,
+        region TEXT,
+        city TEXT,
+        stored_at REAL NOT NULL,
+        PRIMARY KEY (db_name, ip_address)
+    ) WITHOUT ROWID
+    """
+    QUOTA_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS quotas (
+        db_name TEXT NOT NULL,
+        day TEXT NOT NULL,
+        used INTEGER NOT NULL,
+        exhausted INTEGER NOT NULL,
+        PRIMARY KEY (db_name, day)
+    ) WITHOUT ROWID
+    """
+
+    def __init__(self, file_path, timeout=30.0):
+        self.file_path = file_path
+        self.timeout = timeout
+        # Every thread has its own SQLite connection
+        self._local = threading.local()
+
+    def _connection(self):
+        """Method returns SQLite connection of current thread. Table is created on first use."""
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            # Autocommit mode, every statement is atomic write of one record
+            connection = sqlite3.connect(self.file_path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(self.SCHEMA)
+            connection.execute(self.QUOTA_SCHEMA)
+            self._local.connection = connection
+            logger.debug("Opening cache file %s.", self.file_path)
+
+        return connection
+
+    def get(self, db_name, ip_address, ttl):
+        """Method returns cached location not older than ttl seconds or None."""
+        try:
+            row = self._connection().execute(
+                "SELECT latitude, longitude, country, region, city FROM locations WHERE db_name = ? AND ip_address = ? AND stored_at >= ?",
+                (db_name, ip_address, time.time() - ttl)).fetchone()
+        except sqlite3.Error as exception:
+            logger.warning("Cache could not be read. sqlite3.Error: %s", str(exception))
+            return None
+
+        if row is None:
+            return None
+
+        latitude, longitude, country, region, city = row
+        return IpLocation(ip_address, city, region, country, latitude, longitude)
+
+    def set(self, db_name, ip_address, location):
+        """Method stores location returned by database."""
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO locations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (db_name, ip_address, location.latitude, location.longitude, location.country, location.region, location.city, time.time()))
+        except sqlite3.Error as exception:
+            logger.warning("Location could not be cached. sqlite3.Error: %s", str(exception))
+
+    def add_quota(self, db_name, day, requests=0, exhausted=False):
+        """
+        Method adds requests to used daily quota of database for day (ISO date) and marks quota
+        as exhausted if requested. Returns (used requests, exhausted) of all processes or None if
+        file cannot be written.
+        """
+        try:
+            connection = self._connection()
+            # Single statement upsert needs SQLite 3.24
+            connection.execute("INSERT OR IGNORE INTO quotas VALUES (?, ?, 0, 0)", (db_name, day))
+            connection.execute("UPDATE quotas SET used = used + ?, exhausted = MAX(exhausted, ?) WHERE db_name = ? AND day = ?",
+                               (requests, int(exhausted), db_name, day))
+            used, exhausted = connection.execute("SELECT used, exhausted FROM quotas WHERE db_name = ? AND day = ?", (db_name, day)).fetchone()
+        except sqlite3.Error as exception:
+            logger.warning("Daily quota could not be stored. sqlite3.Error: %s", str(exception))
+            return None
+
+        return used, bool(exhausted)
+
+    def purge(self, db_name=None):
+        """Method deletes all cached locations or locations of one database. Returns number of deleted records."""
+        if db_name is None:
+            cursor = self._connection().execute("DELETE FROM locations")
+        else:
+            cursor = self._connection().execute("DELETE FROM locations WHERE db_name = ?", (db_name,))
+
+        logger.info("Purged %i records from cache file %s.", cursor.rowcount, self.file_path)
+        return cursor.rowcount
+
+    def close(self):
+        """Method closes SQLite connection of current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
@@ -0,0 +1,74 @@
+"""Module for caching database responses by network prefix"""
+import ipaddress
+import threading
+
+from ip2geotools.models import IpLocation
+
+from ip2geotools_locator.caching.memory import LRUCache
+
+
+class PrefixCache:
+    """
+    Class for caching database responses by network instead of single IP address.
+
+    Geolocation databases answer per network block, so one response is used for all
+    IP addresses in the block. Location with "network" attribute (e.g. from MaxMind
+    database) is stored under its real network, other locations are stored under
+    network of configured prefix length. Lookup probes only configured prefix length
+    and lengths of real networks stored for the database.
+    """
+    def __init__(self, max_entries=100000, max_bytes=64 * 1024 * 1024, ttl=0):
+        self._cache = LRUCache(max_entries, max_bytes, ttl)
+        # Lengths of real networks stored for every (database, IP version)
+        self._network_lengths = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prefix_length(ip_address, prefix_lengths):
+        """Method returns configured prefix length for version of IP address."""
+        return prefix_lengths["ipv4"] if ip_address.version == 4 else prefix_lengths["ipv6"]
+
+    def get(self, db_name, ip_address, prefix_lengths):
+        """
+        Method returns location cached for any network containing IP address or None.
+        prefix_lengths is dictionary {"ipv4": 24, "ipv6": 48} from database settings.
+        """
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+
+        lengths = set(self._network_lengths.get((db_name, address.version), ()))
+        lengths.add(self._prefix_length(address, prefix_lengths))
+
+        # Most specific network first
+        location = self._cache.get_first([(db_name, ipaddress.ip_network((address, length), strict=False)) for length in sorted(lengths, reverse=True)])
+        if location is None:
+            return None
+        return IpLocation(ip_address, location.city, location.region, location.country, location.latitude, location.longitude)
+
+    def set(self, db_name, ip_address, location, prefix_lengths):
+        """Method stores location under its network or network of configured prefix length."""
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return
+
+        network = getattr(location, "network", None)
+        if network is None or address not in network:
+            network = ipaddress.ip_network((address, self._prefix_length(address, prefix_lengths)), strict=False)
+        else:
+            key = (db_name, address.version)
+            if network.prefixlen not in self._network_lengths.get(key, ()):
+                with self._lock:
+                    self._network_lengths[key] = frozenset(self._network_lengths.get(key, ())) | {network.prefixlen}
+
+        self._cache.set((db_name, network), location)
+
+    def clear(self):
+        """Method removes all entries."""
+        self._cache.clear()
+
+    def stats(self):
+        """Method returns dictionary of cache counters."""
+        return self._cache.stats()
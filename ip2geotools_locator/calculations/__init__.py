@@ -1,4 +1,7 @@
 """Module for importing calculation methods"""
 from ip2geotools_locator.calculations.average import Average
+from ip2geotools_locator.calculations.centroid import Centroid
 from ip2geotools_locator.calculations.clustering import Clustering
+from ip2geotools_locator.calculations.geometric_median import GeometricMedian
 from ip2geotools_locator.calculations.median import Median
+from ip2geotools_locator.calculations.batch import BatchCalculation
@@ -0,0 +1,355 @@
+"""
+Module for calculating locations of many IP addresses at once with vectorized numpy operations
+
+numpy takes long to import, so functions import it on first call and importing calculations
+stays fast for command line.
+"""
+from ip2geotools_locator.calculations.clustering import CLUSTER_DISTANCE_KM
+from ip2geotools_locator.calculations.geometric_median import MAX_ITERATIONS, MIN_DISTANCE, STEP, TOLERANCE
+from ip2geotools_locator.utils import EARTH_RADIUS_KM
+from ip2geotools_locator.utils import LOGGER as logger
+from ip2geotools_locator.utils import Location
+
+# Rows of clustering calculated at once, pairwise distances take rows x databases^2 floats
+CLUSTERING_CHUNK_SIZE = 65536
+# Rows of geometric median calculated at once, every iteration goes through rows x databases floats
+GEOMETRIC_MEDIAN_CHUNK_SIZE = 4096
+
+
+def location_arrays(locations_list, names=None):
+    """
+    Function converts list of dictionaries of locations (one dictionary per IP address, as
+    returned by Locator.get_locations()) into masked arrays of latitudes and longitudes with
+    row for every IP address and column for every database. Databases missing in dictionary
+    or with None coordinates are masked. Returns (names, latitudes, longitudes).
+    """
+    import numpy
+
+    if names is None:
+        names = []
+        for locations in locations_list:
+            names.extend(name for name in locations if name not in names)
+    columns = {name: column for column, name in enumerate(names)}
+
+    latitudes = numpy.full((len(locations_list), len(names)), numpy.nan)
+    longitudes = numpy.full((len(locations_list), len(names)), numpy.nan)
+    for row, locations in enumerate(locations_list):
+        for name, location in locations.items():
+            if name in columns and location is not None and location.latitude is not None and location.longitude is not None:
+                latitudes[row, columns[name]] = location.latitude
+                longitudes[row, columns[name]] = location.longitude
+
+    return names, numpy.ma.masked_invalid(latitudes), numpy.ma.masked_invalid(longitudes)
+
+
+def _unmasked(values):
+    """Function returns float array of values and boolean array of values which are neither masked nor NaN."""
+    import numpy
+
+    data = numpy.asarray(numpy.ma.getdata(values), dtype=float)
+    valid = ~numpy.isnan(data)
+    mask = numpy.ma.getmask(values)
+    if mask is not numpy.ma.nomask:
+        valid &= ~mask
+    return data, valid
+
+
+def average(latitudes, longitudes, valid):
+    """Function returns arrays of averages of valid coordinates in every row (NaN for empty rows)."""
+    import numpy
+
+    counts = numpy.count_nonzero(valid, axis=1)
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        return (numpy.where(valid, latitudes, 0.0).sum(axis=1) / counts,
+                numpy.where(valid, longitudes, 0.0).sum(axis=1) / counts)
+
+
+def median(latitudes, longitudes, valid):
+    """
+    Function returns arrays of per-axis medians of valid coordinates in every row (NaN for
+    empty rows). Median of even number of values is average of two middle values.
+    """
+    import numpy
+
+    counts = numpy.count_nonzero(valid, axis=1)
+    low = numpy.maximum(counts - 1, 0) // 2
+    high = counts // 2
+
+    medians = []
+    for values in (latitudes, longitudes):
+        # Masked values are sorted to the end of every row
+        ordered = numpy.sort(numpy.where(valid, values, numpy.inf), axis=1)
+        middle = (numpy.take_along_axis(ordered, low[:, None], axis=1)[:, 0] + numpy.take_along_axis(ordered, high[:, None], axis=1)[:, 0]) / 2
+        medians.append(numpy.where(counts > 0, middle, numpy.nan))
+    return tuple(medians)
+
+
+def centroid(latitudes, longitudes, valid):
+    """
+    Function returns arrays of spherical centroids of valid locations in every row. Locations
+    are converted to 3D unit vectors, which are summed and projected back, so rows with
+    locations on both sides of antimeridian are correct. Empty rows and rows whose vectors
+    cancel out (antipodal locations) are NaN.
+    """
+    import numpy
+
+    phi = numpy.radians(numpy.where(valid, latitudes, 0.0))
+    lam = numpy.radians(numpy.where(valid, longitudes, 0.0))
+    cos_phi = numpy.cos(phi)
+
+    # Missing locations are at zero latitude and longitude, so only x has to be corrected
+    missing = valid.shape[1] - numpy.count_nonzero(valid, axis=1)
+    x = (cos_phi * numpy.cos(lam)).sum(axis=1) - missing
+    y = (cos_phi * numpy.sin(lam)).sum(axis=1)
+    z = numpy.sin(phi).sum(axis=1)
+
+    horizontal = numpy.hypot(x, y)
+    undefined = numpy.hypot(horizontal, z) < 1e-9 * numpy.count_nonzero(valid, axis=1)
+    return (numpy.where(undefined, numpy.nan, numpy.degrees(numpy.arctan2(z, horizontal))),
+            numpy.where(undefined, numpy.nan, numpy.degrees(numpy.arctan2(y, x))))
+
+
+def _unit_vectors(latitudes, longitudes, valid):
+    """Function returns (rows x columns x 3) array of unit vectors of locations, zero vectors for missing ones."""
+    import numpy
+
+    phi = numpy.radians(numpy.where(valid, latitudes, 0.0))
+    lam = numpy.radians(numpy.where(valid, longitudes, 0.0))
+    cos_phi = numpy.where(valid, numpy.cos(phi), 0.0)
+    return numpy.stack((cos_phi * numpy.cos(lam), cos_phi * numpy.sin(lam), numpy.where(valid, numpy.sin(phi), 0.0)), axis=-1)
+
+
+def clustering(latitudes, longitudes, valid, max_distance_km=CLUSTER_DISTANCE_KM, chunk_size=CLUSTERING_CHUNK_SIZE):
+    """
+    Function returns arrays of spherical centroids of the densest clusters of locations in
+    every row (see clustering.densest_cluster()). Rows with less than 3 locations are NaN.
+    Pairwise dot products of unit vectors are calculated for chunks of rows at once.
+    """
+    import numpy
+
+    result_latitudes = numpy.full(len(latitudes), numpy.nan)
+    result_longitudes = numpy.full(len(latitudes), numpy.nan)
+    min_dot = numpy.cos(min(max_distance_km / EARTH_RADIUS_KM, numpy.pi))
+    columns = valid.shape[1]
+
+    for start in range(0, len(latitudes), chunk_size):
+        rows = slice(start, start + chunk_size)
+        chunk_valid = valid[rows]
+        vectors = _unit_vectors(latitudes[rows], longitudes[rows], chunk_valid)
+
+        # dots[row, i, j] is cosine of angle between locations i and j
+        dots = numpy.matmul(vectors, vectors.transpose(0, 2, 1))
+        members = (dots >= min_dot) & chunk_valid[:, None, :]
+
+        # The most members first, then the highest sum of cosines (closest to all locations)
+        dot_sums = numpy.matmul(vectors, vectors.sum(axis=1)[:, :, None])[:, :, 0]
+        keys = numpy.count_nonzero(members, axis=2) * (2.0 * columns + 1) + dot_sums + columns
+        keys[~chunk_valid] = -numpy.inf
+        best = numpy.argmax(keys, axis=1)
+
+        best_members = members[numpy.arange(len(best)), best].astype(float)
+        x, y, z = numpy.matmul(best_members[:, None, :], vectors)[:, 0, :].T
+        enough = numpy.count_nonzero(chunk_valid, axis=1) >= 3
+
+        result_latitudes[rows] = numpy.where(enough, numpy.degrees(numpy.arctan2(z, numpy.hypot(x, y))), numpy.nan)
+        result_longitudes[rows] = numpy.where(enough, numpy.degrees(numpy.arctan2(y, x)), numpy.nan)
+
+    return result_latitudes, result_longitudes
+
+
+def geometric_median(latitudes, longitudes, valid, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+    """
+    Function returns arrays of spherical geometric medians of valid locations in every row
+    (see geometric_median.GeometricMedian). Empty rows and rows whose vectors cancel out are
+    NaN. Rows are calculated in chunks, whose arrays stay in processor cache during iterations.
+    """
+    import numpy
+
+    result_latitudes = numpy.full(len(latitudes), numpy.nan)
+    result_longitudes = numpy.full(len(latitudes), numpy.nan)
+    for start in range(0, len(latitudes), GEOMETRIC_MEDIAN_CHUNK_SIZE):
+        rows = slice(start, start + GEOMETRIC_MEDIAN_CHUNK_SIZE)
+        result_latitudes[rows], result_longitudes[rows] = _weiszfeld(latitudes[rows], longitudes[rows], valid[rows], max_iterations, tolerance)
+
+    return result_latitudes, result_longitudes
+
+
+def _weiszfeld(latitudes, longitudes, valid, max_iterations, tolerance):
+    """
+    Function returns arrays of geometric medians of one chunk of rows. All rows start from
+    centroid of the half of their locations closest to their centroid and make over-relaxed
+    Weiszfeld iterations together. Row whose estimate moved less than tolerance is converged:
+    its estimate is not updated anymore and it is dropped from arrays of following iterations.
+    """
+    import numpy
+
+    # Components of unit vectors, zero for missing locations, so they have no weight
+    phi = numpy.radians(numpy.where(valid, latitudes, 0.0))
+    lam = numpy.radians(numpy.where(valid, longitudes, 0.0))
+    z = numpy.sin(phi)
+    phi = numpy.where(valid, numpy.cos(phi), 0.0)
+    x = phi * numpy.cos(lam)
+    y = phi * numpy.sin(lam)
+    limits = 1e-9 * numpy.count_nonzero(valid, axis=1)
+
+    # Rows whose centroid cannot be calculated have no median
+    centroids = _normalized(numpy.einsum("ij->i", x), numpy.einsum("ij->i", y), numpy.einsum("ij->i", z), limits)
+    undefined = centroids[3]
+    estimate_x, estimate_y, estimate_z = _start((x, y, z), centroids[:3], valid, limits)
+
+    # Rows which have not converged yet, arrays of locations are compacted when enough rows converged
+    rows = numpy.flatnonzero(~undefined)
+    x, y, z, limits = x[rows], y[rows], z[rows], limits[rows]
+    active = numpy.ones(len(rows), dtype=bool)
+    for _ in range(max_iterations):
+        if numpy.count_nonzero(active) <= 0.75 * len(rows):
+            rows, x, y, z, limits = rows[active], x[active], y[active], z[active], limits[active]
+            active = active[active]
+        if len(rows) == 0:
+            break
+        previous_x, previous_y, previous_z = estimate_x[rows], estimate_y[rows], estimate_z[rows]
+
+        # Weights are inverse great-circle distances of locations from estimate
+        weights = x * previous_x[:, None]
+        weights += y * previous_y[:, None]
+        weights += z * previous_z[:, None]
+        numpy.clip(weights, -1.0, 1.0, out=weights)
+        numpy.arccos(weights, out=weights)
+        numpy.maximum(weights, MIN_DISTANCE, out=weights)
+        numpy.reciprocal(weights, out=weights)
+
+        new_x, new_y, new_z, cancelled = _normalized(numpy.einsum("ij,ij->i", weights, x), numpy.einsum("ij,ij->i", weights, y),
+                                                     numpy.einsum("ij,ij->i", weights, z), limits)
+        new_x, new_y, new_z, overshot = _normalized(previous_x + STEP * (new_x - previous_x), previous_y + STEP * (new_y - previous_y),
+                                                    previous_z + STEP * (new_z - previous_z), limits)
+        cancelled |= overshot
+        moved = numpy.sqrt((new_x - previous_x) ** 2 + (new_y - previous_y) ** 2 + (new_z - previous_z) ** 2)
+
+        # Rows converged in previous iterations keep their estimates
+        updated = rows[active]
+        estimate_x[updated] = new_x[active]
+        estimate_y[updated] = new_y[active]
+        estimate_z[updated] = new_z[active]
+        undefined[updated[cancelled[active]]] = True
+        active &= ~(cancelled | (moved < tolerance))
+
+    return (numpy.where(undefined, numpy.nan, numpy.degrees(numpy.arctan2(estimate_z, numpy.hypot(estimate_x, estimate_y)))),
+            numpy.where(undefined, numpy.nan, numpy.degrees(numpy.arctan2(estimate_y, estimate_x))))
+
+
+def _start(vectors, centroids, valid, limits):
+    """
+    Function returns components of starting estimates of geometric medians, unit vectors of
+    centroids of the half of locations (rounded up) closest to centroid of every row. Rows
+    whose half cancels out start from centroid.
+    """
+    import numpy
+
+    x, y, z = vectors
+    centroid_x, centroid_y, centroid_z = centroids
+
+    # Cosines of angles between locations and centroid, missing locations are the farthest
+    dots = x * centroid_x[:, None]
+    dots += y * centroid_y[:, None]
+    dots += z * centroid_z[:, None]
+    dots[~valid] = -2.0
+    half = numpy.maximum((numpy.count_nonzero(valid, axis=1) + 1) // 2 - 1, 0)
+    near = dots >= numpy.take_along_axis(-numpy.sort(-dots, axis=1), half[:, None], axis=1)
+
+    start_x, start_y, start_z, undefined = _normalized(numpy.einsum("ij,ij->i", near, x), numpy.einsum("ij,ij->i", near, y),
+                                                       numpy.einsum("ij,ij->i", near, z), limits)
+    return numpy.where(undefined, centroid_x, start_x), numpy.where(undefined, centroid_y, start_y), numpy.where(undefined, centroid_z, start_z)
+
+
+def _normalized(x, y, z, limits):
+    """Function returns components of unit vectors and mask of vectors shorter than limits, which are left unchanged."""
+    import numpy
+
+    norms = numpy.sqrt(x * x + y * y + z * z)
+    undefined = norms < limits
+    norms[undefined] = 1.0
+    return x / norms, y / norms, z / norms, undefined
+
+
+# Vectorized calculation methods by name used in calculated locations
+METHODS = {"Average": average, "Median": median, "Clustering": clustering, "Centroid": centroid, "GeometricMedian": geometric_median}
+
+
+class BatchCalculation:
+    """
+    Class for calculating locations of many IP addresses at once.
+
+    Locations are given as two (IP addresses x databases) masked arrays (or arrays with NaN
+    for missing locations), which are prepared once and shared by all calculation methods.
+    Every method works on whole arrays, so consensus of millions of IP addresses is
+    calculated in few numpy operations.
+    """
+    def __init__(self, latitudes, longitudes, names=None):
+        import numpy
+
+        latitudes, valid_latitudes = _unmasked(latitudes)
+        longitudes, valid_longitudes = _unmasked(longitudes)
+        if latitudes.ndim != 2 or latitudes.shape != longitudes.shape:
+            raise ValueError("Latitudes and longitudes must be arrays of the same (IP addresses x databases) shape.")
+
+        self.names = names
+        # Locations with both coordinates, other values are never used
+        self.valid = valid_latitudes & valid_longitudes
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.counts = numpy.count_nonzero(self.valid, axis=1)
+
+    def __len__(self):
+        return len(self.latitudes)
+
+    @classmethod
+    def from_locations(cls, locations_list, names=None):
+        """Method creates batch from list of dictionaries of locations (see location_arrays())."""
+        names, latitudes, longitudes = location_arrays(locations_list, names)
+        return cls(latitudes, longitudes, names)
+
+    def calculate(self, method="Average", min_locations=1):
+        """
+        Method calculates location of every IP address by given method. Returns arrays of
+        latitudes and longitudes rounded to 4 decimal places. Rows with less than
+        min_locations locations or without result of calculation are NaN.
+        """
+        import numpy
+
+        if method not in METHODS:
+            raise ValueError("Unknown calculation method %s." % method)
+
+        logger.info("Batch calculation of %s locations of %i IP addresses started.", method, len(self))
+        enough = self.counts >= max(min_locations, 1)
+        result_latitudes = numpy.full(len(self), numpy.nan)
+        result_longitudes = numpy.full(len(self), numpy.nan)
+
+        if enough.all():
+            latitudes, longitudes = METHODS[method](self.latitudes, self.longitudes, self.valid)
+        else:
+            latitudes, longitudes = METHODS[method](self.latitudes[enough], self.longitudes[enough], self.valid[enough])
+        result_latitudes[enough] = numpy.round(latitudes, 4)
+        result_longitudes[enough] = numpy.round(longitudes, 4)
+
+        return result_latitudes, result_longitudes
+
+    def calculate_locations(self, use_average=True, use_clustering=False, use_median=False, use_centroid=False, use_geometric_median=False,
+                            min_locations=2):
+        """
+        Method runs calculation methods selected by use_* flags and returns list with dictionary
+        of calculated locations for every IP address, in the same form as
+        Locator.calculate_locations(). IP addresses with less than min_locations locations get
+        empty dictionary.
+        """
+        import numpy
+
+        selected = [name for name, active in (("Average", use_average), ("Clustering", use_clustering), ("Median", use_median), ("Centroid", use_centroid),
+                                              ("GeometricMedian", use_geometric_median))
+                    if active]
+        results = {name: self.calculate(name, min_locations) for name in selected}
+
+        calculated = [{} for _ in range(len(self))]
+        for name, (latitudes, longitudes) in results.items():
+            for row in numpy.flatnonzero(~numpy.isnan(latitudes)):
+                calculated[row][name] = Location(float(latitudes[row]), float(longitudes[row]))
+        return calculated
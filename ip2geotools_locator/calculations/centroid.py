@@ -0,0 +1,49 @@
+"""Module for calculating estimate of location as centroid of locations on sphere"""
+import math
+
+from ip2geotools_locator.utils import Location, LOGGER as logger
+
+class Centroid():
+    """
+    Class for calculating spherical Centroid from list of Locations
+    """
+    @staticmethod
+    def calculate(locations=None):
+        """
+        Static method calculates Centroid of given location list on sphere. Locations are
+        converted to 3D unit vectors, which are averaged and projected back to latitude and
+        longitude, so locations on both sides of antimeridian (179.9 and -179.9 longitude)
+        give centroid near antimeridian instead of zero longitude.
+        Locations list must be in form of namedtuple and is also returned like that:
+
+        Location = namedtuple('Location', 'latitude longitude')
+        """
+        logger.info("Calculation of Centroid location started.")
+
+        x = y = z = 0.0
+        # Tracking of calculable locations
+        items = 0
+
+        for loc in locations:
+            # Sum of unit vectors (None locations are skipped)
+            try:
+                latitude = math.radians(locations[loc].latitude)
+                longitude = math.radians(locations[loc].longitude)
+            except (AttributeError, TypeError) as exception:
+                logger.warning("Value excluded from calc. %s: %s", exception.__class__.__name__, str(exception))
+                continue
+
+            x += math.cos(latitude) * math.cos(longitude)
+            y += math.cos(latitude) * math.sin(longitude)
+            z += math.sin(latitude)
+            items += 1
+
+        # Locations on opposite sides of the Earth have no centroid
+        if items == 0 or math.sqrt(x * x + y * y + z * z) < 1e-9 * items:
+            logger.critical("Centroid cannot be calculated from %i DB responses.", items)
+            return None
+
+        latitude = math.degrees(math.atan2(z, math.hypot(x, y)))
+        longitude = math.degrees(math.atan2(y, x))
+        logger.info("Calculated Centroid location form %i DB responses is: %.3f N, %.3f E", items, latitude, longitude)
+        return Location(round(latitude, 4), round(longitude, 4))
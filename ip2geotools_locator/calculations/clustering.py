@@ -1,25 +1,109 @@
-"""Module for estimating geographical location by K-Means cluster center calculation"""
-import numpy
-from kneed import KneeLocator
-from sklearn.cluster import KMeans
+"""Module for estimating geographical location by centroid of the densest cluster of locations"""
+import math
 
+from ip2geotools_locator.utils import EARTH_RADIUS_KM
 from ip2geotools_locator.utils import LOGGER as logger
 from ip2geotools_locator.utils import Location
 
+# Locations closer than this great-circle distance belong to one cluster
+CLUSTER_DISTANCE_KM = 50.0
+# Clustering engines: "threshold" groups locations by distance, "kmeans" runs K-Means elbow search
+ENGINES = ("threshold", "kmeans")
+
+
+def unit_vector(location):
+    """Function returns 3D unit vector of location on sphere."""
+    latitude, longitude = math.radians(location.latitude), math.radians(location.longitude)
+    return (math.cos(latitude) * math.cos(longitude), math.cos(latitude) * math.sin(longitude), math.sin(latitude))
+
+
+def vector_location(x, y, z):
+    """Function returns Location of direction of 3D vector."""
+    return Location(math.degrees(math.atan2(z, math.hypot(x, y))), math.degrees(math.atan2(y, x)))
+
+
+def densest_cluster(locations, max_distance_km=CLUSTER_DISTANCE_KM):
+    """
+    Function returns names of locations in the densest cluster and its spherical centroid.
+
+    Cluster of every location holds locations within max_distance_km great-circle distance
+    of it. Cluster with the most locations wins, ties are decided by the closest location to
+    all others. Distances are compared as dot products of unit vectors, so every pair costs
+    only few multiplications. Returns (names, Location) or (None, None) for no location.
+    """
+    vectors = [(name, unit_vector(location)) for name, location in locations.items()]
+    if not vectors:
+        return None, None
+
+    # Great-circle distance below threshold means dot product above its cosine
+    min_dot = math.cos(min(max_distance_km / EARTH_RADIUS_KM, math.pi))
+    best_key = None
+    best_members = None
+
+    for _, (x, y, z) in vectors:
+        members = []
+        dot_sum = 0.0
+        for other, (other_x, other_y, other_z) in vectors:
+            dot = x * other_x + y * other_y + z * other_z
+            dot_sum += dot
+            if dot >= min_dot:
+                members.append(other)
+
+        key = (len(members), dot_sum)
+        if best_key is None or key > best_key:
+            best_key = key
+            best_members = members
+
+    coordinates = dict(vectors)
+    x = sum(coordinates[name][0] for name in best_members)
+    y = sum(coordinates[name][1] for name in best_members)
+    z = sum(coordinates[name][2] for name in best_members)
+    return best_members, vector_location(x, y, z)
+
 
 class Clustering():
     """
     Class for calculating Cluster centroid from list of Locations
     """
     @staticmethod
-    def calculate(locations=None):
+    def calculate(locations=None, engine="threshold", max_distance_km=CLUSTER_DISTANCE_KM):
         """
         Static method calculates Data cluster centers of given location list.
+        Default "threshold" engine returns spherical centroid of the densest cluster of
+        locations closer than max_distance_km (see densest_cluster()). "kmeans" engine fits
+        K-Means model for every K and selects K by elbow method, which is much slower.
         Locations list must be in form of namedtuple and is also returned like that:
 
         Location = namedtuple('Location', 'latitude longitude')
         """
         logger.info("Calculation of location data cluster centroid started.")
+        if engine not in ENGINES:
+            raise ValueError("Unknown clustering engine %s." % engine)
+
+        if engine == "threshold":
+            locations = {name: location for name, location in locations.items()
+                         if getattr(location, "latitude", None) is not None and getattr(location, "longitude", None) is not None}
+            if len(locations) < 3:
+                logger.warning("Not enough location data for using this method. At least 3 entries are needed.")
+                return None
+
+            members, centroid = densest_cluster(locations, max_distance_km)
+            logger.info("Calculated cluster centroid of %s from %i DB responses is: %.3f N, %.3f E", ", ".join(map(str, members)),
+                        len(locations), centroid.latitude, centroid.longitude)
+            return Location(round(centroid.latitude, 4), round(centroid.longitude, 4))
+
+        return Clustering._kmeans(locations)
+
+    @staticmethod
+    def _kmeans(locations):
+        """
+        Static method calculates centroid of the biggest K-Means cluster with K selected by elbow method.
+        numpy, scikit-learn and kneed take most of start-up time, so they are imported on first call.
+        """
+        import numpy
+        from kneed import KneeLocator
+        from sklearn.cluster import KMeans
+
         # List of latitudes and longitudes
         latitudes = []
         longitudes = []
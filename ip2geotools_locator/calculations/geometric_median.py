@@ -0,0 +1,95 @@
+"""Module for calculating estimate of location as geometric median of locations on sphere"""
+import math
+
+from ip2geotools_locator.calculations.clustering import unit_vector, vector_location
+from ip2geotools_locator.utils import Location, LOGGER as logger
+
+# Iteration cap of Weiszfeld algorithm, estimate is usually within tens of meters of median after it
+MAX_ITERATIONS = 20
+# Iterations stop when estimate moves less than this angle in radians, the 4th decimal place of
+# degree to which results are rounded (about 11 m on Earth)
+TOLERANCE = math.radians(1e-4)
+# Over-relaxation of Weiszfeld steps, which takes about half of iterations of plain steps (1.0)
+STEP = 1.3
+# Distances are kept above this angle, so estimate on one of locations does not divide by zero
+MIN_DISTANCE = 1e-12
+
+
+class GeometricMedian():
+    """
+    Class for calculating Geometric median from list of Locations
+    """
+    @staticmethod
+    def calculate(locations=None, max_iterations=MAX_ITERATIONS, tolerance=TOLERANCE):
+        """
+        Static method calculates Geometric median of given location list on sphere, location
+        with the lowest sum of great-circle distances to all locations. It is estimated by
+        Weiszfeld algorithm: starting from centroid of the half of locations closest to their
+        centroid, every iteration averages unit vectors of locations weighted by inverse
+        distance to current estimate, so outliers pull the estimate much less than in Average
+        or Centroid. Steps are over-relaxed by STEP and iterations stop when estimate moves
+        less than tolerance (in radians).
+        Locations list must be in form of namedtuple and is also returned like that:
+
+        Location = namedtuple('Location', 'latitude longitude')
+        """
+        logger.info("Calculation of Geometric median location started.")
+
+        vectors = []
+        for loc in locations:
+            # None locations are skipped
+            try:
+                vectors.append(unit_vector(locations[loc]))
+            except (AttributeError, TypeError) as exception:
+                logger.warning("Value excluded from calc. %s: %s", exception.__class__.__name__, str(exception))
+
+        # Median cannot be calculated if spherical centroid is not defined
+        estimate = _normalized([sum(vector[axis] for vector in vectors) for axis in range(3)], len(vectors))
+        if estimate is None:
+            logger.critical("Geometric median cannot be calculated from %i DB responses.", len(vectors))
+            return None
+        estimate = _start(vectors, estimate) or estimate
+
+        iteration = 0
+        for iteration in range(1, max_iterations + 1):
+            total = [0.0, 0.0, 0.0]
+            for vector in vectors:
+                dot = estimate[0] * vector[0] + estimate[1] * vector[1] + estimate[2] * vector[2]
+                weight = 1.0 / max(math.acos(min(max(dot, -1.0), 1.0)), MIN_DISTANCE)
+                for axis in range(3):
+                    total[axis] += weight * vector[axis]
+
+            total = _normalized(total, len(vectors))
+            if total is not None:
+                total = _normalized([estimate[axis] + STEP * (total[axis] - estimate[axis]) for axis in range(3)], len(vectors))
+            previous, estimate = estimate, total
+            if estimate is None:
+                logger.critical("Geometric median cannot be calculated from %i DB responses.", len(vectors))
+                return None
+            if math.sqrt(sum((previous[axis] - estimate[axis]) ** 2 for axis in range(3))) < tolerance:
+                break
+
+        location = vector_location(*estimate)
+        logger.info("Calculated Geometric median location form %i DB responses in %i iterations is: %.3f N, %.3f E", len(vectors), iteration,
+                    location.latitude, location.longitude)
+        return Location(round(location.latitude, 4), round(location.longitude, 4))
+
+
+def _normalized(vector, items):
+    """Function returns unit vector of given vector or None if vectors of items locations cancel out."""
+    norm = math.sqrt(vector[0] * vector[0] + vector[1] * vector[1] + vector[2] * vector[2])
+    if items == 0 or norm < 1e-9 * items:
+        return None
+    return (vector[0] / norm, vector[1] / norm, vector[2] / norm)
+
+
+def _start(vectors, centroid):
+    """
+    Function returns starting estimate of Weiszfeld algorithm, unit vector of centroid of the half
+    of locations (rounded up) closest to centroid, or None if it cannot be calculated. Start without
+    the farthest locations saves iterations when outliers or far group of locations pull centroid away.
+    """
+    dots = [centroid[0] * vector[0] + centroid[1] * vector[1] + centroid[2] * vector[2] for vector in vectors]
+    threshold = sorted(dots, reverse=True)[(len(dots) + 1) // 2 - 1]
+    near = [vector for vector, dot in zip(vectors, dots) if dot >= threshold]
+    return _normalized([sum(vector[axis] for vector in near) for axis in range(3)], len(vectors))
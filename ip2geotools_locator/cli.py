@@ -1,11 +1,152 @@
 # -*- coding: utf-8 -*-
 
 """Console script for ip2geotools_locator."""
+import csv
+import json
 import logging
+import os
+import sys
+
 import click
 
 from ip2geotools_locator import Locator
-from ip2geotools_locator.utils import LOGGER as logger
+from ip2geotools_locator.profiling import Profiler
+from ip2geotools_locator.utils import DB_TYPES, LOGGER as logger
+
+# Columns of CSV output in bulk mode
+CSV_COLUMNS = ("ip_address", "source", "latitude", "longitude", "country", "region", "city")
+# Number of concurrently queried databases in bulk mode if settings.json keeps serial lookups and -j is not given
+BULK_JOBS = 8
+
+
+def validate_ip_address(ip_address):
+    """Function validates IPv4 address. Returns error message or None for valid address."""
+    # Split ip address into octets
+    octets = ip_address.split(".")
+    # Ceck number of octets
+    if len(octets) != 4:
+        return "Provided IP address does not have four octets."
+    # Validate ip address
+    for index, octet in enumerate(octets):
+        if not octet.isdigit() or int(octet) not in range(0, 256):
+            return "%i octet value must be between 0 and 255" % index
+    return None
+
+
+def read_ip_addresses(input_file):
+    """Generator yields valid IP addresses from lines of input file. Invalid lines are reported and skipped."""
+    for line_number, line in enumerate(input_file, start=1):
+        ip_address = line.strip()
+        if not ip_address:
+            continue
+
+        error = validate_ip_address(ip_address)
+        if error is not None:
+            click.echo("Line %i: IP address %s is not valid! %s" % (line_number, ip_address, error), err=True)
+            continue
+
+        yield ip_address
+
+
+def stream_locations(locator, input_file, output_format, average, clustering, median, centroid, geometric_median):
+    """Function locates IP addresses from input file and streams results to stdout as NDJSON or CSV."""
+    stdout = sys.stdout
+    writer = None
+
+    if output_format == "csv":
+        writer = csv.writer(stdout, lineterminator="\n")
+        writer.writerow(CSV_COLUMNS)
+
+    for record in locator.locate_many(read_ip_addresses(input_file), average=average, clustering=clustering, median=median,
+                                      centroid=centroid, geometric_median=geometric_median):
+        calculated_locations = record.calculated_locations or {}
+
+        if writer is not None:
+            # One row for each database and calculation method
+            for name, location in record.locations.items():
+                writer.writerow((record.ip_address, name, location.latitude, location.longitude, location.country, location.region, location.city))
+            for name, location in calculated_locations.items():
+                writer.writerow((record.ip_address, name, location.latitude, location.longitude, None, None, None))
+        else:
+            stdout.write(json.dumps({
+                "ip_address": record.ip_address,
+                "locations": {name: {"latitude": location.latitude, "longitude": location.longitude, "country": location.country,
+                                     "region": location.region, "city": location.city} for name, location in record.locations.items()},
+                "calculated_locations": {name: location._asdict() for name, location in calculated_locations.items()},
+                "quorum": record.quorum,
+            }) + "\n")
+
+        # Results are written as soon as they are ready, also into pipes
+        stdout.flush()
+
+
+def report_circuit_breakers(locator):
+    """Function reports databases whose circuit breakers have been opened on stderr."""
+    for db_name, breaker in sorted(locator.get_circuit_breakers().items()):
+        if breaker["times_opened"] > 0:
+            click.echo("Circuit breaker of %s database is %s (opened %i times, %i requests skipped)." % (db_name, breaker["state"], breaker["times_opened"],
+                                                                                                      breaker["rejected"]), err=True)
+
+
+def save_metrics(locator, metrics_file):
+    """Function saves metrics of database requests and caches in Prometheus text format, - means stderr."""
+    if metrics_file is None:
+        return
+    if metrics_file == "-":
+        click.echo(locator.export_metrics(), err=True, nl=False)
+    else:
+        locator.export_metrics(metrics_file)
+
+
+def start_profiler(profile_file):
+    """
+    Function starts profiler of the whole run. Table of phases is printed on stderr and
+    cProfile statistics are saved into profile_file (if given) when command finishes.
+    """
+    profiler = Profiler(cprofile=profile_file is not None)
+    profiler.start()
+    profiler.record_imports()
+
+    def report():
+        profiler.stop()
+        click.echo("\n" + profiler.report(), err=True)
+        if profile_file is not None:
+            profiler.dump_stats(profile_file)
+            click.echo("Profile statistics saved into %s file." % profile_file, err=True)
+
+    # Report is printed also when command exits early
+    click.get_current_context().call_on_close(report)
+    return profiler
+
+
+def compile_indices(locator, output_dir):
+    """
+    Function compiles DB files of active local databases into range indices <db_name>.npz in output directory.
+    Returns number of compiled databases.
+    """
+    # Range indices load numpy and readers of DB files
+    from ip2geotools_locator import range_index
+
+    compiled = 0
+    os.makedirs(output_dir, exist_ok=True)
+
+    for db_type in DB_TYPES:
+        for db_name, db_settings in locator.get_settings()[db_type].items():
+            if not db_settings["active"] or db_name not in range_index.COMPILERS:
+                continue
+
+            file_path = os.path.join(output_dir, db_name + ".npz")
+            try:
+                index = range_index.compile_database(db_name, db_settings["db_file"])
+            except (OSError, TypeError, ValueError) as exception:
+                click.echo("DB file of %s database could not be compiled: %s" % (db_name, exception), err=True)
+                continue
+
+            index.save(file_path)
+            click.echo("Range index of %s database with %i ranges saved into %s." % (db_name, len(index), file_path), err=True)
+            compiled += 1
+
+    return compiled
 
 # Arguments and options of Click CLI
 @click.command()
@@ -15,8 +156,13 @@ from ip2geotools_locator.utils import LOGGER as logger
 @click.option('-f', '--filename', 'filename', type=click.STRING, default="locations", help="Filaname of Folium map. Default: locations.html.")
 
 @click.option('-a', '--average', 'average', is_flag=True, help="Calculate average location. At least 2 valid DB responses are needed.")
-@click.option('-c', '--clustering', 'clustering', is_flag=True, help="Calculate median of provided locations. At least 2 valid DB responses are needed.")
-@click.option('-m', '--median', 'median', is_flag=True, help="Calculate location of centroid in data clusters from K-Means model. At least 3 valid DB responses are needed.")
+@click.option('-c', '--clustering', 'clustering', is_flag=True,
+              help="Calculate centroid of the densest cluster of locations within 50 km. At least 3 valid DB responses are needed.")
+@click.option('-m', '--median', 'median', is_flag=True, help="Calculate median of provided locations. At least 2 valid DB responses are needed.")
+@click.option('-s', '--centroid', 'centroid', is_flag=True,
+              help="Calculate spherical centroid of locations, correct also around antimeridian. At least 2 valid DB responses are needed.")
+@click.option('-g', '--geometric-median', 'geometric_median', is_flag=True,
+              help="Calculate geometric median of locations, which is robust against outlying locations. At least 2 valid DB responses are needed.")
 
 @click.option('--logs/--no-logs', default=True, help="Store calculation progress in ip2geotools-locator.log file. Default level is Info.")
 @click.option('-v', '--verbose', count=True, help="Verbose mode.")
@@ -27,9 +173,38 @@ from ip2geotools_locator.utils import LOGGER as logger
 @click.option('--noncommercial', 'noncommercial', is_flag=True, help="Use all noncommercial databases.")
 @click.option('-d', '--database', 'databases', type=click.STRING, multiple=True, help="Specify databases for calculation. You can select all with asterisk sign.")
 @click.option('--save', 'save', is_flag=True, help="Save calculation settings into settings.json file.")
+@click.option('-j', '--jobs', 'jobs', type=click.IntRange(min=1), default=None,
+              help="Number of databases queried concurrently. Default: value from settings.json (%i with --input instead of 1)." % BULK_JOBS)
+
+@click.option('-q', '--quorum', 'quorum', type=click.IntRange(min=1), default=None,
+              help="Return as soon as given number of databases agree on location. Default: value from settings.json.")
+@click.option('--quorum-km', 'quorum_km', type=click.FloatRange(min=0), default=None,
+              help="Maximal distance in km between agreeing databases in quorum mode. Default: value from settings.json.")
+
+@click.option('-i', '--input', 'input_file', type=click.File('r'), default=None,
+              help="Locate IP addresses from file (one per line), use - for stdin. Results are streamed to stdout, map is not generated.")
+@click.option('-o', '--output-format', 'output_format', type=click.Choice(["ndjson", "csv"]), default="ndjson",
+              help="Output format of results read from --input. Default: ndjson.")
+
+@click.option('--cache/--no-cache', 'cache', default=None, help="Use persistent cache of database responses. Default: value from settings.json.")
+@click.option('--purge-cache', 'purge_cache', is_flag=True, help="Delete all records from persistent cache file.")
+@click.option('--profile', 'profile', is_flag=True, help="Print time spent in imports, database lookups, calculations and map generation on stderr.")
+@click.option('--profile-file', 'profile_file', type=click.Path(dir_okay=False), default=None,
+              help="Run with cProfile and save pstats file. Implies --profile.")
+@click.option('--metrics', 'metrics_file', type=click.Path(dir_okay=False, allow_dash=True), default=None,
+              help="Save latency, outcome and cache metrics in Prometheus text format into file after lookups, use - for stderr.")
+
+@click.option('--compile-index', 'index_dir', type=click.Path(file_okay=False), default=None,
+              help="Compile DB files of selected local databases into range indices in given directory and exit.")
+@click.option('--build-consensus', 'consensus', is_flag=True,
+              help="Calculate consensus locations of selected local databases for all IP ranges, save them into consensus index file and exit. Method is selected by -a, -m, -s, -g or -c.")
 
-def cmd(ip_address, generate_map, filename, average, clustering, median, logs, verbose, list_dbs, settings, commercial, noncommercial, databases, save):
+def cmd(ip_address, generate_map, filename, average, clustering, median, centroid, geometric_median, logs, verbose, list_dbs, settings, commercial, noncommercial, databases, save, jobs,
+        quorum, quorum_km, input_file, output_format, cache, purge_cache, profile, profile_file, metrics_file, index_dir, consensus):
     """Calculate estimate of geographical location for IPv4 address"""
+    if profile or profile_file is not None:
+        start_profiler(profile_file)
+
     # Instance of locator class
     locator = Locator(generate_map, filename)
     stream_handler = logging.StreamHandler()
@@ -70,7 +245,7 @@ def cmd(ip_address, generate_map, filename, average, clustering, median, logs, v
     if list_dbs:
         click.echo("\nAvailable databases: ")
         loaded_settings = locator.get_settings()
-        for db_type in loaded_settings:
+        for db_type in DB_TYPES:
             click.echo("\t%s - " % db_type, nl=False)
             for db_name in loaded_settings[db_type]:
                 click.echo("%s, " % db_name, nl=False)
@@ -80,7 +255,7 @@ def cmd(ip_address, generate_map, filename, average, clustering, median, logs, v
     if commercial is True or noncommercial is True or len(databases) != 0:
         loaded_settings = locator.get_settings()
 
-        for db_type in loaded_settings:
+        for db_type in DB_TYPES:
             for db_name in loaded_settings[db_type]:
                 if commercial:
                     try:
@@ -102,37 +277,99 @@ def cmd(ip_address, generate_map, filename, average, clustering, median, logs, v
 
         locator.set_settings(loaded_settings)
 
+    # Number of concurrently queried databases
+    if jobs is not None:
+        loaded_settings = locator.get_settings()
+        loaded_settings["jobs"] = jobs
+        locator.set_settings(loaded_settings)
+
+    # Quorum mode
+    if quorum is not None or quorum_km is not None:
+        loaded_settings = locator.get_settings()
+        if quorum is not None:
+            loaded_settings["quorum"]["active"] = True
+            loaded_settings["quorum"]["min_locations"] = quorum
+        if quorum_km is not None:
+            loaded_settings["quorum"]["max_spread_km"] = quorum_km
+        locator.set_settings(loaded_settings)
+
+    # Bypass or enable persistent cache
+    if cache is not None:
+        loaded_settings = locator.get_settings()
+        loaded_settings["cache"]["active"] = cache
+        locator.set_settings(loaded_settings)
+
+    if purge_cache:
+        click.echo("Purged %i records from cache file %s." % (locator.purge_cache(), locator.get_settings()["cache"]["db_file"]), err=True)
+
     # Show running configuration.
     if settings:
         click.echo("\nSelected databases: ")
         loaded_settings = locator.get_settings()
-        for db_type in loaded_settings:
+        for db_type in DB_TYPES:
             click.echo("\t%s - " % db_type, nl=False)
             for db_name in loaded_settings[db_type]:
                 if loaded_settings[db_type][db_name]["active"]:
                     click.echo("%s, " % db_name, nl=False)
             click.echo(" ")
+        click.echo("\tjobs - %i" % loaded_settings["jobs"])
+        click.echo("\tcache - %s" % (loaded_settings["cache"]["db_file"] if loaded_settings["cache"]["active"] else "off"))
+        quorum_settings = loaded_settings["quorum"]
+        click.echo("\tquorum - %s" % ("%i databases within %g km" % (quorum_settings["min_locations"], quorum_settings["max_spread_km"])
+                                       if quorum_settings["active"] else "off"))
+        breaker_settings = loaded_settings["circuit_breaker"]
+        click.echo("\tcircuit breaker - %s" % ("opens after %i failures for %i s" % (breaker_settings["failure_threshold"], breaker_settings["reset_timeout"])
+                                                if breaker_settings["active"] else "off"))
+
+    # Compile local databases for offline lookups
+    if index_dir is not None:
+        if save:
+            locator.save_settings()
+        exit(0 if compile_indices(locator, index_dir) > 0 else 1)
+
+    if consensus:
+        if save:
+            locator.save_settings()
+        method = ("Median" if median else "Clustering" if clustering else "Centroid" if centroid else "GeometricMedian" if geometric_median
+                  else "Average" if average else None)
+        try:
+            index = locator.build_consensus(method)
+        except (OSError, TypeError, ValueError) as exception:
+            click.echo("Consensus index could not be built: %s" % exception, err=True)
+            exit(1)
+        click.echo("Consensus index with %i ranges saved into %s." % (len(index), locator.get_settings()["consensus"]["index_file"]), err=True)
+        exit(0)
+
+    # Bulk mode, stdout is reserved for results
+    if input_file is not None:
+        if save:
+            locator.save_settings()
+        # Lookups of following IP addresses overlap unless serial mode is requested by -j 1
+        if jobs is None and locator.get_settings()["jobs"] == 1:
+            loaded_settings = locator.get_settings()
+            loaded_settings["jobs"] = BULK_JOBS
+            locator.set_settings(loaded_settings)
+        stream_locations(locator, input_file, output_format, average, clustering, median, centroid, geometric_median)
+        report_circuit_breakers(locator)
+        save_metrics(locator, metrics_file)
+        locator.close()
+        exit(0)
 
     click.echo(" ")
 
     # If no IP address provided show help and exit
     if ip_address is not None:
 
-        # Split ip address into octets
-        octets = ip_address.split(".")
-        # Ceck number of octets
-        if len(octets) != 4:
-            click.echo("IP address is not valid!\nProvided IP address does not have four octets.", err=True)
-            exit(1)
         # Validate ip address
-        for index, octet in enumerate(octets):
-            int_octet = int(octet)
-            if int_octet not in range(0, 256):
-                click.echo("IP address is not valid!\n%i octet value must be between 0 and 255" % index, err=True)
-                exit(1)
+        error = validate_ip_address(ip_address)
+        if error is not None:
+            click.echo("IP address is not valid!\n%s" % error, err=True)
+            exit(1)
 
         # Find location data for provided IP address
         locator.fetch_locations(ip_address)
+        report_circuit_breakers(locator)
+        save_metrics(locator, metrics_file)
         # Get dictionary of found locations
         locations = locator.get_locations()
 
@@ -141,8 +378,11 @@ def cmd(ip_address, generate_map, filename, average, clustering, median, logs, v
             click.echo("\nNo record for IP address %s in selected databases." % ip_address)
             exit(0)
 
+        if locator.quorum is not None:
+            click.echo("\nQuorum reached by databases: %s" % ", ".join(locator.quorum))
+
         # No calculation selected, return location data
-        if (average is False and clustering is False and median is False):
+        if (average is False and clustering is False and median is False and centroid is False and geometric_median is False):
             click.echo("\nApplication retrieved %i DB responses." % len(locations))
             for location in locations:
                 click.echo("Location data from %s database - Latitude: %.3f, Longitude %.3f, Country: %s, Region: %s, City: %s"% (location, locations[location].latitude, locations[location].longitude,
@@ -150,7 +390,8 @@ def cmd(ip_address, generate_map, filename, average, clustering, median, logs, v
                                                                                                                                   locations[location].city))
         # Run calculations and retun location data
         else:
-            calculated_locations = locator.calculate(average=average, clustering=clustering, median=median)
+            calculated_locations = locator.calculate(average=average, clustering=clustering, median=median, centroid=centroid,
+                                                     geometric_median=geometric_median)
             # Reprot for successfull calculation
             if calculated_locations is not None:
                 click.echo("\nCalculated location(s) were estimated from %i DB responses." % len(locations))
@@ -1,14 +1,54 @@
-"""Modules for handling connection to Geolocation databases using ip2geotools package"""
-from ip2geotools_locator.database_connectors.eurek import EurekDB
-from ip2geotools_locator.database_connectors.geobytes_city import GeobytesCityDB
-from ip2geotools_locator.database_connectors.host_ip import HostIpDB
-from ip2geotools_locator.database_connectors.ip2location import Ip2LocationDB
-from ip2geotools_locator.database_connectors.ip2location_web import Ip2locationWebDB
-from ip2geotools_locator.database_connectors.ip_city import IpCityDB
-from ip2geotools_locator.database_connectors.ip_info import IpInfoDB
-from ip2geotools_locator.database_connectors.ip_web import IpWebDB
-from ip2geotools_locator.database_connectors.ipstack import IpstackDB
-from ip2geotools_locator.database_connectors.max_mind import MaxMindDB
-from ip2geotools_locator.database_connectors.max_mind_lite import MaxMindLiteDB
-from ip2geotools_locator.database_connectors.neustar_web import NeustarWebDB
-from ip2geotools_locator.database_connectors.skyhook import SkyhookDB
+"""
+Modules for handling connection to Geolocation databases using ip2geotools package
+
+Connector classes are imported from their modules (database_connectors.max_mind_lite.MaxMindLiteDB)
+or looked up by database name with get_connector_class(). Every connector loads its ip2geotools
+database class, so built-in connectors are imported only when their database is used.
+"""
+import importlib
+import sys
+import types
+
+from ip2geotools_locator.database_connectors.base import (BUILTIN_CONNECTORS,
+                                                          CONNECTORS,
+                                                          DatabaseConnector,
+                                                          create_connector,
+                                                          get_connector_class,
+                                                          register)
+
+# Connector classes available as attributes of package, as in previous versions: module of class
+CONNECTOR_CLASSES = {"EurekDB": "eurek",
+                     "GeobytesCityDB": "geobytes_city",
+                     "HostIpDB": "host_ip",
+                     "Ip2LocationDB": "ip2location",
+                     "Ip2locationWebDB": "ip2location_web",
+                     "IpCityDB": "ip_city",
+                     "IpInfoDB": "ip_info",
+                     "IpWebDB": "ip_web",
+                     "IpstackDB": "ipstack",
+                     "MaxMindDB": "max_mind",
+                     "MaxMindLiteDB": "max_mind_lite",
+                     "NeustarWebDB": "neustar_web",
+                     "SkyhookDB": "skyhook"}
+
+
+class _ConnectorsModule(types.ModuleType):
+    """
+    Class of this package, which imports connector module when its class is accessed as package
+    attribute (from ip2geotools_locator.database_connectors import HostIpDB). Module level
+    __getattr__ needs Python 3.7.
+    """
+    def __getattr__(self, name):
+        if name not in CONNECTOR_CLASSES:
+            raise AttributeError("module %r has no attribute %r" % (self.__name__, name))
+
+        module = importlib.import_module("%s.%s" % (self.__name__, CONNECTOR_CLASSES[name]))
+        connector_class = getattr(module, name)
+        setattr(self, name, connector_class)
+        return connector_class
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(CONNECTOR_CLASSES))
+
+
+sys.modules[__name__].__class__ = _ConnectorsModule
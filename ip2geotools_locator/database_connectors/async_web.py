@@ -0,0 +1,262 @@
+"""
+Module for non-blocking access to web Geolocation databases
+
+Coroutines in this module follow requests and response parsing of ip2geotools package,
+but HTTP requests are made with aiohttp, so thousands of lookups can share one event loop.
+Every coroutine returns ip2geotools IpLocation object or raises ip2geotools errors.
+
+Only databases with JSON API are implemented here. Databases parsed from web pages
+(DbIpWeb, NeustarWeb) or geocoded by another service (DbIpCity) are queried through
+ip2geotools in executor, so their parsing is not duplicated.
+"""
+import asyncio
+import json
+from urllib.parse import quote
+
+import aiohttp
+from ip2geotools.errors import (InvalidRequestError, InvalidResponseError,
+                                IpAddressNotFoundError, LimitExceededError,
+                                PermissionRequiredError, ServiceError)
+from ip2geotools.models import IpLocation
+
+
+async def _request(session, method, url, **kwargs):
+    """Coroutine makes HTTP request and returns status code and raw content of response."""
+    try:
+        async with session.request(method, url, **kwargs) as response:
+            return response.status, await response.read()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as exception:
+        raise ServiceError() from exception
+
+
+def _parse_json(content, encoding='utf-8'):
+    """Function decodes JSON response content"""
+    try:
+        return json.loads(content.decode(encoding))
+    except (UnicodeDecodeError, ValueError) as exception:
+        raise InvalidResponseError() from exception
+
+
+async def host_ip(session, ip_address):
+    """Coroutine rethrieves location from HostIP database"""
+    status, content = await _request(session, 'GET', 'http://api.hostip.info/get_json.php?position=true&ip=' + quote(ip_address))
+
+    # Check for HTTP errors
+    if status != 200:
+        if status == 404:
+            raise IpAddressNotFoundError(ip_address)
+        if status == 500:
+            raise InvalidRequestError()
+        raise ServiceError()
+
+    content = _parse_json(content)
+    ip_location = IpLocation(ip_address)
+
+    if content.get('country_code') and content['country_code'] != 'XX':
+        ip_location.country = content['country_code']
+
+    if content.get('city') and content['city'] not in ('(Unknown City?)', '(Unknown city)', '(Private Address)'):
+        ip_location.city = content['city']
+
+    if content.get('lat') and content.get('lng'):
+        ip_location.latitude = float(content['lat'])
+        ip_location.longitude = float(content['lng'])
+
+    return ip_location
+
+
+async def ipstack(session, ip_address, api_key):
+    """Coroutine rethrieves location from Ipstack database"""
+    status, content = await _request(session, 'GET', 'http://api.ipstack.com/' + quote(ip_address) + '?access_key=' + quote(api_key or ''))
+
+    if status != 200:
+        raise ServiceError()
+
+    content = _parse_json(content)
+
+    # Check for errors
+    if content.get('error'):
+        if content['error']['code'] in (101, 102, 105):
+            raise PermissionRequiredError()
+        if content['error']['code'] == 104:
+            raise LimitExceededError()
+        raise InvalidRequestError()
+
+    ip_location = IpLocation(ip_address)
+    ip_location.country = content.get('country_code')
+    ip_location.region = content.get('region_name')
+    ip_location.city = content.get('city')
+
+    if content.get('latitude') and content.get('longitude') and content['latitude'] != '-' and content['longitude'] != '-':
+        ip_location.latitude = float(content['latitude'])
+        ip_location.longitude = float(content['longitude'])
+
+    return ip_location
+
+
+async def eurek(session, ip_address, api_key):
+    """Coroutine rethrieves location from Eurek database"""
+    status, content = await _request(session, 'GET', 'https://https-api.eurekapi.com/iplocation/v1.8/locateip?ip=' + quote(ip_address)
+                                     + '&key=' + quote(api_key or '') + '&format=JSON')
+
+    if status != 200:
+        if status == 429:
+            raise LimitExceededError()
+        if status == 500:
+            raise InvalidRequestError()
+        raise ServiceError()
+
+    content = _parse_json(content)
+    ip_location = IpLocation(ip_address)
+
+    # Check for errors
+    if content['query_status']['query_status_code'] != 'OK':
+        error_status = content['query_status']['query_status_code']
+
+        if error_status in ('MISSING_SERVICE_ACCESS_KEY', 'INVALID_SERVICE_ACCESS_KEY', 'FREE_TRIAL_LICENSE_EXPIRED', 'SUBSCRIPTION_EXPIRED'):
+            raise PermissionRequiredError(content['query_status']['query_status_description'])
+        if error_status in ('MISSING_IP_ADDRESS', 'INVALID_IP_ADDRESS'):
+            raise IpAddressNotFoundError(ip_address)
+        return ip_location
+
+    geolocation_data = content.get('geolocation_data')
+    if geolocation_data:
+        ip_location.country = geolocation_data.get('country_code_iso3166alpha2')
+        ip_location.region = geolocation_data.get('region_name')
+        ip_location.city = geolocation_data.get('city')
+
+        if geolocation_data.get('latitude') and geolocation_data.get('longitude'):
+            ip_location.latitude = float(geolocation_data['latitude'])
+            ip_location.longitude = float(geolocation_data['longitude'])
+
+    return ip_location
+
+
+async def geobytes_city(session, ip_address):
+    """Coroutine rethrieves location from GeobytesCityDetails database"""
+    status, content = await _request(session, 'GET', 'http://getcitydetails.geobytes.com/GetCityDetails?fqcn=' + quote(ip_address))
+
+    if status != 200:
+        raise ServiceError()
+
+    content = _parse_json(content, 'latin-1')
+    ip_location = IpLocation(ip_address)
+    ip_location.country = content.get('geobytesinternet')
+    ip_location.region = content.get('geobytesregion')
+    ip_location.city = content.get('geobytescity')
+
+    if content.get('geobyteslatitude') and content.get('geobyteslongitude'):
+        ip_location.latitude = float(content['geobyteslatitude'])
+        ip_location.longitude = float(content['geobyteslongitude'])
+
+    return ip_location
+
+
+async def ip_info(session, ip_address):
+    """Coroutine rethrieves location from IP Info database"""
+    status, content = await _request(session, 'GET', 'https://ipinfo.io/' + quote(ip_address) + '/geo/')
+
+    if status != 200:
+        if status == 404:
+            raise IpAddressNotFoundError(ip_address)
+        if status == 429:
+            raise LimitExceededError()
+        if status == 500:
+            raise InvalidRequestError()
+        raise ServiceError()
+
+    content = _parse_json(content)
+    ip_location = IpLocation(ip_address)
+    ip_location.country = content.get('country')
+    ip_location.region = content.get('region')
+    ip_location.city = content.get('city')
+
+    if content.get('loc'):
+        location = content['loc'].split(',')
+        ip_location.latitude = float(location[0])
+        ip_location.longitude = float(location[1])
+
+    return ip_location
+
+
+async def max_mind(session, ip_address, login, password):
+    """Coroutine rethrieves location from MaxMindGeoIp2City database"""
+    # Optional auth for increasing amount of queries per day
+    auth = None
+    if login is not None and password is not None:
+        auth = aiohttp.BasicAuth(login, password)
+
+    status, content = await _request(session, 'GET', 'https://www.maxmind.com/geoip/v2.1/city/' + quote(ip_address) + ('?demo=1' if auth is None else ''), auth=auth)
+    content = _parse_json(content)
+
+    if status != 200:
+        if status in (400, 500):
+            raise InvalidRequestError(content.get('code'))
+        if status in (401, 403):
+            raise PermissionRequiredError(content.get('code'))
+        if status == 402:
+            raise LimitExceededError(content.get('code'))
+        if status == 404:
+            raise IpAddressNotFoundError(ip_address)
+        raise ServiceError()
+
+    ip_location = IpLocation(ip_address)
+
+    if content.get('country'):
+        ip_location.country = content['country'].get('iso_code')
+
+    if content.get('subdivisions') and content['subdivisions'][0].get('names'):
+        ip_location.region = content['subdivisions'][0]['names'].get('en')
+
+    if content.get('city') and content['city'].get('names'):
+        ip_location.city = content['city']['names'].get('en')
+
+    if content.get('location'):
+        ip_location.latitude = float(content['location']['latitude'])
+        ip_location.longitude = float(content['location']['longitude'])
+
+    return ip_location
+
+
+async def skyhook(session, ip_address, login, password):
+    """Coroutine rethrieves location from Skyhook database"""
+    status, content = await _request(session, 'GET', 'https://context.skyhookwireless.com/accelerator/ip?ip=' + quote(ip_address)
+                                     + '&user=' + quote(login or '') + '&key=' + quote(password or '') + '&version=2.0')
+
+    if status != 200:
+        if status == 400:
+            raise InvalidRequestError()
+        if status == 401:
+            raise PermissionRequiredError(ip_address)
+        raise ServiceError()
+
+    content = _parse_json(content)
+    ip_location = IpLocation(ip_address)
+    data = content.get('data') or {}
+
+    # Database returns only IP address for unknown locations
+    if data == {'ip': ip_address}:
+        raise IpAddressNotFoundError(ip_address)
+
+    if data.get('civic'):
+        ip_location.country = data['civic'].get('countryIso')
+        ip_location.region = data['civic'].get('state')
+        ip_location.city = data['civic'].get('city')
+
+    if data.get('location') and data['location'].get('latitude') and data['location'].get('longitude'):
+        ip_location.latitude = data['location']['latitude']
+        ip_location.longitude = data['location']['longitude']
+
+    return ip_location
+
+
+# Native coroutines by database name used in settings: (coroutine, names of settings passed after IP address)
+ASYNC_DATABASES = {
+    "host_ip": (host_ip, ()),
+    "ipstack": (ipstack, ("api_key",)),
+    "eurek": (eurek, ("api_key",)),
+    "geobytes_city": (geobytes_city, ()),
+    "ip_info": (ip_info, ()),
+    "max_mind": (max_mind, ("login", "password")),
+    "skyhook": (skyhook, ("login", "password")),
+}
@@ -0,0 +1,203 @@
+"""Module with base class and registry of database connectors"""
+import importlib
+import time
+
+from ip2geotools.errors import (InvalidResponseError, IpAddressNotFoundError,
+                                LimitExceededError, LocationError,
+                                PermissionRequiredError, ServiceError)
+from ip2geotools_locator import metrics
+from ip2geotools_locator.folium_map import FoliumMap
+from ip2geotools_locator.utils import LOGGER as logger
+
+# Registered connector classes by database name used in settings
+CONNECTORS = {}
+# Database names of connectors shipped with package, every one is registered by module of the same name
+BUILTIN_CONNECTORS = ("eurek", "geobytes_city", "host_ip", "ip2location", "ip2location_web", "ip_city", "ip_info", "ip_web", "ipstack",
+                      "max_mind", "max_mind_lite", "neustar_web", "skyhook")
+
+
+def register(connector_class):
+    """
+    Class decorator which registers connector under its settings name.
+    Registered connectors are created by Locator for databases set as Active in settings.
+    """
+    CONNECTORS[connector_class.name] = connector_class
+    return connector_class
+
+
+def get_connector_class(db_name):
+    """
+    Function returns registered connector class of database or None for unknown database.
+    Built-in connectors are imported on first use, so only databases which are looked up
+    load their ip2geotools classes and file readers.
+    """
+    if db_name not in CONNECTORS and db_name in BUILTIN_CONNECTORS:
+        importlib.import_module("ip2geotools_locator.database_connectors." + db_name)
+    return CONNECTORS.get(db_name)
+
+
+def create_connector(db_name, db_settings):
+    """Function creates connector of database from its settings. Returns None for unknown database."""
+    connector = get_connector_class(db_name)
+    if connector is None:
+        logger.error("Database %s from settings has no registered connector.", db_name)
+        return None
+    return connector.from_settings(db_settings)
+
+
+class DatabaseConnector:
+    """
+    Base class for handling DB connection into Geolocation database using ip2geotools package.
+
+    Connector is created once and reused for all lookups, so it can keep open files, sessions
+    and parsed settings. get_location() can be called from many threads at once.
+    """
+    # Database name used in settings
+    name = None
+    # Key of database in dictionary of locations
+    location_name = None
+    # ip2geotools class for accessing database
+    database = None
+    # Name of database in map markers, connectors without ip2geotools class set it
+    database_name = None
+    # Commercial databases have red map markers
+    commercial = False
+    # Web databases send HTTP requests through pooled sessions
+    web = False
+
+    # RateLimiter of requests, CircuitBreaker of database and Metrics of Locator, set by Locator
+    rate_limiter = None
+    circuit_breaker = None
+    metrics = None
+
+    # Instance of map for placing markers
+    m = FoliumMap()
+    # Location returned by the last lookup
+    db_data = None
+
+    @classmethod
+    def from_settings(cls, db_settings):
+        """Creates connector from settings of database (api_key, db_file, login, password)."""
+        return cls()
+
+    def _get(self, ip_address):
+        """Rethrieves raw location from database. Connectors with credentials or files override this method."""
+        return self.database.get(ip_address)
+
+    def _validate(self, location):
+        """Raises InvalidResponseError for location which cannot be used in calculations."""
+        if location.latitude is None or location.longitude is None:
+            raise InvalidResponseError
+
+    def get_location(self, ip_address):
+        """
+        Retrieves location for given IP address from database
+        Validation and exception handling included. Request is not sent if circuit breaker
+        of database is open or its rate limit or daily quota is exhausted.
+        """
+        wait = self.reserve_request()
+        if wait is None:
+            return None
+        if wait > 0:
+            time.sleep(wait)
+
+        # Exceptions not handled below mean unavailable service
+        outcome = metrics.SERVICE_ERROR
+        started = time.perf_counter()
+        try:
+            # Try to get and return location
+            location = self._get(ip_address)
+            outcome = metrics.INVALID_RESPONSE
+            self.accept_location(location)
+            outcome = metrics.SUCCESS
+            return location
+
+        except LocationError as exception:
+            outcome = self.error_outcome(exception)
+
+        finally:
+            self.record_outcome(outcome, time.perf_counter() - started)
+
+        return None
+
+    def reserve_request(self):
+        """
+        Checks circuit breaker and rate limiter of database before request is sent. Returns number
+        of seconds the request must wait for its token (0 for none) or None if database is skipped.
+        Skipped request is recorded. Used by blocking and asyncio lookups.
+        """
+        breaker = self.circuit_breaker
+        if breaker is not None and not breaker.allow():
+            logger.warning("Circuit breaker of database %s is open. Database is skipped.", self.location_name)
+            self.record_outcome(metrics.CIRCUIT_OPEN)
+            return None
+
+        wait = 0.0 if self.rate_limiter is None else self.rate_limiter.reserve()
+        if wait is None:
+            logger.warning("Request limit of database %s is exhausted. Database is skipped.", self.location_name)
+            self.record_outcome(metrics.RATE_LIMITED)
+        return wait
+
+    def accept_location(self, location):
+        """Validates location returned by database and keeps it as the last one. Raises InvalidResponseError for unusable location."""
+        self._validate(location)
+
+        self.db_data = location
+        logger.info("DB %s returned location %.3f N, %.3f E", self.location_name, location.latitude, location.longitude)
+
+    def error_outcome(self, exception):
+        """Logs ip2geotools error raised by request to database and returns outcome of the request (see metrics.OUTCOMES)."""
+        if isinstance(exception, IpAddressNotFoundError):
+            logger.warning("Database %s could not find IP address. IpAddressNotFoundError: %s ", self.location_name, str(exception))
+            return metrics.NOT_FOUND
+
+        if isinstance(exception, PermissionRequiredError):
+            logger.critical("Additional setings required for DB %s. PermissionRequiredError: %s ", self.location_name, str(exception))
+            return metrics.PERMISSION_REQUIRED
+
+        if isinstance(exception, ServiceError):
+            logger.error("Service %s is unavailable. ServiceError: %s ", self.location_name, str(exception))
+            return metrics.SERVICE_ERROR
+
+        if isinstance(exception, LimitExceededError):
+            logger.warning("Database %s has exceeded number of requests! LimitExceededError", self.location_name)
+            if self.rate_limiter is not None:
+                self.rate_limiter.limit_exceeded()
+            return metrics.LIMIT_EXCEEDED
+
+        # Invalid data, request and response
+        logger.error("Database %s returned %s ", self.location_name, str(exception.__class__))
+        return metrics.INVALID_RESPONSE
+
+    def record_outcome(self, outcome, seconds=None):
+        """
+        Records outcome of request (see metrics.OUTCOMES) into circuit breaker and metrics.
+        Only unavailable service counts as failure for circuit breaker. Requests which were
+        rate limited or cancelled release breaker. Latency is given for requests which were sent.
+        """
+        breaker = self.circuit_breaker
+        if breaker is not None and outcome != metrics.CIRCUIT_OPEN:
+            if outcome == metrics.SERVICE_ERROR:
+                breaker.record_failure()
+            elif outcome in (metrics.RATE_LIMITED, metrics.CANCELLED):
+                breaker.cancel()
+            else:
+                breaker.record_success()
+
+        if self.metrics is not None:
+            self.metrics.observe(self.location_name, outcome, seconds)
+
+    def add_to_map(self, location=None):
+        """
+        Add Folium Marker of location to map. Location returned by the last get_location(ip) call
+        is used if no location is given.
+        """
+        if location is None:
+            location = self.db_data
+
+        database_name = self.database_name or self.database.__name__
+        logger.debug("Calling add_marker method for %s DB", database_name)
+        if location is not None:
+            self.m.add_marker(database_name, location, self.commercial)
+        else:
+            logger.warning("Cannot add empty marker db %s", database_name)
@@ -1,70 +1,59 @@
 """Module for connecting to Ip2Location DB"""
-from ip2geotools.databases.noncommercial import Ip2Location
-from ip2geotools.errors import (InvalidRequestError, InvalidResponseError,
-                                IpAddressNotFoundError, LimitExceededError,
-                                LocationError, PermissionRequiredError,
+from ip2geotools.errors import (InvalidRequestError, IpAddressNotFoundError,
                                 ServiceError)
-from ip2geotools_locator.folium_map import FoliumMap
+from ip2geotools.models import IpLocation
+
+from ip2geotools_locator.database_connectors.base import DatabaseConnector, register
+from ip2geotools_locator.database_connectors.readers import IP2LOCATION_READERS, record_text
 from ip2geotools_locator.utils import LOGGER as logger
 
 
-class Ip2LocationDB:
+@register
+class Ip2LocationDB(DatabaseConnector):
     """
     Class for handling DB connection into Ip2location Database
     """
-    # Instance of map for placing markers
-    m = FoliumMap()
-    db_data = None
+    name = "ip2location"
+    location_name = "Ip2location"
+    # Files are read without ip2geotools class, whose module imports HTTP client libraries
+    database_name = "Ip2Location"
+    commercial = False
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, reader_mode="mmap"):
         # This database needs DB file to read data
         if file_path is None:
-            logger.critical("Database %s needs DB file!", Ip2Location.__name__)
+            logger.critical("Database %s needs DB file!", self.database_name)
         self.__file_path = file_path
+        self.__reader_mode = reader_mode
+
+    @classmethod
+    def from_settings(cls, db_settings):
+        return cls(db_settings["db_file"], db_settings.get("reader_mode", "mmap"))
 
-    def get_location(self, ip_address):
+    def _get(self, ip_address):
         """
-        Retrieves location for given IP address from Ip2location database
-        Validation and exception handling included.
+        Reads location from BIN file, which is opened once per process in "mmap" or "memory"
+        reader mode. Formatting is the same as in Ip2Location class of ip2geotools.
         """
         try:
-            # Try to get and return location
-            self.db_data = Ip2Location.get(ip_address, None, self.__file_path)
-
-            if self.db_data.latitude is None or self.db_data.longitude is None:
-                raise InvalidResponseError
-
-            logger.info("DB returned location %.3f N, %.3f E", self.db_data.latitude, self.db_data.longitude)
-            return self.db_data
-
-        except IpAddressNotFoundError as exception:
-            # Handling for IpAddressNotFoundError exception
-            logger.warning("Database could not find IP address. IpAddressNotFoundError: %s ", str(exception))
+            reader = IP2LOCATION_READERS.get(self.__file_path, self.__reader_mode)
+        except (OSError, TypeError, ValueError) as exception:
+            raise ServiceError() from exception
 
-        except PermissionRequiredError as exception:
-            # Handling for PermissionRequiredError exception
-            logger.critical("Additional setings required for DB. PermissionRequiredError: %s ", str(exception))
+        record = reader.get_all(ip_address)
 
-        except ServiceError as exception:
-            # Handling for ServiceError exception
-            logger.error("Service is unavailable. ServiceError: %s ", str(exception))
+        if record is not None and record.country_short == "INVALID IP ADDRESS":
+            raise InvalidRequestError()
+        if record is None or record_text(record.country_short) in (None, "IPV6 ADDRESS MISSING IN IPV4 BIN"):
+            raise IpAddressNotFoundError(ip_address)
 
-        except LimitExceededError as exception:
-            # Handling for LimitExceededError exception
-            logger.warning("Database Eurek has exceeded number of requests! LimitExceededError")
+        ip_location = IpLocation(ip_address)
+        ip_location.country = record_text(record.country_short)
+        ip_location.region = record_text(record.region)
+        ip_location.city = record_text(record.city)
 
-        except (LocationError, InvalidRequestError, InvalidResponseError) as exception:
-            # Handling for invalid data, request and response exception
-            logger.error("Database Eurek returned %s ", str(exception.__class__))
-
-
-    def add_to_map(self):
-        """
-        Add Folium Marker to map. Call get_location(ip) method before adding any markers to map!
-        """
+        if record_text(record.latitude) is not None and record_text(record.longitude) is not None:
+            ip_location.latitude = float(record.latitude)
+            ip_location.longitude = float(record.longitude)
 
-        logger.debug("Calling add_marker method for %s DB", Ip2Location.__name__)
-        if self.db_data is not None:
-            self.m.add_marker(Ip2Location.__name__, self.db_data, False)
-        else:
-            logger.warning("Cannot add empty marker db %s", Ip2Location.__name__)
+        return ip_location
@@ -1,70 +1,62 @@
 """Module for connecting to DB MaxMindLite"""
-from ip2geotools.databases.noncommercial import MaxMindGeoLite2City
-from ip2geotools.errors import (InvalidRequestError, InvalidResponseError,
-                                IpAddressNotFoundError, LimitExceededError,
-                                LocationError, PermissionRequiredError,
+import geoip2.errors
+import maxminddb
+from ip2geotools.errors import (InvalidRequestError, IpAddressNotFoundError,
                                 ServiceError)
-from ip2geotools_locator.folium_map import FoliumMap
+from ip2geotools.models import IpLocation
+
+from ip2geotools_locator.database_connectors.base import DatabaseConnector, register
+from ip2geotools_locator.database_connectors.readers import MMDB_READERS
 from ip2geotools_locator.utils import LOGGER as logger
 
 
-class MaxMindLiteDB:
+@register
+class MaxMindLiteDB(DatabaseConnector):
     """
     Class for handling DB connection into MaxMindGeoLite2City Database
     """
-    # Instance of map for placing markers
-    m = FoliumMap()
-    db_data = None
+    name = "max_mind_lite"
+    location_name = "MaxMind_GeoLite2City"
+    # Files are read without ip2geotools class, whose module imports HTTP client libraries
+    database_name = "MaxMindGeoLite2City"
+    commercial = False
 
     def __init__(self, file_path):
         # This database needs DB file to read data
         if file_path is None:
-            logger.critical("Database %s needs DB file!", MaxMindGeoLite2City.__name__)
+            logger.critical("Database %s needs DB file!", self.database_name)
         self.__file_path = file_path
 
-    def get_location(self, ip_address):
-        """
-        Retrieves location for given IP address from MaxMindGeoLite2City database
-        Validation and exception handling included.
-        """
-        try:
-            # Try to get and return location
-            self.db_data = MaxMindGeoLite2City.get(ip_address, None, self.__file_path)
-
-            if self.db_data.latitude is None or self.db_data.longitude is None:
-                raise InvalidResponseError
-
-            logger.info("DB returned location %.3f N, %.3f E", self.db_data.latitude, self.db_data.longitude)
-            return self.db_data
-
-        except IpAddressNotFoundError as exception:
-            # Handling for IpAddressNotFoundError exception
-            logger.warning("Database could not find IP address. IpAddressNotFoundError: %s ", str(exception))
+    @classmethod
+    def from_settings(cls, db_settings):
+        return cls(db_settings["db_file"])
 
-        except PermissionRequiredError as exception:
-            # Handling for PermissionRequiredError exception
-            logger.critical("Additional setings required for DB. PermissionRequiredError: %s ", str(exception))
-
-        except ServiceError as exception:
-            # Handling for ServiceError exception
-            logger.error("Service is unavailable. ServiceError: %s ", str(exception))
-
-        except LimitExceededError as exception:
-            # Handling for LimitExceededError exception
-            logger.warning("Database Eurek has exceeded number of requests! LimitExceededError")
-
-        except (LocationError, InvalidRequestError, InvalidResponseError) as exception:
-            # Handling for invalid data, request and response exception
-            logger.error("Database Eurek returned %s ", str(exception.__class__))
-
-
-    def add_to_map(self):
+    def _get(self, ip_address):
         """
-        Add Folium Marker to map. Call get_location(ip) method before adding any markers to map!
+        Reads location from DB file. Formatting is the same as in MaxMindGeoLite2City class
+        of ip2geotools, but returned IpLocation has also "network" attribute with range of
+        IP addresses sharing the record. DB file is opened once and memory-mapped.
         """
+        try:
+            reader = MMDB_READERS.get(self.__file_path)
+        except (OSError, TypeError, ValueError, maxminddb.InvalidDatabaseError) as exception:
+            raise ServiceError() from exception
 
-        logger.debug("Calling add_marker method for %s DB", MaxMindGeoLite2City.__name__)
-        if self.db_data is not None:
-            self.m.add_marker(MaxMindGeoLite2City.__name__, self.db_data, False)
-        else:
-            logger.warning("Cannot add empty marker db %s", MaxMindGeoLite2City.__name__)
+        try:
+            response = reader.city(ip_address)
+        except (TypeError, ValueError) as exception:
+            raise InvalidRequestError() from exception
+        except geoip2.errors.AddressNotFoundError as exception:
+            raise IpAddressNotFoundError(ip_address) from exception
+
+        ip_location = IpLocation(ip_address)
+        ip_location.network = response.traits.network
+        ip_location.country = response.country.iso_code if response.country else None
+        ip_location.region = response.subdivisions[0].names.get('en') if response.subdivisions else None
+        ip_location.city = response.city.names.get('en') if response.city.names else None
+
+        if response.location and response.location.latitude is not None and response.location.longitude is not None:
+            ip_location.latitude = float(response.location.latitude)
+            ip_location.longitude = float(response.location.longitude)
+
+        return ip_location
@@ -0,0 +1,157 @@
+"""Module with readers of local database files shared by the whole process"""
+import io
+import mmap
+import os
+import threading
+import time
+
+import geoip2.database
+import IP2Location
+import maxminddb
+
+from ip2geotools_locator.utils import LOGGER as logger
+
+
+class FileReaders:
+    """
+    Class keeping one open reader for every database file, so the file is opened and parsed
+    only once per process.
+
+    Readers are reopened when the file on disk is replaced (its inode, size or modification
+    time changes). File is checked at most once per check_interval seconds. Replaced reader
+    is not closed, because other threads may still read from it. It is closed when the last
+    reference is dropped.
+    """
+    def __init__(self, open_reader, check_interval=1.0):
+        # open_reader(file_path, mode) returns new reader
+        self._open_reader = open_reader
+        self.check_interval = check_interval
+
+        # (file_path, mode): (reader, file signature, time of last check)
+        self._readers = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _signature(file_path):
+        """Method returns values which change when file is replaced or rewritten."""
+        stat = os.stat(file_path)
+        return stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def get(self, file_path, mode=None):
+        """Method returns open reader of file. Raises OSError or ValueError if file cannot be read."""
+        key = (file_path, mode)
+        entry = self._readers.get(key)
+        now = time.monotonic()
+
+        if entry is not None and now - entry[2] < self.check_interval:
+            return entry[0]
+
+        with self._lock:
+            entry = self._readers.get(key)
+            signature = self._signature(file_path)
+
+            if entry is None or entry[1] != signature:
+                logger.debug("Opening database file %s.", file_path)
+                reader = self._open_reader(file_path, mode)
+            else:
+                reader = entry[0]
+
+            self._readers[key] = (reader, signature, now)
+            return reader
+
+    def close(self):
+        """Method closes all readers."""
+        with self._lock:
+            for reader, _, _ in self._readers.values():
+                reader.close()
+            self._readers.clear()
+
+
+def open_mmdb(file_path, mode=None):
+    """
+    Function opens MaxMind DB file. MODE_AUTO maps file into memory (with C extension if
+    it is installed), so processes reading the same file share its pages in page cache.
+    """
+    return geoip2.database.Reader(file_path, mode=maxminddb.MODE_AUTO if mode is None else mode)
+
+
+# Open MaxMind DB files
+MMDB_READERS = FileReaders(open_mmdb)
+
+
+def record_text(value):
+    """Function returns text field of IP2Location record or None for empty field."""
+    if isinstance(value, bytes):
+        value = value.decode('utf-8')
+    return None if value in (None, '', '-', 'N/A') else value
+
+
+class Ip2LocationReader:
+    """
+    Thread-safe reader of IP2Location BIN file.
+
+    Mode "mmap" maps file into memory, mode "memory" loads whole file into process memory.
+    IP2Location package reads records by seeking in shared file object, so lookups are
+    serialized by lock. They take only microseconds, because file is never read from disk
+    through system calls.
+
+    Lookups use public get_all() method. IP2Location has no public API for replacing its file
+    object or for reading all rows, so __init__() and ranges() use private attributes of
+    IP2Location 8.11.0, to which the package is pinned in setup.py.
+    """
+    # pylint: disable=protected-access
+    MODES = ("mmap", "memory")
+
+    def __init__(self, file_path, mode=None):
+        mode = mode or "mmap"
+        if mode not in self.MODES:
+            raise ValueError("Unknown IP2Location reader mode %s." % mode)
+
+        # Header is parsed by IP2Location from regular file, which is then replaced
+        self._database = IP2Location.IP2Location(file_path)
+        with self._database._f as file:
+            if mode == "mmap":
+                self._database._f = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                file.seek(0)
+                self._database._f = io.BytesIO(file.read())
+
+        self.mode = mode
+        self._lock = threading.Lock()
+
+    def get_all(self, ip_address):
+        """Method returns IP2LocationRecord of IP address or None."""
+        with self._lock:
+            return self._database.get_all(ip_address)
+
+    def ranges(self):
+        """
+        Generator yields all ranges of file as tuples (IP version, first IP number, last IP number,
+        IP2LocationRecord). IPv4 ranges are read first.
+        """
+        database = self._database
+        row_width = database._dbcolumn * 4
+
+        for version, count, base_address in ((4, database._ipv4dbcount, database._ipv4dbaddr),
+                                            (6, database._ipv6dbcount, database._ipv6dbaddr)):
+            for row in range(count):
+                with self._lock:
+                    if version == 4:
+                        first, end = database.readRow32(base_address + row * row_width)
+                    else:
+                        first, end = database.readRow128(base_address + row * (row_width + 12))
+                    # Record keeps IP address of the last lookup, empty one is read from file
+                    database.original_ip = ""
+                    record = database._read_record(row, version)
+
+                # Range end is the start of next range
+                yield version, first, end - 1, record
+
+    def close(self):
+        """Method closes file."""
+        with self._lock:
+            self._database.close()
+
+
+# Open IP2Location BIN files
+IP2LOCATION_READERS = FileReaders(Ip2LocationReader)
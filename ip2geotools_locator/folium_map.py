@@ -1,7 +1,9 @@
-"""Module for interaction with folium map package"""
-import folium
-from geopy import distance
+"""
+Module for interaction with folium map package
 
+folium and geopy are imported by methods which use them, so map is loaded only by lookups
+which generate map file.
+"""
 from ip2geotools_locator.utils import LOGGER as logger
 
 class FoliumMap:
@@ -16,6 +18,8 @@ class FoliumMap:
     @classmethod
     def add_marker(cls, name, location_data, commercial):
         """This method creates marker for noncommercial database"""
+        import folium
+
         if commercial is True:
             color = 'red'
             db_type = 'commercial'
@@ -33,6 +37,7 @@ class FoliumMap:
     @classmethod
     def add_calculated_marker(cls, name, ip_address, latitude, longitude):
         """This method creates marker for calculated location"""
+        import folium
 
         # Adding debug record
         logger.info("%s: Adding Marker for %s calculation method", __name__, name)
@@ -43,6 +48,8 @@ class FoliumMap:
     @classmethod
     def add_poly_lines(cls, locations, calculated_locations):
         """Method for creating Folium PolyLines"""
+        import folium
+        from geopy import distance
 
         # Add polylines from each calculated location
         for calc_loc in calculated_locations:
@@ -58,6 +65,8 @@ class FoliumMap:
     @classmethod
     def generate_map(cls, center_location=None, file_name="locations"):
         """Method for generating map file."""
+        import folium
+
         try:
             # Create Folium map object
             f_map = folium.Map([center_location.latitude, center_location.longitude])
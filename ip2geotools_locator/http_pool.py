@@ -0,0 +1,165 @@
+"""Module for pooled HTTP connections of web databases"""
+import threading
+from urllib.parse import urlsplit
+
+import ip2geotools.databases.commercial
+import ip2geotools.databases.noncommercial
+import requests
+from requests.adapters import HTTPAdapter
+
+from ip2geotools_locator.utils import LOGGER as logger
+
+# ip2geotools modules calling requests.get() and requests.post() for every lookup
+PATCHED_MODULES = (ip2geotools.databases.commercial, ip2geotools.databases.noncommercial)
+# Process-wide pool installed by acquire() and number of its users
+_SHARED = {"pool": None, "users": 0}
+_SHARED_LOCK = threading.Lock()
+
+
+class HttpPool:
+    """
+    Class holding one requests.Session with keep-alive connection pool for every host.
+
+    Web databases of ip2geotools open new TCP and TLS connection for every request. When pool
+    is installed by acquire(), their requests go through sessions of this pool instead, so
+    connections to the same host are reused. Timeouts of ip2geotools (62 s) are replaced by
+    configured connect and read timeouts.
+    """
+    def __init__(self, pool_size=10, connect_timeout=10, read_timeout=62):
+        self.pool_size = pool_size
+        self.timeout = (connect_timeout, read_timeout)
+
+        # host: requests.Session
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _session(self, url):
+        """Method returns session of host from given URL. Session is created on first request."""
+        host = urlsplit(url).netloc
+
+        session = self._sessions.get(host)
+        if session is None:
+            with self._lock:
+                session = self._sessions.get(host)
+                if session is None:
+                    logger.debug("Creating HTTP session with pool of %i connections for %s.", self.pool_size, host)
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    self._sessions[host] = session
+
+        return session
+
+    def request(self, method, url, **kwargs):
+        """Method sends request through session of host. Returns requests.Response."""
+        kwargs["timeout"] = self.timeout
+        return self._session(url).request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        """Method sends GET request."""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Method sends POST request."""
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """
+        Method returns dictionary of connection statistics for every host:
+        number of requests, opened connections and requests sent over reused connection.
+        """
+        with self._lock:
+            sessions = dict(self._sessions)
+
+        stats = {}
+        for host, session in sessions.items():
+            host_stats = {"requests": 0, "connections": 0, "reused": 0}
+
+            for adapter in set(session.adapters.values()):
+                for key in adapter.poolmanager.pools.keys():
+                    pool = adapter.poolmanager.pools.get(key)
+                    if pool is not None:
+                        host_stats["requests"] += pool.num_requests
+                        host_stats["connections"] += pool.num_connections
+
+            host_stats["reused"] = max(host_stats["requests"] - host_stats["connections"], 0)
+            stats[host] = host_stats
+
+        return stats
+
+    def close(self):
+        """Method closes all sessions and their connections."""
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+
+class _RequestsProxy:
+    """Stand-in for requests module in ip2geotools. get() and post() use pool, rest is taken from requests."""
+    def __init__(self, pool):
+        self.pool = pool
+
+    def get(self, url, **kwargs):
+        """Method sends GET request through pooled session like requests.get()."""
+        return self.pool.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Method sends POST request through pooled session like requests.post()."""
+        return self.pool.post(url, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(requests, name)
+
+
+def acquire(pool_size=10, connect_timeout=10, read_timeout=62):
+    """
+    Function returns process-wide pool installed into ip2geotools and counts one more user of it.
+    ip2geotools modules are patched for whole process, so all Locators share one pool, which is
+    created with settings of its first user. Every acquire() must be followed by release().
+    """
+    with _SHARED_LOCK:
+        pool = _SHARED["pool"]
+        if pool is None:
+            pool = HttpPool(pool_size, connect_timeout, read_timeout)
+            install(pool)
+            _SHARED["pool"] = pool
+        elif (pool.pool_size,) + pool.timeout != (pool_size, connect_timeout, read_timeout):
+            logger.warning("HTTP pool is shared by all Locators, settings of its first user are kept.")
+
+        _SHARED["users"] += 1
+        return pool
+
+
+def release(pool):
+    """Function counts one user of process-wide pool less. The last user uninstalls and closes the pool."""
+    with _SHARED_LOCK:
+        if pool is not _SHARED["pool"]:
+            return
+
+        _SHARED["users"] -= 1
+        if _SHARED["users"] <= 0:
+            uninstall(pool)
+            pool.close()
+            _SHARED["pool"] = None
+            _SHARED["users"] = 0
+
+
+def install(pool):
+    """Function routes HTTP requests of all ip2geotools web databases through given pool."""
+    for module in PATCHED_MODULES:
+        module.requests = _RequestsProxy(pool)
+    logger.debug("HTTP pool installed into ip2geotools.")
+
+
+def uninstall(pool=None):
+    """Function restores original requests module in ip2geotools (only if given pool is installed)."""
+    for module in PATCHED_MODULES:
+        if pool is None or getattr(module.requests, "pool", None) is pool:
+            module.requests = requests
+
+
+def installed_pool():
+    """Function returns pool currently used by ip2geotools or None."""
+    return getattr(PATCHED_MODULES[0].requests, "pool", None)
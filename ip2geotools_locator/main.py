@@ -6,20 +6,20 @@ Main applicaton module
 This module contains whole application logic
 
 """
+import functools
 import json
+import threading
+from collections import deque
 
-from ip2geotools_locator.calculations import Average, Clustering, Median
-from ip2geotools_locator.database_connectors import (EurekDB, GeobytesCityDB,
-                                                     HostIpDB, Ip2LocationDB,
-                                                     Ip2locationWebDB,
-                                                     IpCityDB, IpInfoDB,
-                                                     IpstackDB, IpWebDB,
-                                                     MaxMindDB, MaxMindLiteDB,
-                                                     NeustarWebDB, SkyhookDB)
+from ip2geotools_locator.calculations import Average, BatchCalculation, Centroid, Clustering, GeometricMedian, Median
+from ip2geotools_locator import profiling
+from ip2geotools_locator.database_connectors import create_connector
 from ip2geotools_locator.folium_map import FoliumMap
-from ip2geotools_locator.utils import DEFAULT_SETTINGS
+from ip2geotools_locator.metrics import Metrics
+from ip2geotools_locator.throttling import CircuitBreaker, RateLimiter
+from ip2geotools_locator.utils import DB_TYPES, DEFAULT_SETTINGS, find_quorum, merge_settings
 from ip2geotools_locator.utils import LOGGER as logger
-from ip2geotools_locator.utils import Location
+from ip2geotools_locator.utils import Location, LocationRecord
 
 
 class Locator:
@@ -30,6 +30,8 @@ class Locator:
 
     # List of locations
     locations = {}
+    # Names of agreeing databases in quorum mode
+    quorum = None
 
     def __init__(self, generate_map=True, map_file_name="locations"):
         """
@@ -39,10 +41,31 @@ class Locator:
         self.generate_map = generate_map
         self.map_file_name = map_file_name
 
+        # Connectors of databases by settings name, created on first use
+        self._connectors = {}
+        # Rate limiters and circuit breakers of databases by settings name, kept when settings are changed
+        self._rate_limiters = {}
+        self._circuit_breakers = {}
+        # Latency, outcomes and cache hits of all lookups
+        self._metrics = Metrics()
+
+        # Thread pool for concurrent fetching and persistent cache, created on first use
+        self._executor = None
+        self._executor_jobs = None
+        self._cache = None
+        self._memory_cache = None
+        self._calculation_cache = None
+        self._prefix_cache = None
+        # Caches are created by worker threads of concurrent fetch mode, lock makes sure only once
+        self._cache_lock = threading.Lock()
+        self._http_pool = None
+        self._http_settings = None
+
         # Read settings.json
         try:
             with open("settings.json", "r") as read_file:
-                self.settings = json.load(read_file)
+                # Settings missing in older settings.json files are filled with defaults
+                self.settings = merge_settings(json.loads(DEFAULT_SETTINGS), json.load(read_file))
                 logger.info("Reading settings.json file.")
         except FileNotFoundError:
             self.settings = json.loads(DEFAULT_SETTINGS)
@@ -60,198 +83,492 @@ class Locator:
         Accepts selection of databases as list (defaultly settings are loaded from settings.json).
         Use ["commercial"], ["noncommercial"] databases or specify them ["host_ip", "ipstack", ...]
         Data are stored in "locations" list variable.
+
+        Databases are queried concurrently when "jobs" setting is greater than 1.
         """
-        locations = {}
         self.ip_address = ip_address
-        commercial_db_settings = self.settings["commercial"]
-        noncommercial_db_settings = self.settings["noncommercial"]
 
         logger.info("Gathering location records for IP address %s.", ip_address)
+        connectors, databases = self._active_connectors()
+        with profiling.span("lookup"):
+            locations, self.quorum = self._query_connectors(connectors, databases, ip_address)
 
-        # Noncommercial databases
-        # Json settings parsed for HostIP database
-        if noncommercial_db_settings["host_ip"]["active"]:
-            logger.debug("Database HostIP is set as Active in settings. Gathering location.")
-            # Create object for accessing database and store returned location
-            host_ip = HostIpDB()
-            locations["HostIP"] = (host_ip.get_location(ip_address))
-
-            # Add location to the map?
-            if noncommercial_db_settings["host_ip"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for HostIP database is set as Active in settings. Calling add_to_map method.""")
-                host_ip.add_to_map()
-
-        # Json settings parsed for DbIpCity database
-        if noncommercial_db_settings["ip_city"]["active"]:
-            logger.debug("Database DbIpCity is set as Active in settings. Gathering location.")
-            ip_city = IpCityDB()
-            locations["DbIpCity"] = (ip_city.get_location(ip_address))
-
-            if noncommercial_db_settings["ip_city"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for DbIpCity database is set Active in settings. Calling add_to_map method.""")
-                ip_city.add_to_map()
-
-        # Json settings parsed for Ip2location database
-        if noncommercial_db_settings["ip2location"]["active"]:
-            logger.debug("""database Ip2location is set as Active in settings. Gathering location.""")
-            ip2location = Ip2LocationDB(
-                noncommercial_db_settings["ip2location"]["db_file"])
-            locations["Ip2location"] = (ip2location.get_location(ip_address))
-
-            if noncommercial_db_settings["ip2location"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for Ip2location database is set as Active in settings. Calling add_to_map method.""")
-                ip2location.add_to_map()
-
-        # Json settings parsed for Ipstack database
-        if noncommercial_db_settings["ipstack"]["active"]:
-            logger.debug("database Ipstack is set as Active in settings. Gathering location.")
-            ipstack = IpstackDB(noncommercial_db_settings["ipstack"]["api_key"])
-            locations["Ipstack"] = (ipstack.get_location(ip_address))
-
-            if noncommercial_db_settings["ipstack"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for Ipstack database is set as Active in settings. Calling add_to_map method.""")
-                ipstack.add_to_map()
-
-        # Json settings parsed for MaxMind GeoLite2City database
-        if noncommercial_db_settings["max_mind_lite"]["active"]:
-            logger.debug("""database MaxMind GeoLite2City is set as Active in settings. Gathering location.""")
-            max_mind_lite = MaxMindLiteDB(
-                noncommercial_db_settings["max_mind_lite"]["db_file"])
-            locations["MaxMind_GeoLite2City"] = (max_mind_lite.get_location(ip_address))
-
-            if noncommercial_db_settings["max_mind_lite"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for MaxMind GeoLite2City database is set as Active in settings. Calling add_to_map method.""")
-                max_mind_lite.add_to_map()
-
-        # Commercial Databases
-        # Json settings parsed for Eurek database
-        if commercial_db_settings["eurek"]["active"]:
-            logger.debug("""database Eurek is set as Active in settings. Gathering location.""")
-            eurek = EurekDB()
-            locations["Eurek"] = (eurek.get_location(ip_address))
-
-            if commercial_db_settings["eurek"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for Eurek database is set as Active in settings. Calling add_to_map method.""")
-                eurek.add_to_map()
-
-        # Json settings parsed for GeobytesCityDetails database
-        if commercial_db_settings["geobytes_city"]["active"]:
-            logger.debug("""database GeobytesCityDetails is set as Active in settings. Gathering location.""")
-            geobytes_city = GeobytesCityDB()
-            locations["GeobytesCityDetails"] = (geobytes_city.get_location(ip_address))
-
-            if commercial_db_settings["geobytes_city"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for GeobytesCityDetails database is set as Active in settings. Calling add_to_map method.""")
-                geobytes_city.add_to_map()
-
-        # Json settings parsed for IP Info database
-        if commercial_db_settings["ip_info"]["active"]:
-            logger.debug(
-                "database IP Info is set as Active in settings. Gathering location.")
-            ip_info = IpInfoDB(commercial_db_settings["ip_info"]["api_key"])
-            locations["IP_Info"] = (ip_info.get_location(ip_address))
-
-            if commercial_db_settings["ip_info"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for IP Info database is set as Active in settings. Calling add_to_map method.""")
-                ip_info.add_to_map()
-
-        # Json settings parsed for DbIpWeb database
-        if commercial_db_settings["ip_web"]["active"]:
-            logger.debug("database DbIpWeb is set as Active in settings. Gathering location.")
-            ip_web = IpWebDB()
-            locations["DbIpWeb"] = (ip_web.get_location(ip_address))
-
-            if commercial_db_settings["ip_web"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for DbIpWeb database is set as Active in settings. Calling add_to_map method.""")
-                ip_web.add_to_map()
-
-        # Json settings parsed for DbIpWeb database
-        if commercial_db_settings["ip2location_web"]["active"]:
-            logger.debug("Database IP2LocationWeb is set Active in settings. Gathering location.")
-            ip2location_web = Ip2locationWebDB()
-            locations["IP2Location_Web"] = (ip2location_web.get_location(ip_address))
-
-            if commercial_db_settings["ip2location_web"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for DbIpWeb database is set as Active in settings. Calling add_to_map method.""")
-                ip2location_web.add_to_map()
-
-        # Json settings parsed for MaxMindGeoIp2City database
-        if commercial_db_settings["max_mind"]["active"]:
-            logger.debug("""database MaxMindGeoIp2City is set as Active in settings. Gathering location.""")
-            max_mind = MaxMindDB()
-            locations["MaxMindGeoIp2City"] = (max_mind.get_location(ip_address))
-
-            if commercial_db_settings["max_mind"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for MaxMindGeoIp2City database is set as Active in settings. Calling add_to_map method.""")
-                max_mind.add_to_map()
-
-        # Json settings parsed for NeustarWeb database
-        if commercial_db_settings["neustar_web"]["active"]:
-            logger.debug("database NeustarWeb is set Active in settings. Gathering location.")
-            neustar_web = NeustarWebDB()
-            locations["NeustarWeb"] = (neustar_web.get_location(ip_address))
-
-            if commercial_db_settings["neustar_web"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for NeustarWeb database is set as Active in settings. Calling add_to_map method.""")
-                neustar_web.add_to_map()
-
-        # Json settings parsed for Skyhook database
-        if commercial_db_settings["skyhook"]["active"]:
-            logger.debug("database Skyhook is set as Active in settings. Gathering location.")
-            skyhook = SkyhookDB()
-            locations["Skyhook"] = (skyhook.get_location(ip_address))
-
-            if commercial_db_settings["skyhook"]["generate_marker"] is True and self.generate_map is True:
-                logger.debug("""Folium marker for Skyhook database is set as Active in settings. Calling add_to_map method.""")
-                skyhook.add_to_map()
+        # Add locations to the map
+        for name, location in locations.items():
+            if databases[name]["generate_marker"] is True and self.generate_map is True and location is not None:
+                logger.debug("Folium marker for %s database is set as Active in settings. Calling add_to_map method.", name)
+                with profiling.span("map markers"):
+                    connectors[name].add_to_map(location)
 
         # Clean all tangling None values
         self.locations = {key: value for key, value in locations.items() if value is not None}
 
-    def calculate(self, average=True, clustering=False, median=False):
+    def _active_connectors(self):
+        """
+        Method returns connectors of databases which are set as Active in settings.
+        Returns dictionary of connectors and dictionary of their settings, both keyed by location name.
+        """
+        connectors = {}
+        databases = {}
+
+        for db_type in DB_TYPES:
+            for db_name, db_settings in self.settings[db_type].items():
+                if not db_settings["active"]:
+                    continue
+
+                connector = self._get_connector(db_name, db_settings)
+                if connector is not None:
+                    connectors[connector.location_name] = connector
+                    databases[connector.location_name] = db_settings
+
+        return connectors, databases
+
+    def _get_connector(self, db_name, db_settings):
+        """
+        Method returns connector of database from registry. Connector is created on first use
+        and reused for all following lookups until settings are changed by set_settings().
+        """
+        connector = self._connectors.get(db_name)
+
+        if connector is None:
+            logger.debug("Database %s is set as Active in settings. Creating connector.", db_name)
+            connector = create_connector(db_name, db_settings)
+            self._connectors[db_name] = connector
+            if connector is not None:
+                connector.rate_limiter = self._get_rate_limiter(db_name, db_settings)
+                connector.circuit_breaker = self._get_circuit_breaker(db_name)
+                connector.metrics = self._metrics
+
+        # Requests of web databases go through pooled HTTP sessions
+        if connector is not None and connector.web:
+            self._get_http_pool()
+
+        return connector
+
+    def _get_rate_limiter(self, db_name, db_settings):
+        """
+        Method returns rate limiter of database. Limiter is created again only if its settings
+        are changed, so used daily quota is kept. If persistent cache is active, daily quota
+        is counted in its file and shared with other processes.
+        """
+        rate_limiter = RateLimiter.from_settings(db_settings.get("rate_limit"))
+        if db_name in self._rate_limiters and self._rate_limiters[db_name].settings() == rate_limiter.settings():
+            rate_limiter = self._rate_limiters[db_name]
+        else:
+            self._rate_limiters[db_name] = rate_limiter
+
+        cache = self._get_cache() if rate_limiter.daily_quota else None
+        rate_limiter.quota_store = None if cache is None else functools.partial(cache.add_quota, db_name)
+        return rate_limiter
+
+    def get_rate_limit_stats(self):
+        """Method returns counters of rate limiters by database name."""
+        return {db_name: rate_limiter.stats() for db_name, rate_limiter in self._rate_limiters.items()}
+
+    def _get_circuit_breaker(self, db_name):
+        """
+        Method returns circuit breaker of database shared by all lookups or None if breakers
+        are not active. Breaker is created again only if its settings are changed.
+        """
+        circuit_breaker = CircuitBreaker.from_settings(self.settings["circuit_breaker"])
+        if circuit_breaker is None:
+            self._circuit_breakers.pop(db_name, None)
+            return None
+
+        if db_name in self._circuit_breakers and self._circuit_breakers[db_name].settings() == circuit_breaker.settings():
+            return self._circuit_breakers[db_name]
+
+        self._circuit_breakers[db_name] = circuit_breaker
+        return circuit_breaker
+
+    def get_circuit_breakers(self):
+        """Method returns state and counters of circuit breakers by database name."""
+        return {db_name: circuit_breaker.stats() for db_name, circuit_breaker in self._circuit_breakers.items()}
+
+    def get_metrics(self):
+        """
+        Method returns dictionary of metrics: outcome counts, success rate and latency histogram
+        of every database and hit rate of every cache (see Metrics.stats()).
+        """
+        return self._metrics.stats()
+
+    def export_metrics(self, file_path=None):
+        """Method returns metrics in Prometheus text exposition format. Text is also saved into file if path is given."""
+        text = self._metrics.prometheus()
+        if file_path is not None:
+            with open(file_path, "w") as write_file:
+                write_file.write(text)
+            logger.info("Metrics are saved into %s file.", file_path)
+        return text
+
+    def _get_http_pool(self):
+        """
+        Method returns pool of keep-alive HTTP sessions used by web databases.
+        Process-wide pool is acquired with "http" settings on first use and shared with
+        other Locators (see http_pool.acquire()).
+        """
+        from ip2geotools_locator import http_pool
+
+        http_settings = self.settings["http"]
+        settings = (http_settings["pool_size"], http_settings["connect_timeout"], http_settings["read_timeout"])
+
+        if self._http_pool is None or self._http_settings != settings:
+            if self._http_pool is not None:
+                http_pool.release(self._http_pool)
+            self._http_pool = http_pool.acquire(*settings)
+            self._http_settings = settings
+
+        return self._http_pool
+
+    def get_http_stats(self):
+        """Method returns connection statistics of pooled HTTP sessions by host (shared by all Locators)."""
+        if self._http_pool is None:
+            return {}
+        return self._http_pool.stats()
+
+    def _query_connectors(self, connectors, databases, ip_address):
+        """
+        Method looks up IP address in every connector and returns dictionary of responses and
+        list of databases in quorum (None if quorum mode is off or quorum was not reached).
+        Connectors are called one after another, or in bounded thread pool if "jobs"
+        setting is greater than 1. Slowest database then determines lookup latency, unless
+        quorum mode is active and enough databases agree first.
+        """
+        jobs = self.settings["jobs"]
+
+        if jobs <= 1 or len(connectors) < 2:
+            locations = {}
+            for name, connector in connectors.items():
+                locations[name] = self._lookup(name, connector, databases[name], ip_address)
+
+                quorum = self._find_quorum(locations)
+                if quorum is not None:
+                    return locations, quorum
+            return locations, None
+
+        logger.debug("Querying %i databases with %i worker threads.", len(connectors), jobs)
+        executor = self._get_executor()
+        futures = {name: executor.submit(self._lookup, name, connector, databases[name], ip_address) for name, connector in connectors.items()}
+        return self._collect(ip_address, futures)
+
+    def _collect(self, ip_address, futures):
+        """
+        Method waits for submitted lookups of one IP address and returns dictionary of responses
+        and list of databases in quorum. In quorum mode lookups which have not finished when quorum
+        is reached are cancelled (if not running yet) or ignored.
+        """
+        if not self.settings["quorum"]["active"]:
+            # Results are collected in order of submission, so locations keep order of settings
+            return {name: future.result() for name, future in futures.items()}, None
+
+        from concurrent.futures import FIRST_COMPLETED, wait
+
+        names = {future: name for name, future in futures.items()}
+        not_done = set(futures.values())
+        locations = {}
+        quorum = None
+
+        while not_done and quorum is None:
+            done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+            for future in done:
+                locations[names[future]] = future.result()
+            quorum = self._find_quorum(locations)
+
+        if not_done:
+            skipped = [names[future] for future in not_done]
+            logger.info("Quorum of %s reached for IP address %s. Skipped databases: %s", ", ".join(quorum), ip_address, ", ".join(skipped))
+            for future in not_done:
+                future.cancel()
+
+        return {name: locations[name] for name in futures if name in locations}, quorum
+
+    def _find_quorum(self, locations):
+        """Method returns names of databases whose locations agree as set in quorum settings or None."""
+        quorum_settings = self.settings["quorum"]
+        if not quorum_settings["active"]:
+            return None
+
+        answered = {name: location for name, location in locations.items() if location is not None}
+        if len(answered) < quorum_settings["min_locations"]:
+            return None
+        return find_quorum(answered, quorum_settings["min_locations"], quorum_settings["max_spread_km"])
+
+    def _lookup(self, name, connector, db_settings, ip_address):
+        """
+        Method returns location of IP address from one database.
+        Caches set as Active in settings are searched before the database is queried.
+        """
+        with profiling.span("database %s" % name):
+            location = self._lookup_cached(name, db_settings, ip_address)
+            if location is not None:
+                return location
+
+            location = connector.get_location(ip_address)
+            if location is not None:
+                self._store_cached(name, db_settings, ip_address, location)
+            return location
+
+    def _lookup_cached(self, name, db_settings, ip_address):
+        """
+        Method searches in-memory LRU cache, network prefix cache and persistent cache
+        (in this order) for location of IP address. Persistent cache is skipped for
+        databases with zero "cache_ttl". Location found in slower cache is stored into faster ones.
+        """
+        memory_cache = self._get_memory_cache()
+        if memory_cache is not None:
+            location = memory_cache.get(("location", name, ip_address))
+            self._metrics.record_cache("memory", location is not None)
+            if location is not None:
+                return location
+
+        prefix_cache = self._get_prefix_cache()
+        if prefix_cache is not None:
+            location = prefix_cache.get(name, ip_address, db_settings["prefix_length"])
+            self._metrics.record_cache("prefix", location is not None)
+            if location is not None:
+                logger.debug("Location of IP address %s from %s database found in network prefix cache.", ip_address, name)
+                if memory_cache is not None:
+                    memory_cache.set(("location", name, ip_address), location)
+                return location
+
+        cache = self._get_cache()
+        if cache is not None and db_settings["cache_ttl"]:
+            location = cache.get(name, ip_address, db_settings["cache_ttl"])
+            self._metrics.record_cache("persistent", location is not None)
+            if location is not None:
+                logger.debug("Location of IP address %s from %s database found in cache.", ip_address, name)
+                self._store_cached(name, db_settings, ip_address, location, persistent=False)
+                return location
+
+        return None
+
+    def _store_cached(self, name, db_settings, ip_address, location, persistent=True):
+        """Method stores location returned by database into caches set as Active in settings."""
+        if self._get_memory_cache() is not None:
+            self._memory_cache.set(("location", name, ip_address), location)
+
+        if self._get_prefix_cache() is not None:
+            self._prefix_cache.set(name, ip_address, location, db_settings["prefix_length"])
+
+        if persistent and self._get_cache() is not None and db_settings["cache_ttl"]:
+            self._cache.set(name, ip_address, location)
+
+    def _get_prefix_cache(self):
+        """Method returns cache of database responses by network prefix if it is set as Active in settings."""
+        if not self.settings["prefix_cache"]["active"]:
+            return None
+
+        if self._prefix_cache is None:
+            from ip2geotools_locator.caching.prefix import PrefixCache
+            prefix_settings = self.settings["prefix_cache"]
+            with self._cache_lock:
+                if self._prefix_cache is None:
+                    self._prefix_cache = PrefixCache(prefix_settings["max_entries"], prefix_settings["max_bytes"], prefix_settings["ttl"])
+
+        return self._prefix_cache
+
+    def _get_memory_cache(self):
+        """Method returns in-memory LRU cache of database responses if it is set as Active in settings."""
+        if not self.settings["memory_cache"]["active"]:
+            return None
+
+        if self._memory_cache is None:
+            from ip2geotools_locator.caching.memory import LRUCache
+            memory_settings = self.settings["memory_cache"]
+            with self._cache_lock:
+                if self._memory_cache is None:
+                    # Calculation cache is set first, so it exists whenever memory cache does
+                    self._calculation_cache = LRUCache(memory_settings["max_entries"], memory_settings["max_bytes"], memory_settings["ttl"])
+                    self._memory_cache = LRUCache(memory_settings["max_entries"], memory_settings["max_bytes"], memory_settings["ttl"])
+
+        return self._memory_cache
+
+    def get_cache_stats(self):
+        """Method returns counters of in-memory caches of database responses, network prefixes and calculations."""
+        stats = {}
+        if self._memory_cache is not None:
+            stats["locations"] = self._memory_cache.stats()
+            stats["calculations"] = self._calculation_cache.stats()
+        if self._prefix_cache is not None:
+            stats["prefixes"] = self._prefix_cache.stats()
+        return stats
+
+    def _get_cache(self):
+        """Method returns persistent cache if it is set as Active in settings."""
+        cache_settings = self.settings["cache"]
+
+        if not cache_settings["active"]:
+            return None
+
+        if self._cache is None or self._cache.file_path != cache_settings["db_file"]:
+            from ip2geotools_locator.caching.persistent import PersistentCache
+            with self._cache_lock:
+                if self._cache is None or self._cache.file_path != cache_settings["db_file"]:
+                    self._cache = PersistentCache(cache_settings["db_file"])
+
+        return self._cache
+
+    def purge_cache(self):
+        """Method deletes all records from persistent cache file. Returns number of deleted records."""
+        cache = self._cache
+        if cache is None or cache.file_path != self.settings["cache"]["db_file"]:
+            from ip2geotools_locator.caching.persistent import PersistentCache
+            cache = PersistentCache(self.settings["cache"]["db_file"])
+        return cache.purge()
+
+    def locate_many(self, ip_addresses, average=True, clustering=False, median=False, centroid=False, geometric_median=False):
+        """
+        Generator which locates every IP address of given iterable (list, file, generator, ...).
+        For each IP address LocationRecord(ip_address, locations, calculated_locations) is yielded
+        in order of input. calculated_locations is None if less than 2 databases returned location.
+
+        Database lookups of following IP addresses are submitted into thread pool before
+        previous IP address is finished, so pool sized by "jobs" setting is kept busy.
+        Only few IP addresses are held in memory at once. Locator state and map are not used.
+        """
+        pending = deque()
+
+        try:
+            for ip_address in ip_addresses:
+                connectors, databases = self._active_connectors()
+
+                if self.settings["jobs"] <= 1:
+                    # Serial mode, lookup is done right away
+                    yield self._location_record(ip_address, *self._query_connectors(connectors, databases, ip_address), average, clustering, median, centroid,
+                                                geometric_median)
+                    continue
+
+                executor = self._get_executor()
+                pending.append((ip_address, {name: executor.submit(self._lookup, name, connector, databases[name], ip_address)
+                                             for name, connector in connectors.items()}))
+
+                # Number of IP addresses in flight needed to keep all workers busy
+                window = self.settings["jobs"] // max(len(connectors), 1) + 1
+                while len(pending) > window:
+                    yield self._finish_pending(pending.popleft(), average, clustering, median, centroid, geometric_median)
+
+            while pending:
+                yield self._finish_pending(pending.popleft(), average, clustering, median, centroid, geometric_median)
+
+        finally:
+            # Generator closed before all IP addresses were processed
+            for _, futures in pending:
+                for future in futures.values():
+                    future.cancel()
+
+    def _finish_pending(self, pending_lookup, average, clustering, median, centroid, geometric_median):
+        """Method waits for submitted lookups of one IP address and returns LocationRecord."""
+        ip_address, futures = pending_lookup
+        return self._location_record(ip_address, *self._collect(ip_address, futures), average, clustering, median, centroid, geometric_median)
+
+    def _location_record(self, ip_address, locations, quorum, average, clustering, median, centroid, geometric_median):
+        """Method cleans None values from locations and runs calculations for them."""
+        locations = {key: value for key, value in locations.items() if value is not None}
+        logger.info("Database lookups of IP address %s returned %i locations.", ip_address, len(locations))
+
+        calculated_locations = None
+        if len(locations) >= 2:
+            calculated_locations = self._calculate_cached(locations, average, clustering, median, centroid, geometric_median)
+
+        return LocationRecord(ip_address, locations, calculated_locations, quorum)
+
+    def build_consensus(self, method=None):
+        """
+        Method compiles DB files of active local databases and calculates consensus location for
+        every range of IP addresses by given method (default from settings). Index is saved into
+        consensus index file and returned as RangeIndex.
+        Raises OSError or ValueError if DB file cannot be read.
+        """
+        # Range indices load numpy and readers of DB files
+        from ip2geotools_locator import range_index
+
+        consensus_settings = self.settings["consensus"]
+        indices = []
+
+        for db_type in DB_TYPES:
+            for db_name, db_settings in self.settings[db_type].items():
+                if db_settings["active"] and db_name in range_index.COMPILERS:
+                    indices.append(range_index.compile_database(db_name, db_settings["db_file"]))
+
+        if len(indices) < 2:
+            logger.warning("Consensus index is built from %i local database(s).", len(indices))
+
+        consensus = range_index.build_consensus(indices, method or consensus_settings["method"])
+        consensus.save(consensus_settings["index_file"])
+        return consensus
+
+    def get_consensus(self, ip_address):
+        """
+        Method returns IpLocation of precalculated consensus location of IP address from consensus
+        index file or None. Index is loaded once and reloaded when the file is replaced.
+        """
+        from ip2geotools_locator.range_index.index import RANGE_INDEX_READERS
+
+        try:
+            index = RANGE_INDEX_READERS.get(self.settings["consensus"]["index_file"])
+        except (OSError, ValueError, KeyError) as exception:
+            logger.error("Consensus index could not be loaded. %s: %s", exception.__class__.__name__, str(exception))
+            return None
+
+        try:
+            return index.get(ip_address)
+        except ValueError:
+            logger.error("IP address %s is not valid.", ip_address)
+            return None
+
+    def _get_executor(self):
+        """Method returns thread pool sized by "jobs" setting. Pool is created once and reused."""
+        jobs = self.settings["jobs"]
+
+        if self._executor is None or self._executor_jobs != jobs:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+            from concurrent.futures import ThreadPoolExecutor
+            logger.debug("Creating thread pool with %i workers.", jobs)
+            self._executor = ThreadPoolExecutor(max_workers=jobs)
+            self._executor_jobs = jobs
+
+        return self._executor
+
+    def close(self):
+        """Method shuts down worker threads of concurrent fetch mode and closes pooled HTTP connections."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            self._executor_jobs = None
+        if self._http_pool is not None:
+            from ip2geotools_locator import http_pool
+
+            http_pool.release(self._http_pool)
+            self._http_pool = None
+
+    def calculate(self, average=True, clustering=False, median=False, centroid=False, geometric_median=False):
         """
         Method for calculating more acurate location with statistical calculation
 
-        There are four available methods: Average (default method), Clustering, Confidence Interval
-        and Median. For multiple selected methods returns namedtuple list:
+        There are five available methods: Average (default method), Clustering, Median,
+        spherical Centroid, which is correct also for locations around antimeridian, and
+        Geometric median, which is robust against outlying locations.
+        For multiple selected methods returns namedtuple list:
         (Location.latitude, location.longitude).
         """
         logger.debug("Calculation started for %i DB entries.", len(self.locations))
-        calculated_locations = {}
-        f_map = FoliumMap()
 
         # No calculation if databases did not rethrieved data
         if len(self.locations) < 2:
             logger.error("Not enough locations to start calculation!")
             return None
 
-        # Calculate average of locations (default method)
-        if average:
-            logger.debug("Calculation of Averaged location is Active.")
-            # Get location from static method
-            location = Average.calculate(self.locations)
-            # Add marker
-            f_map.add_calculated_marker("Average", self.ip_address, location.latitude, location.longitude)
-            # Append calculated location into list
-            calculated_locations["Average"] = location
-
-        # Calculate location with SciPy Clustering
-        if clustering:
-            logger.debug("Calculation of location data cluster centroid is Active.")
-            location = Clustering.calculate(self.locations)
-            f_map.add_calculated_marker("Clustering", self.ip_address, location.latitude, location.longitude)
-            calculated_locations["Clustering"] = location
-
-        # Calculate Median from given locations
-        if median:
-            logger.debug("Calculation of Median from locations is Active.")
-            location = Median.calculate(self.locations)
-            f_map.add_calculated_marker("Median", self.ip_address, location.latitude, location.longitude)
-            calculated_locations["Median"] = location
+        calculated_locations = self._calculate_cached(self.locations, average, clustering, median, centroid, geometric_median)
 
         # Generate map file?
         if self.generate_map:
             logger.debug("Generating map file.")
+            f_map = FoliumMap()
+
+            # Add markers of calculated locations
+            for name, location in calculated_locations.items():
+                f_map.add_calculated_marker(name, self.ip_address, location.latitude, location.longitude)
 
             if len(calculated_locations) > 0:
                 # Create PolyLines for calculated locations
@@ -261,13 +578,86 @@ class Locator:
                 location = Location(self.locations[next(iter(self.locations))].latitude, self.locations[next(iter(self.locations))].longitude)
 
             # Generate map file
-            f_map.generate_map(location, self.map_file_name)
+            with profiling.span("map"):
+                f_map.generate_map(location, self.map_file_name)
 
-        if calculated_locations is not True:
+        if not calculated_locations:
             logger.warning("Calculations could not be finished due to invalid settings or bad data.")
         # Return calculated or uncalculated locations
         return calculated_locations
 
+    def _calculate_cached(self, locations, average, clustering, median, centroid, geometric_median):
+        """
+        Method returns calculated locations from in-memory cache if it is set as Active in settings.
+        Key is made of selected methods and coordinates, so IP addresses with the same
+        database responses share one calculation.
+        """
+        if self._get_memory_cache() is None:
+            return self.calculate_locations(locations, average, clustering, median, centroid, geometric_median)
+
+        key = (average, clustering, median, centroid, geometric_median, tuple((name, location.latitude, location.longitude) for name, location in locations.items()))
+        calculated_locations = self._calculation_cache.get(key)
+
+        if calculated_locations is None:
+            calculated_locations = self.calculate_locations(locations, average, clustering, median, centroid, geometric_median)
+            self._calculation_cache.set(key, calculated_locations)
+
+        # Copy, so cached dictionary cannot be changed by caller
+        return dict(calculated_locations)
+
+    @staticmethod
+    def calculate_locations(locations, average=True, clustering=False, median=False, centroid=False, geometric_median=False):
+        """
+        Static method runs selected calculation methods on given dictionary of locations.
+        It does not use Locator state nor map, so it can be called for many IP addresses at once.
+        Methods which could not produce location are left out of returned dictionary.
+        """
+        calculated_locations = {}
+
+        # Calculate average of locations (default method)
+        if average:
+            logger.debug("Calculation of Averaged location is Active.")
+            with profiling.span("calculation Average"):
+                calculated_locations["Average"] = Average.calculate(locations)
+
+        # Calculate centroid of the densest cluster of locations
+        if clustering:
+            logger.debug("Calculation of location data cluster centroid is Active.")
+            with profiling.span("calculation Clustering"):
+                calculated_locations["Clustering"] = Clustering.calculate(locations)
+
+        # Calculate Median from given locations
+        if median:
+            logger.debug("Calculation of Median from locations is Active.")
+            with profiling.span("calculation Median"):
+                calculated_locations["Median"] = Median.calculate(locations)
+
+        # Calculate spherical Centroid, which is correct also near antimeridian
+        if centroid:
+            logger.debug("Calculation of spherical Centroid of locations is Active.")
+            with profiling.span("calculation Centroid"):
+                calculated_locations["Centroid"] = Centroid.calculate(locations)
+
+        # Calculate Geometric median, which is robust against outlying locations
+        if geometric_median:
+            logger.debug("Calculation of Geometric median of locations is Active.")
+            with profiling.span("calculation GeometricMedian"):
+                calculated_locations["GeometricMedian"] = GeometricMedian.calculate(locations)
+
+        # Clean methods which have not returned location
+        return {key: value for key, value in calculated_locations.items() if isinstance(value, Location)}
+
+    @staticmethod
+    def calculate_many(locations_list, average=True, clustering=False, median=False, centroid=False, geometric_median=False):
+        """
+        Static method runs selected calculation methods for list of dictionaries of locations
+        (e.g. from LocationRecords) at once with vectorized calculations. Returns list of
+        dictionaries of calculated locations in the same form as calculate_locations().
+        IP addresses with less than 2 locations get empty dictionary.
+        """
+        with profiling.span("batch calculation"):
+            return BatchCalculation.from_locations(locations_list).calculate_locations(average, clustering, median, centroid, geometric_median)
+
     def get_locations(self):
         """Method returns dictionary of gathered location objects."""
         return self.locations
@@ -277,8 +667,9 @@ class Locator:
         return self.settings
 
     def set_settings(self, settings):
-        """Method returns loaded configuration in from of dictionary."""
+        """Method sets configuration. Connectors are created again from new settings."""
         self.settings = settings
+        self._connectors = {}
 
     def save_settings(self):
         """Method returns loaded configuration in from of dictionary."""
@@ -0,0 +1,157 @@
+"""Module for latency and outcome metrics of Geolocation databases"""
+import threading
+
+# Outcomes of database requests
+SUCCESS = "success"
+NOT_FOUND = "not_found"
+PERMISSION_REQUIRED = "permission_required"
+SERVICE_ERROR = "service_error"
+LIMIT_EXCEEDED = "limit_exceeded"
+INVALID_RESPONSE = "invalid_response"
+# Requests which were not sent or not finished
+CIRCUIT_OPEN = "circuit_open"
+RATE_LIMITED = "rate_limited"
+CANCELLED = "cancelled"
+OUTCOMES = (SUCCESS, NOT_FOUND, PERMISSION_REQUIRED, SERVICE_ERROR, LIMIT_EXCEEDED, INVALID_RESPONSE,
+            CIRCUIT_OPEN, RATE_LIMITED, CANCELLED)
+
+# Upper bounds of latency histogram buckets in seconds (local databases answer in microseconds)
+LATENCY_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PREFIX = "ip2geotools_locator"
+
+
+class Histogram:
+    """Class counting observed values in cumulative buckets in the same way as Prometheus histograms."""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        """Method adds value into all buckets whose upper bound is not lower than value."""
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, quantile):
+        """Method returns upper bound of bucket holding given quantile (None without values, inf above the last bucket)."""
+        if not self.count:
+            return None
+        rank = quantile * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= rank:
+                return bound
+        return float("inf")
+
+    def stats(self):
+        """Method returns dictionary of histogram counters."""
+        return {"count": self.count, "sum": self.sum, "buckets": dict(zip(self.buckets, self.counts)),
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99)}
+
+
+def _labels(**labels):
+    """Function formats Prometheus labels with escaped values."""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in labels.values())
+    return "{%s}" % ",".join("%s=\"%s\"" % (name, value) for name, value in zip(labels, escaped))
+
+
+def _number(value):
+    """Function formats number for Prometheus text exposition."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """
+    Class collecting metrics of one Locator: latency histogram and outcome counts of requests
+    of every database and hits and misses of every cache.
+
+    Metrics can be read by stats() as dictionary or by prometheus() in Prometheus text
+    exposition format. Counters are shared by all threads.
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Method sets all metrics to zero."""
+        with self._lock:
+            # database: Histogram of requests which were sent
+            self._latencies = {}
+            # database: {outcome: count}
+            self._outcomes = {}
+            # cache: [hits, misses]
+            self._caches = {}
+
+    def observe(self, database, outcome, seconds=None):
+        """Method records outcome of one request of database. Latency is given only for requests which were sent."""
+        with self._lock:
+            outcomes = self._outcomes.setdefault(database, dict.fromkeys(OUTCOMES, 0))
+            outcomes[outcome] += 1
+            if seconds is not None:
+                if database not in self._latencies:
+                    self._latencies[database] = Histogram(self.buckets)
+                self._latencies[database].observe(seconds)
+
+    def record_cache(self, cache, hit):
+        """Method records hit or miss of cache."""
+        with self._lock:
+            counts = self._caches.setdefault(cache, [0, 0])
+            counts[0 if hit else 1] += 1
+
+    def stats(self):
+        """
+        Method returns dictionary with "databases" (outcome counts, success rate and latency
+        histogram by database) and "caches" (hits, misses and hit rate by cache).
+        """
+        with self._lock:
+            databases = {}
+            for database, outcomes in self._outcomes.items():
+                answered = sum(count for outcome, count in outcomes.items() if outcome not in (CIRCUIT_OPEN, RATE_LIMITED, CANCELLED))
+                databases[database] = {
+                    "outcomes": dict(outcomes),
+                    "success_rate": outcomes[SUCCESS] / answered if answered else None,
+                    "latency": self._latencies[database].stats() if database in self._latencies else Histogram(self.buckets).stats(),
+                }
+
+            caches = {cache: {"hits": hits, "misses": misses, "hit_rate": hits / (hits + misses)}
+                      for cache, (hits, misses) in self._caches.items()}
+
+        return {"databases": databases, "caches": caches}
+
+    def prometheus(self):
+        """Method returns metrics in Prometheus text exposition format."""
+        lines = []
+
+        with self._lock:
+            name = PREFIX + "_database_request_duration_seconds"
+            lines.append("# HELP %s Latency of requests sent to Geolocation databases." % name)
+            lines.append("# TYPE %s histogram" % name)
+            for database, histogram in sorted(self._latencies.items()):
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append("%s_bucket%s %i" % (name, _labels(database=database, le=_number(bound)), count))
+                lines.append("%s_bucket%s %i" % (name, _labels(database=database, le="+Inf"), histogram.count))
+                lines.append("%s_sum%s %s" % (name, _labels(database=database), _number(histogram.sum)))
+                lines.append("%s_count%s %i" % (name, _labels(database=database), histogram.count))
+
+            name = PREFIX + "_database_requests_total"
+            lines.append("# HELP %s Requests of Geolocation databases by outcome." % name)
+            lines.append("# TYPE %s counter" % name)
+            for database, outcomes in sorted(self._outcomes.items()):
+                for outcome, count in outcomes.items():
+                    lines.append("%s%s %i" % (name, _labels(database=database, outcome=outcome), count))
+
+            name = PREFIX + "_cache_requests_total"
+            lines.append("# HELP %s Cache lookups of database responses by result." % name)
+            lines.append("# TYPE %s counter" % name)
+            for cache, (hits, misses) in sorted(self._caches.items()):
+                lines.append("%s%s %i" % (name, _labels(cache=cache, result="hit"), hits))
+                lines.append("%s%s %i" % (name, _labels(cache=cache, result="miss"), misses))
+
+        return "\n".join(lines) + "\n"
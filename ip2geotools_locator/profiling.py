@@ -0,0 +1,135 @@
+"""Module for timing phases of application run"""
+import contextlib
+import cProfile
+import threading
+import time
+
+from ip2geotools_locator.utils import LOGGER as logger
+
+# Start of package import, so time of imports can be reported
+IMPORT_STARTED = time.perf_counter()
+
+# Profiler collecting spans, set by install()
+_PROFILER = None
+
+
+class Profiler:
+    """
+    Class collecting timing spans of application phases (imports, database lookups,
+    calculations, map generation, ...). Spans with the same name are summed, so every
+    phase has number of calls, total, mean and maximal time.
+
+    Spans recorded in worker threads overlap, so sum of their totals can exceed wall time
+    of the run. Profiler can also run cProfile for the whole run and save pstats file.
+    Use it as context manager, which installs it for span() calls and uninstalls it at the end.
+    """
+    def __init__(self, cprofile=False):
+        self._lock = threading.Lock()
+        # name: [count, total, max]
+        self._spans = {}
+        self._cprofile = cProfile.Profile() if cprofile else None
+        self.started = None
+        self.stopped = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Method installs profiler and starts cProfile if it is enabled."""
+        self.started = time.perf_counter()
+        install(self)
+        if self._cprofile is not None:
+            self._cprofile.enable()
+
+    def stop(self):
+        """Method stops cProfile and uninstalls profiler."""
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        uninstall(self)
+        self.stopped = time.perf_counter()
+
+    def record(self, name, seconds):
+        """Method adds one span of given name."""
+        with self._lock:
+            span_stats = self._spans.setdefault(name, [0, 0.0, 0.0])
+            span_stats[0] += 1
+            span_stats[1] += seconds
+            span_stats[2] = max(span_stats[2], seconds)
+
+    def record_imports(self):
+        """
+        Method records time from start of package import until now as "imports" span.
+        Wall time of profiler then also starts at package import.
+        """
+        self.record("imports", time.perf_counter() - IMPORT_STARTED)
+        self.started = IMPORT_STARTED
+
+    def wall_time(self):
+        """Method returns seconds from start of profiler until stop (or now if it is running)."""
+        if self.started is None:
+            return 0.0
+        return (self.stopped if self.stopped is not None else time.perf_counter()) - self.started
+
+    def stats(self):
+        """Method returns dictionary of spans by name with count, total, mean and max seconds."""
+        with self._lock:
+            return {name: {"count": count, "total": total, "mean": total / count, "max": maximum}
+                    for name, (count, total, maximum) in self._spans.items()}
+
+    def report(self):
+        """Method returns table of spans sorted by total time."""
+        wall_time = self.wall_time()
+        spans = sorted(self.stats().items(), key=lambda item: item[1]["total"], reverse=True)
+        width = max([len(name) for name, _ in spans] + [5])
+
+        lines = ["%-*s %8s %11s %11s %11s %7s" % (width, "Phase", "Calls", "Total [ms]", "Mean [ms]", "Max [ms]", "Wall %")]
+        for name, span_stats in spans:
+            share = 100 * span_stats["total"] / wall_time if wall_time else 0.0
+            lines.append("%-*s %8i %11.3f %11.3f %11.3f %6.1f%%" % (width, name, span_stats["count"], 1000 * span_stats["total"],
+                                                                   1000 * span_stats["mean"], 1000 * span_stats["max"], share))
+        lines.append("%-*s %8s %11.3f" % (width, "wall time", "", 1000 * wall_time))
+        return "\n".join(lines)
+
+    def dump_stats(self, file_path):
+        """Method saves cProfile statistics into pstats file (readable by pstats or snakeviz)."""
+        if self._cprofile is None:
+            raise ValueError("cProfile is not enabled in profiler.")
+        self._cprofile.dump_stats(file_path)
+        logger.info("Profile statistics are saved into %s file.", file_path)
+
+
+def install(profiler):
+    """Function sets profiler which collects spans of all threads."""
+    global _PROFILER
+    _PROFILER = profiler
+
+
+def uninstall(profiler=None):
+    """Function removes installed profiler (only given profiler if it is not None)."""
+    global _PROFILER
+    if profiler is None or _PROFILER is profiler:
+        _PROFILER = None
+
+
+def installed_profiler():
+    """Function returns installed profiler or None."""
+    return _PROFILER
+
+
+@contextlib.contextmanager
+def span(name):
+    """Context manager timing block of code as span of given name, if profiler is installed."""
+    profiler = _PROFILER
+    if profiler is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record(name, time.perf_counter() - started)
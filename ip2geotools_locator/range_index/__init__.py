@@ -0,0 +1,4 @@
+"""Modules for compiled range indices of local Geolocation databases"""
+from ip2geotools_locator.range_index.compilers import COMPILERS, compile_database
+from ip2geotools_locator.range_index.consensus import METHODS, build_consensus
+from ip2geotools_locator.range_index.index import RangeIndex, ip_numbers
@@ -0,0 +1,54 @@
+"""Module for compiling local database files into range indices"""
+import maxminddb
+
+from ip2geotools_locator.database_connectors.readers import Ip2LocationReader, record_text
+from ip2geotools_locator.range_index.index import RangeIndex
+from ip2geotools_locator.utils import LOGGER as logger
+
+
+def mmdb_ranges(file_path):
+    """Generator yields ranges of MaxMind DB file in format of RangeIndex.from_ranges()."""
+    with maxminddb.open_database(file_path) as reader:
+        for network, record in reader:
+            if not isinstance(record, dict):
+                continue
+
+            location = record.get("location", {})
+            subdivisions = record.get("subdivisions")
+            yield (network.version, int(network.network_address), int(network.broadcast_address),
+                   record.get("country", {}).get("iso_code"),
+                   subdivisions[0].get("names", {}).get("en") if subdivisions else None,
+                   record.get("city", {}).get("names", {}).get("en"),
+                   location.get("latitude"), location.get("longitude"))
+
+
+def ip2location_ranges(file_path):
+    """Generator yields ranges of IP2Location BIN file in format of RangeIndex.from_ranges(). Unknown ranges are skipped."""
+    reader = Ip2LocationReader(file_path)
+    try:
+        for version, first, last, record in reader.ranges():
+            if record_text(record.country_short) is None:
+                continue
+
+            latitude = float(record.latitude) if record_text(record.latitude) is not None else None
+            longitude = float(record.longitude) if record_text(record.longitude) is not None else None
+            yield (version, first, last, record_text(record.country_short), record_text(record.region),
+                   record_text(record.city), latitude, longitude)
+    finally:
+        reader.close()
+
+
+# Range readers of local databases by name used in settings
+COMPILERS = {
+    "max_mind_lite": mmdb_ranges,
+    "ip2location": ip2location_ranges,
+}
+
+
+def compile_database(db_name, file_path):
+    """
+    Function compiles DB file of local database into RangeIndex.
+    Raises KeyError for database which is not local and OSError or ValueError for unreadable file.
+    """
+    logger.info("Compiling range index of database %s from %s.", db_name, file_path)
+    return RangeIndex.from_ranges(COMPILERS[db_name](file_path))
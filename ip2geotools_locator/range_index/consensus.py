@@ -0,0 +1,86 @@
+"""Module for building consensus range index from range indices of local databases"""
+import numpy
+
+from ip2geotools_locator.calculations.batch import METHODS, BatchCalculation
+from ip2geotools_locator.range_index.index import COLUMNS, KEY_TYPES, RangeIndex
+from ip2geotools_locator.utils import LOGGER as logger
+
+
+def _sub_ranges(tables, version):
+    """Function returns starts and ends of sub-ranges split by boundaries of all ranges in tables."""
+    max_key = numpy.iinfo(KEY_TYPES[version]).max
+    ends = numpy.concatenate([table["ends"] for table in tables])
+
+    boundaries = numpy.unique(numpy.concatenate([table["starts"] for table in tables] + [ends[ends < max_key] + 1]))
+    sub_ends = numpy.append(boundaries[1:] - 1, KEY_TYPES[version](max_key))[:len(boundaries)]
+    return boundaries.astype(KEY_TYPES[version]), sub_ends.astype(KEY_TYPES[version])
+
+
+def build_consensus(indices, method="Average", min_locations=2):
+    """
+    Function builds RangeIndex of consensus locations from range indices of local databases.
+
+    Range boundaries of all indices split IP address space into sub-ranges, in which every
+    database returns one location. Consensus location of every sub-range with at least
+    min_locations locations is calculated once by given method (Average, Median,
+    Clustering, Centroid or GeometricMedian). Names are taken from the first index which covers sub-range. Neighbouring
+    sub-ranges with the same result are merged.
+    """
+    if method not in METHODS:
+        raise ValueError("Unknown calculation method %s." % method)
+
+    indices = list(indices)
+    names = [""]
+    name_ids = {"": 0}
+
+    def intern(name):
+        if name not in name_ids:
+            name_ids[name] = len(names)
+            names.append(name)
+        return name_ids[name]
+
+    # Name ids of every index mapped into ids of consensus index
+    remaps = [numpy.array([intern(name) for name in index.names], dtype=numpy.int32) for index in indices]
+    tables = {}
+
+    for version in KEY_TYPES:
+        version_tables = [index.tables[version] for index in indices]
+        starts, ends = _sub_ranges(version_tables, version)
+
+        latitudes = numpy.full((len(starts), len(indices)), numpy.nan)
+        longitudes = numpy.full((len(starts), len(indices)), numpy.nan)
+        name_columns = {column: numpy.zeros(len(starts), dtype=numpy.int32) for column in ("countries", "regions", "cities")}
+
+        # The first index covering sub-range provides names, so indices are walked in reverse
+        for position in reversed(range(len(indices))):
+            table = version_tables[position]
+            rows = indices[position].lookup(starts, version)
+            found = rows >= 0
+
+            latitudes[found, position] = table["latitudes"][rows[found]]
+            longitudes[found, position] = table["longitudes"][rows[found]]
+            for column, ids in name_columns.items():
+                ids[found] = remaps[position][table[column][rows[found]]]
+
+        # Only sub-ranges with enough locations get consensus
+        consensus_latitudes, consensus_longitudes = BatchCalculation(latitudes, longitudes).calculate(method, min_locations)
+        columns = {"starts": starts, "ends": ends, "latitudes": consensus_latitudes, "longitudes": consensus_longitudes}
+        columns.update(name_columns)
+
+        # Sub-ranges without result of calculation are dropped
+        calculated = ~numpy.isnan(columns["latitudes"])
+        columns = {column: values[calculated] for column, values in columns.items()}
+
+        # Merge neighbouring sub-ranges with the same result
+        first = numpy.ones(len(columns["starts"]), dtype=bool)
+        first[1:] = columns["starts"][1:] != columns["ends"][:-1] + 1
+        for column in COLUMNS[2:]:
+            first[1:] |= columns[column][1:] != columns[column][:-1]
+        last = numpy.append(numpy.flatnonzero(first)[1:] - 1, len(first) - 1)[:numpy.count_nonzero(first)]
+
+        tables[version] = {column: values[first] for column, values in columns.items()}
+        tables[version]["ends"] = columns["ends"][last.astype(numpy.intp)]
+
+    consensus = RangeIndex(tables, names)
+    logger.info("Consensus index of %i databases calculated by %s method has %i ranges.", len(indices), method, len(consensus))
+    return consensus
@@ -0,0 +1,160 @@
+"""Module for compiled range index of local Geolocation database"""
+import ipaddress
+import socket
+
+import numpy
+from ip2geotools.models import IpLocation
+
+from ip2geotools_locator.database_connectors.readers import FileReaders
+from ip2geotools_locator.utils import LOGGER as logger
+
+# Keys of IPv4 ranges are whole addresses, keys of IPv6 ranges are their upper 64 bits
+KEY_TYPES = {4: numpy.uint32, 6: numpy.uint64}
+# Bigger arrays of IP numbers are sorted before lookup
+SORTED_LOOKUP_SIZE = 4096
+COLUMNS = ("starts", "ends", "latitudes", "longitudes", "countries", "regions", "cities")
+
+
+def ip_key(ip_address):
+    """Function returns integer key of IP address (IPv6 addresses are reduced to upper 64 bits)."""
+    address = ipaddress.ip_address(ip_address)
+    return address.version, int(address) if address.version == 4 else int(address) >> 64
+
+
+def ip_numbers(ip_addresses):
+    """
+    Function converts iterable of IPv4 address strings into numpy array of integers for
+    RangeIndex.lookup(). Raises OSError for invalid address.
+    """
+    packed = b"".join(socket.inet_aton(ip_address) for ip_address in ip_addresses)
+    return numpy.frombuffer(packed, dtype=">u4").astype(numpy.uint32)
+
+
+class RangeIndex:
+    """
+    Class holding ranges of IP addresses from local database in sorted numpy arrays.
+
+    Every IP version has arrays of range starts, range ends (inclusive), latitudes, longitudes
+    and ids of country, region and city names. Names are interned in one list (id 0 means
+    no name). Many IP addresses are resolved by one numpy.searchsorted() call. IPv6 ranges
+    are keyed by upper 64 bits, which is the longest prefix used by Geolocation databases.
+    """
+    def __init__(self, tables, names):
+        # version: dictionary of COLUMNS arrays
+        self.tables = tables
+        self.names = names
+
+    def __len__(self):
+        return sum(len(table["starts"]) for table in self.tables.values())
+
+    @classmethod
+    def from_ranges(cls, ranges):
+        """
+        Method builds index from iterable of tuples
+        (version, first IP number, last IP number, country, region, city, latitude, longitude).
+        Ranges must not overlap. Of ranges with the same start (IPv6 networks longer than /64)
+        only the first one is kept.
+        """
+        names = [""]
+        name_ids = {None: 0, "": 0}
+        rows = {4: [], 6: []}
+
+        def intern(name):
+            if name not in name_ids:
+                name_ids[name] = len(names)
+                names.append(name)
+            return name_ids[name]
+
+        for version, first, last, country, region, city, latitude, longitude in ranges:
+            if version == 6:
+                first, last = first >> 64, last >> 64
+            rows[version].append((first, last, numpy.nan if latitude is None else latitude,
+                                  numpy.nan if longitude is None else longitude,
+                                  intern(country), intern(region), intern(city)))
+
+        tables = {}
+        for version, version_rows in rows.items():
+            version_rows.sort()
+            version_rows = [row for i, row in enumerate(version_rows) if i == 0 or row[0] != version_rows[i - 1][0]]
+            columns = list(zip(*version_rows)) or [()] * len(COLUMNS)
+            tables[version] = {
+                "starts": numpy.array(columns[0], dtype=KEY_TYPES[version]),
+                "ends": numpy.array(columns[1], dtype=KEY_TYPES[version]),
+                "latitudes": numpy.array(columns[2], dtype=numpy.float64),
+                "longitudes": numpy.array(columns[3], dtype=numpy.float64),
+                "countries": numpy.array(columns[4], dtype=numpy.int32),
+                "regions": numpy.array(columns[5], dtype=numpy.int32),
+                "cities": numpy.array(columns[6], dtype=numpy.int32),
+            }
+
+        index = cls(tables, names)
+        logger.info("Range index built from %i IPv4 and %i IPv6 ranges.", len(tables[4]["starts"]), len(tables[6]["starts"]))
+        return index
+
+    def lookup(self, numbers, version=4):
+        """
+        Method returns array of record indices for one-dimensional array of IP numbers
+        (see ip_numbers()), -1 for IP addresses outside of all ranges.
+        """
+        table = self.tables[version]
+        keys = numpy.asarray(numbers, dtype=KEY_TYPES[version])
+
+        if len(keys) > SORTED_LOOKUP_SIZE:
+            # Binary search of sorted keys hits cached pages, which outweighs sorting
+            order = numpy.argsort(keys)
+            indices = numpy.empty(len(keys), dtype=numpy.intp)
+            indices[order] = numpy.searchsorted(table["starts"], keys[order], side="right") - 1
+        else:
+            indices = numpy.searchsorted(table["starts"], keys, side="right") - 1
+
+        found = indices >= 0
+        found[found] = keys[found] <= table["ends"][indices[found]]
+        indices[~found] = -1
+        return indices
+
+    def locations(self, numbers, version=4):
+        """Method returns arrays of latitudes and longitudes of IP numbers, NaN for IP addresses not found."""
+        table = self.tables[version]
+        indices = self.lookup(numbers, version)
+        found = indices >= 0
+
+        latitudes = numpy.full(indices.shape, numpy.nan)
+        longitudes = numpy.full(indices.shape, numpy.nan)
+        latitudes[found] = table["latitudes"][indices[found]]
+        longitudes[found] = table["longitudes"][indices[found]]
+        return latitudes, longitudes
+
+    def get(self, ip_address):
+        """Method returns IpLocation of one IP address or None."""
+        version, key = ip_key(ip_address)
+        index = self.lookup([key], version)[0]
+        if index < 0:
+            return None
+
+        table = self.tables[version]
+        latitude = float(table["latitudes"][index])
+        longitude = float(table["longitudes"][index])
+        return IpLocation(ip_address, self.names[table["cities"][index]] or None, self.names[table["regions"][index]] or None,
+                          self.names[table["countries"][index]] or None,
+                          None if numpy.isnan(latitude) else latitude, None if numpy.isnan(longitude) else longitude)
+
+    def save(self, file_path):
+        """Method saves index into numpy .npz file."""
+        arrays = {"ipv%i_%s" % (version, column): array for version, table in self.tables.items() for column, array in table.items()}
+        numpy.savez(file_path, names=numpy.array(self.names, dtype=str), **arrays)
+        logger.info("Range index with %i ranges saved into %s.", len(self), file_path)
+
+    def close(self):
+        """Index is held in memory, there is nothing to close."""
+
+    @classmethod
+    def load(cls, file_path):
+        """Method loads index saved by save()."""
+        with numpy.load(file_path, allow_pickle=False) as arrays:
+            tables = {version: {column: arrays["ipv%i_%s" % (version, column)] for column in COLUMNS} for version in KEY_TYPES}
+            names = arrays["names"].tolist()
+        return cls(tables, names)
+
+
+# Loaded index files
+RANGE_INDEX_READERS = FileReaders(lambda file_path, mode: RangeIndex.load(file_path))
@@ -0,0 +1,3 @@
+"""Modules for throttling requests sent to Geolocation databases"""
+from ip2geotools_locator.throttling.circuit_breaker import CircuitBreaker
+from ip2geotools_locator.throttling.rate_limit import RateLimiter
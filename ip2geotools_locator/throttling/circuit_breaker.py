@@ -0,0 +1,94 @@
+"""Module for skipping Geolocation databases which are failing"""
+import threading
+import time
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one database shared by all lookups.
+
+    Breaker opens after failure_threshold consecutive failures (ServiceError, which includes
+    timeouts) and requests are not sent while it is open. After reset_timeout seconds it is
+    half-open and lets through at most half_open_probes requests. Successful probe closes
+    breaker, failed probe opens it again. Answers like IpAddressNotFoundError mean that
+    service works, so they count as success.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=60.0, half_open_probes=1, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._probes = 0
+        self.times_opened = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_settings(cls, breaker_settings):
+        """Method creates breaker from "circuit_breaker" settings. Returns None if breaker is not active."""
+        if not breaker_settings or not breaker_settings.get("active"):
+            return None
+        return cls(breaker_settings.get("failure_threshold", 5), breaker_settings.get("reset_timeout", 60.0),
+                   breaker_settings.get("half_open_probes", 1))
+
+    def settings(self):
+        """Method returns settings of breaker in the same form as in settings.json."""
+        return {"active": True, "failure_threshold": self.failure_threshold, "reset_timeout": self.reset_timeout,
+                "half_open_probes": self.half_open_probes}
+
+    def allow(self):
+        """Method returns True if request can be sent. Allowed request must be followed by record_* or cancel call."""
+        with self._lock:
+            if self.state == OPEN:
+                if self._clock() - self.opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probes = 0
+
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self.rejected += 1
+                    return False
+                self._probes += 1
+
+            return True
+
+    def record_success(self):
+        """Method records answer of database. Breaker is closed."""
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self._probes = 0
+
+    def record_failure(self):
+        """Method records failed request. Breaker is opened after too many failures or failed probe."""
+        with self._lock:
+            self.failures += 1
+
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = self._clock()
+                self._probes = 0
+
+    def cancel(self):
+        """Method releases allowed request which was not sent."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def stats(self):
+        """Method returns dictionary of breaker state and counters."""
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "times_opened": self.times_opened, "rejected": self.rejected}
@@ -0,0 +1,149 @@
+"""Module for limiting rate of requests sent to Geolocation databases"""
+import datetime
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket with daily quota of requests sent to one database.
+
+    Bucket holds up to burst tokens and is refilled by per_second tokens every second.
+    Request which does not find token waits for it at most max_delay seconds, otherwise
+    it is rejected, so other databases answer for the IP address. Daily quota is counted
+    in local time. When database reports LimitExceededError, configured daily quota is
+    exhausted, otherwise requests are rejected for cool_down seconds.
+    Zero per_second or daily_quota means no limit.
+
+    Used daily quota is counted only by this process, unless quota_store is set. It is called
+    as quota_store(day, requests, exhausted) for every counted request and exhausted quota,
+    adds them to quota shared with other processes and returns its (used, exhausted) or None
+    on failure (see PersistentCache.add_quota()).
+    """
+    def __init__(self, per_second=0, burst=1, daily_quota=0, max_delay=1.0, cool_down=60.0, clock=time.monotonic, today=datetime.date.today,
+                 quota_store=None):
+        self.per_second = per_second
+        self.burst = max(burst, 1)
+        self.daily_quota = daily_quota
+        self.max_delay = max_delay
+        self.cool_down = cool_down
+
+        self._clock = clock
+        self._today = today
+        self._lock = threading.Lock()
+        self.quota_store = quota_store
+
+        # Tokens fall below zero when requests wait for future tokens
+        self._tokens = float(self.burst)
+        self._refilled_at = clock()
+        self._cooling_until = None
+        self._day = today()
+        self.used_today = 0
+        self.exhausted = False
+        self.delayed = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_settings(cls, rate_limit):
+        """Method creates limiter from "rate_limit" settings of database (missing settings mean no limit)."""
+        rate_limit = rate_limit or {}
+        return cls(rate_limit.get("per_second", 0), rate_limit.get("burst", 1), rate_limit.get("daily_quota", 0),
+                   rate_limit.get("max_delay", 1.0), rate_limit.get("cool_down", 60.0))
+
+    def settings(self):
+        """Method returns settings of limiter in the same form as in settings.json."""
+        return {"per_second": self.per_second, "burst": self.burst, "daily_quota": self.daily_quota, "max_delay": self.max_delay,
+                "cool_down": self.cool_down}
+
+    def reserve(self):
+        """
+        Method takes token for one request. Returns number of seconds the request must wait
+        for its token (0 for token available now) or None if request is rejected.
+        """
+        with self._lock:
+            self._start_day()
+
+            if self.exhausted or (self.daily_quota and self.used_today >= self.daily_quota):
+                self.exhausted = True
+                self.rejected += 1
+                return None
+
+            now = self._clock()
+            if self._cooling_until is not None:
+                if now < self._cooling_until:
+                    self.rejected += 1
+                    return None
+                self._cooling_until = None
+
+            wait = 0.0
+            if self.per_second:
+                self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.per_second)
+                self._refilled_at = now
+
+                if self._tokens < 1:
+                    wait = (1 - self._tokens) / self.per_second
+                    if wait > self.max_delay:
+                        self.rejected += 1
+                        return None
+                    self.delayed += 1
+                self._tokens -= 1
+
+            self.used_today += 1
+            if self._store_quota(1, False) and (self.exhausted or self.used_today > self.daily_quota):
+                # Other processes have used up the rest of quota
+                self.exhausted = True
+                self.rejected += 1
+                return None
+            return wait
+
+    def _start_day(self):
+        """Method resets used quota when new day starts. Called with lock held."""
+        today = self._today()
+        if today != self._day:
+            self._day = today
+            self.used_today = 0
+            self.exhausted = False
+
+    def _store_quota(self, requests, exhausted):
+        """
+        Method adds requests and exhausted flag to daily quota shared by quota_store and takes
+        used quota of all processes from it. Returns False if quota is counted by this process only.
+        """
+        if not self.daily_quota or self.quota_store is None:
+            return False
+
+        stored = self.quota_store(self._day.isoformat(), requests, exhausted)
+        if stored is None:
+            return False
+
+        self.used_today, stored_exhausted = stored
+        self.exhausted = self.exhausted or stored_exhausted
+        return True
+
+    def exhaust(self):
+        """Method rejects all requests until the end of day, because daily quota of database is used up."""
+        with self._lock:
+            self._start_day()
+            self.exhausted = True
+            self._store_quota(0, True)
+
+    def limit_exceeded(self):
+        """
+        Method handles LimitExceededError reported by database. Database with daily quota has used
+        it up, so quota is exhausted. Otherwise requests are rejected for cool_down seconds and token
+        bucket is drained, so requests after cool-down start with no burst.
+        """
+        if self.daily_quota:
+            self.exhaust()
+            return
+
+        with self._lock:
+            self._cooling_until = self._clock() + self.cool_down
+            self._tokens = min(self._tokens, 0.0)
+            self._refilled_at = self._cooling_until
+
+    def stats(self):
+        """Method returns dictionary of limiter counters."""
+        with self._lock:
+            return {"used_today": self.used_today, "daily_quota": self.daily_quota, "exhausted": self.exhausted,
+                    "delayed": self.delayed, "rejected": self.rejected}
@@ -1,5 +1,6 @@
 """Things used across aplication"""
 import logging
+import math
 from collections import namedtuple
 
 LOG_FORMAT = "%(asctime)s %(levelname)s - %(module)s: %(message)s"
@@ -12,12 +13,72 @@ LOGGER = logging.getLogger()
 # Location is stored as namedtuple
 Location = namedtuple('Location', 'latitude longitude')
 
+# Result of batch lookup for one IP address, quorum holds names of agreeing databases in quorum mode
+LocationRecord = namedtuple('LocationRecord', 'ip_address locations calculated_locations quorum')
+# quorum is optional; namedtuple(defaults=...) needs Python 3.7
+LocationRecord.__new__.__defaults__ = (None,)
+
+# Mean radius of Earth in kilometres
+EARTH_RADIUS_KM = 6371.0088
+
+# Types of databases in settings, every other top level key is application setting
+DB_TYPES = ("noncommercial", "commercial")
+
 # Default application settings
 DEFAULT_SETTINGS = """
 {
+    "jobs": 1,
+    "cache": {
+        "active": false,
+        "db_file": "ip2geotools_locator_cache.sqlite3"
+    },
+    "memory_cache": {
+        "active": false,
+        "max_entries": 100000,
+        "max_bytes": 67108864,
+        "ttl": 3600
+    },
+    "prefix_cache": {
+        "active": false,
+        "max_entries": 100000,
+        "max_bytes": 67108864,
+        "ttl": 3600
+    },
+    "http": {
+        "pool_size": 10,
+        "connect_timeout": 10,
+        "read_timeout": 62
+    },
+    "circuit_breaker": {
+        "active": true,
+        "failure_threshold": 5,
+        "reset_timeout": 60,
+        "half_open_probes": 1
+    },
+    "quorum": {
+        "active": false,
+        "min_locations": 3,
+        "max_spread_km": 25
+    },
+    "consensus": {
+        "index_file": "ip2geotools_locator_consensus.npz",
+        "method": "Average"
+    },
     "noncommercial": {
         "ip_city": {
             "active": true,
+            "cache_ttl": 86400,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": true,
             "api_key": null,
             "db_file": null,
@@ -26,6 +87,18 @@ DEFAULT_SETTINGS = """
         },
         "host_ip": {
             "active": true,
+            "cache_ttl": 86400,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": true,
             "api_key": null,
             "db_file": null,
@@ -34,14 +107,39 @@ DEFAULT_SETTINGS = """
         },
         "ip2location": {
             "active": false,
+            "cache_ttl": 0,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": false,
             "api_key": null,
             "db_file": "",
+            "reader_mode": "mmap",
             "login": null,
             "password": null
         },
         "ipstack": {
             "active": false,
+            "cache_ttl": 86400,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": false,
             "api_key": "",
             "db_file": null,
@@ -50,6 +148,18 @@ DEFAULT_SETTINGS = """
         },
         "max_mind_lite": {
             "active": false,
+            "cache_ttl": 0,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": false,
             "api_key": null,
             "db_file": "",
@@ -60,6 +170,18 @@ DEFAULT_SETTINGS = """
     "commercial": {
         "eurek": {
             "active": false,
+            "cache_ttl": 86400,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": false,
             "api_key": null,
             "db_file": null,
@@ -68,6 +190,18 @@ DEFAULT_SETTINGS = """
         },
         "geobytes_city": {
             "active": true,
+            "cache_ttl": 86400,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 4,
+                "burst": 4,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": true,
             "api_key": null,
             "db_file": null,
@@ -76,6 +210,18 @@ DEFAULT_SETTINGS = """
         },
         "ip_info": {
             "active": false,
+            "cache_ttl": 86400,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 1600,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": false,
             "api_key": "",
             "db_file": null,
@@ -84,6 +230,18 @@ DEFAULT_SETTINGS = """
         },
         "ip_web": {
             "active": true,
+            "cache_ttl": 86400,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": true,
             "api_key": null,
             "db_file": null,
@@ -92,6 +250,18 @@ DEFAULT_SETTINGS = """
         },
         "ip2location_web": {
             "active": false,
+            "cache_ttl": 86400,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": false,
             "api_key": null,
             "db_file": null,
@@ -100,6 +270,18 @@ DEFAULT_SETTINGS = """
         },
         "max_mind": {
             "active": true,
+            "cache_ttl": 86400,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": true,
             "api_key": null,
             "db_file": null,
@@ -108,6 +290,18 @@ DEFAULT_SETTINGS = """
         },
         "neustar_web": {
             "active": true,
+            "cache_ttl": 86400,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": true,
             "api_key": null,
             "db_file": null,
@@ -116,6 +310,18 @@ DEFAULT_SETTINGS = """
         },
         "skyhook": {
             "active": false,
+            "cache_ttl": 86400,
+            "prefix_length": {
+                "ipv4": 24,
+                "ipv6": 48
+            },
+            "rate_limit": {
+                "per_second": 0,
+                "burst": 1,
+                "daily_quota": 0,
+                "max_delay": 1,
+                "cool_down": 60
+            },
             "generate_marker": false,
             "api_key": null,
             "db_file": null,
@@ -124,4 +330,48 @@ DEFAULT_SETTINGS = """
         }
     }
 }
-"""
\ No newline at end of file
+"""
+
+def merge_settings(defaults, settings):
+    """
+    Fill keys missing in loaded settings (e.g. settings.json from older version)
+    with default values. Loaded values always take precedence.
+    """
+    merged = dict(defaults)
+    for key, value in settings.items():
+        if isinstance(value, dict) and isinstance(defaults.get(key), dict):
+            merged[key] = merge_settings(defaults[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def haversine(location_a, location_b):
+    """Function returns great-circle distance of two locations in kilometres."""
+    latitude_a, latitude_b = math.radians(location_a.latitude), math.radians(location_b.latitude)
+    delta_latitude = latitude_b - latitude_a
+    delta_longitude = math.radians(location_b.longitude - location_a.longitude)
+
+    value = math.sin(delta_latitude / 2) ** 2 + math.cos(latitude_a) * math.cos(latitude_b) * math.sin(delta_longitude / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(value)))
+
+
+def find_quorum(locations, min_locations, max_spread_km):
+    """
+    Function returns list of names of at least min_locations locations which are all within
+    max_spread_km kilometres from each other, or None. Locations is dictionary of locations
+    by database name.
+    """
+    names = list(locations)
+
+    for center in names:
+        distances = {name: haversine(locations[center], locations[name]) for name in names}
+        members = sorted((name for name in names if distances[name] <= max_spread_km), key=distances.get)
+
+        # The farthest members are dropped until all pairs agree
+        while len(members) >= min_locations:
+            if all(haversine(locations[a], locations[b]) <= max_spread_km for i, a in enumerate(members) for b in members[i + 1:]):
+                return members
+            members.pop()
+
+    return None
@@ -13,13 +13,21 @@ with open('HISTORY.rst') as history_file:
 
 requirements = ['Click>=6.0',
                 'folium>=0.6.0',
+                'geoip2>=2.9.0',
                 'geopy>=1.17.0',
                 'ip2geotools>=0.1.4',
+                # Ip2LocationReader uses private attributes of IP2Location class (see readers.py)
+                'IP2Location==8.11.0',
                 'kneed>=0.2.4',
+                'maxminddb>=2.0.0',
+                'numpy>=1.16.0',
+                'requests>=2.20.0',
                 'scipy>=1.1.0',
                 'sklearn>=0.0'
                 ]
 
+extras_requirements = {'async': ['aiohttp>=3.5.0']}
+
 setup_requirements = None
 
 test_requirements = None
@@ -32,8 +40,6 @@ setup(
                  'License :: OSI Approved :: MIT License',
                  'Natural Language :: English',
                  'Programming Language :: Python :: 3',
-                 'Programming Language :: Python :: 3.4',
-                 'Programming Language :: Python :: 3.5',
                  'Programming Language :: Python :: 3.6',
                  'Programming Language :: Python :: 3.7',
                 ],
@@ -42,12 +48,14 @@ setup(
                 methods.""",
     entry_points={'console_scripts': ['ip2geotools-locator=ip2geotools_locator.cli:cmd']},
     install_requires=requirements,
+    extras_require=extras_requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
     keywords='ip2geotools-locator',
     name='ip2geotools-locator',
     packages=find_packages(exclude=['contrib', 'docs', 'tests*']),
+    python_requires='>=3.6',
     setup_requires=setup_requirements,
     test_suite='tests',
     tests_require=test_requirements,
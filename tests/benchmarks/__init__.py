@@ -0,0 +1,6 @@
+"""
+Benchmarks of `ip2geotools_locator` package.
+
+Benchmarks are not collected by test runners. Run them as modules, e.g.
+python -m tests.benchmarks.throughput --output results.json
+"""
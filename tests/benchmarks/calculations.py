@@ -0,0 +1,185 @@
+"""
+Micro-benchmark of calculation methods.
+
+Every method is called with dictionaries of locations of given sizes and outlier patterns.
+Time of every call is measured separately, so mean, p50, p95 and p99 time per call are
+reported. Memory allocated by one call (peak of memory traced during the call) is measured
+by tracemalloc in separate calls, because tracing slows calculations down.
+
+Batch scenario calculates every method by BatchCalculation for many IP addresses at once,
+with rows of all selected patterns mixed and the largest size of locations. Time per row is
+reported together with ratio to Clustering, which is checked against BATCH_TARGETS.
+
+python -m tests.benchmarks.calculations --sizes 3,8,13 --patterns tight,outlier --output results.json
+python -m tests.benchmarks.calculations --batch-rows 1000000 --repeat 3
+"""
+import itertools
+import logging
+import os
+import random
+import time
+import tracemalloc
+
+import click
+
+from ip2geotools_locator.calculations import Average, BatchCalculation, Centroid, Clustering, GeometricMedian, Median
+from ip2geotools_locator.utils import Location
+from tests.benchmarks.common import compare_results, percentiles, save_results
+
+# Benchmarked calculation methods by name
+METHODS = {"Average": Average.calculate, "Median": Median.calculate, "Centroid": Centroid.calculate, "Clustering": Clustering.calculate,
+           "GeometricMedian": GeometricMedian.calculate}
+# Targets of batch time relative to Clustering; geometric median makes several Weiszfeld iterations
+# over all locations, which is at most half as much again as pairwise distances of Clustering
+BATCH_TARGETS = {"GeometricMedian": 1.5}
+
+
+def tight(rng, size):
+    """All databases answer within few kilometers of Brno."""
+    return [(49.19 + rng.gauss(0, 0.02), 16.61 + rng.gauss(0, 0.02)) for _ in range(size)]
+
+
+def outlier(rng, size):
+    """One database answers with location in other country."""
+    return tight(rng, size - 1) + [(50.08 + rng.gauss(0, 0.02), 14.44 + rng.gauss(0, 0.02))]
+
+
+def split(rng, size):
+    """Databases are split into two groups far from each other (ISP headquarters and real location)."""
+    return tight(rng, size - size // 2) + [(52.52 + rng.gauss(0, 0.02), 13.40 + rng.gauss(0, 0.02)) for _ in range(size // 2)]
+
+
+def scattered(rng, size):
+    """Databases answer with random locations all over the world."""
+    return [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(size)]
+
+
+# Generators of coordinates by outlier pattern
+PATTERNS = {"tight": tight, "outlier": outlier, "split": split, "scattered": scattered}
+
+
+def make_locations(pattern, size, seed=0):
+    """Return dictionary of locations as returned by Locator.get_locations()."""
+    rng = random.Random("%s %s %s" % (seed, pattern, size))
+    return {"DB%02i" % index: Location(latitude, longitude) for index, (latitude, longitude) in enumerate(PATTERNS[pattern](rng, size))}
+
+
+def run_scenario(method, pattern, size, repeat, max_seconds=None):
+    """
+    Call method repeat times (less if max_seconds is exceeded) with locations of given
+    pattern and size. Return dictionary of measured values.
+    """
+    calculate = METHODS[method]
+    inputs = [make_locations(pattern, size, seed) for seed in range(repeat)]
+
+    # Warm-up call loads lazy imports and caches of libraries
+    calculate(inputs[0])
+
+    times = []
+    budget_started = time.perf_counter()
+    for locations in inputs:
+        started = time.perf_counter()
+        calculate(locations)
+        times.append(time.perf_counter() - started)
+        if max_seconds is not None and time.perf_counter() - budget_started > max_seconds:
+            break
+
+    allocated = []
+    for locations in inputs[:min(len(times), 10)]:
+        tracemalloc.start()
+        try:
+            calculate(locations)
+            allocated.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    return {"method": method, "pattern": pattern, "size": size, "calls": len(times),
+            "time_us": percentiles(times, 1e6), "allocated_bytes": max(allocated)}
+
+
+def run_batch(methods, patterns, size, rows, repeat):
+    """
+    Calculate locations of rows IP addresses by BatchCalculation with every method, best of
+    repeat (at most 5) runs is taken. Return list of dictionaries of measured values.
+    """
+    inputs = [make_locations(patterns[row % len(patterns)], size, row) for row in range(rows)]
+    batch = BatchCalculation.from_locations(inputs)
+
+    seconds = {}
+    for method in dict.fromkeys(list(methods) + ["Clustering"]):
+        times = []
+        for _ in range(min(repeat, 5)):
+            started = time.perf_counter()
+            batch.calculate(method)
+            times.append(time.perf_counter() - started)
+        seconds[method] = min(times)
+
+    results = []
+    for method in methods:
+        ratio = seconds[method] / seconds["Clustering"]
+        target = BATCH_TARGETS.get(method)
+        results.append({"method": method, "pattern": "batch", "size": size, "rows": rows, "seconds": seconds[method],
+                        "time_us": {"mean": 1e6 * seconds[method] / rows}, "clustering_ratio": ratio, "target_ratio": target,
+                        "target_met": target is None or ratio <= target})
+    return results
+
+
+def names(value, choices):
+    """Parse comma separated list of names from choices."""
+    selected = [item for item in value.split(",") if item]
+    unknown = set(selected) - set(choices)
+    if unknown:
+        raise click.BadParameter("Unknown values %s, choose from %s." % (", ".join(sorted(unknown)), ", ".join(choices)))
+    return selected
+
+
+@click.command()
+@click.option('--methods', default=",".join(METHODS), help="Comma separated calculation methods. Default: all.")
+@click.option('--patterns', default=",".join(PATTERNS), help="Comma separated outlier patterns (%s). Default: all." % ", ".join(PATTERNS))
+@click.option('--sizes', default="2,3,5,8,13", help="Comma separated numbers of locations. Default: 2,3,5,8,13.")
+@click.option('--repeat', type=click.IntRange(min=1), default=200, help="Number of measured calls of every scenario. Default: 200.")
+@click.option('--max-seconds', type=click.FloatRange(min=0), default=5.0, help="Time budget of one scenario, slow methods make fewer calls. Default: 5 s.")
+@click.option('--batch-rows', type=click.IntRange(min=0), default=100000, help="Number of IP addresses of batch scenario, 0 skips it. Default: 100000.")
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help="Save results into JSON file.")
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), default=None, help="Compare mean time per call with results saved by --output.")
+@click.option('--logs/--no-logs', default=False, help="Keep logging of calculations, which is part of their cost in application. Default: no logs.")
+def main(methods, patterns, sizes, repeat, max_seconds, batch_rows, output, compare, logs):
+    """Measure time per call and memory allocated by calculation methods."""
+    if not logs:
+        logging.disable(logging.CRITICAL)
+
+    parameters = {"repeat": repeat, "max_seconds": max_seconds, "batch_rows": batch_rows, "logs": logs}
+    results = []
+    click.echo("%-16s %-10s %5s %6s %12s %12s %12s %12s %12s" % ("Method", "Pattern", "Size", "Calls", "Mean [us]", "p50 [us]", "p95 [us]",
+                                                                  "p99 [us]", "Alloc [B]"))
+
+    sizes = [int(size) for size in sizes.split(",") if size]
+    for method, pattern, size in itertools.product(names(methods, METHODS), names(patterns, PATTERNS), sizes):
+        result = run_scenario(method, pattern, size, repeat, max_seconds)
+        results.append(result)
+        click.echo("%-16s %-10s %5i %6i %12.1f %12.1f %12.1f %12.1f %12i" % (method, pattern, size, result["calls"], result["time_us"]["mean"],
+                                                                              result["time_us"]["p50"], result["time_us"]["p95"],
+                                                                              result["time_us"]["p99"], result["allocated_bytes"]))
+
+    if batch_rows > 0:
+        click.echo("\n%-16s %8s %5s %10s %12s %12s %8s" % ("Method", "Rows", "Size", "Time [s]", "Per row [us]", "/Clustering", "Target"))
+        for result in run_batch(names(methods, METHODS), names(patterns, PATTERNS), max(sizes), batch_rows, repeat):
+            results.append(result)
+            click.echo("%-16s %8i %5i %10.3f %12.2f %12.2f %8s" % (result["method"], result["rows"], result["size"], result["seconds"],
+                                                                   result["time_us"]["mean"], result["clustering_ratio"],
+                                                                   "-" if result["target_ratio"] is None else "%g" % result["target_ratio"]))
+        missed = [result["method"] for result in results if not result.get("target_met", True)]
+        click.echo("\nBatch targets: time relative to Clustering. %s" % ("Missed by: %s." % ", ".join(missed) if missed else "Met."))
+
+    if output is not None:
+        save_results(os.path.abspath(output), "calculations", parameters, results)
+        click.echo("Results saved into %s." % output)
+
+    if compare is not None:
+        click.echo("\nMean time per call [us] compared with %s:" % compare)
+        for line in compare_results(compare, results, ("method", "pattern", "size"), lambda result: result["time_us"]["mean"], higher_is_better=False):
+            click.echo(line)
+
+
+if __name__ == "__main__":
+    main()
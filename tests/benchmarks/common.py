@@ -0,0 +1,54 @@
+"""Helpers shared by benchmarks"""
+import datetime
+import json
+import platform
+
+import numpy
+
+import ip2geotools_locator
+
+
+def percentiles(values, scale=1.0):
+    """Return dictionary with mean, p50, p95 and p99 of values multiplied by scale."""
+    if len(values) == 0:
+        return {"mean": None, "p50": None, "p95": None, "p99": None}
+    values = numpy.asarray(values, dtype=float) * scale
+    p50, p95, p99 = numpy.percentile(values, [50, 95, 99])
+    return {"mean": float(values.mean()), "p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def save_results(file_path, benchmark, parameters, results):
+    """Save results of benchmark into JSON file with versions of package, Python and platform."""
+    document = {
+        "benchmark": benchmark,
+        "version": ip2geotools_locator.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "parameters": parameters,
+        "results": results,
+    }
+    with open(file_path, "w") as results_file:
+        json.dump(document, results_file, indent=4)
+
+
+def compare_results(file_path, results, keys, value, higher_is_better=True):
+    """
+    Compare results with results saved in JSON file. Scenarios are matched by keys and
+    value(result) returns compared number. Return lines with relative change of value
+    in every scenario found in both runs.
+    """
+    with open(file_path) as results_file:
+        baseline = {tuple(result[key] for key in keys): result for result in json.load(results_file)["results"]}
+
+    lines = []
+    for result in results:
+        scenario = tuple(result[key] for key in keys)
+        if scenario not in baseline or not value(baseline[scenario]):
+            continue
+        old, new = value(baseline[scenario]), value(result)
+        change = 100.0 * (new - old) / old
+        worse = change < 0 if higher_is_better else change > 0
+        lines.append("%-50s %12.3f -> %12.3f %+7.1f%%%s" % (", ".join("%s=%s" % item for item in zip(keys, scenario)), old, new, change,
+                                                             " REGRESSION" if worse and abs(change) >= 10 else ""))
+    return lines
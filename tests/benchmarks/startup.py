@@ -0,0 +1,143 @@
+"""
+Cold start benchmark of command line interface.
+
+Every scenario runs command line interface in new Python process, so imports are measured
+from cold interpreter like in real use. Wall time of the process is reported together with
+its overhead over bare interpreter (python -c pass), which is the part controlled by this
+package. Every run also reports heavy modules (numpy, scikit-learn, folium, ...) which were
+imported, although the scenario does not use them. Lookup scenario locates IP address in
+small local MaxMind database without map, so no request leaves the machine.
+
+python -m tests.benchmarks.startup --scenarios help,list,lookup --repeat 20 --output results.json
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+
+from tests.benchmarks.common import compare_results, percentiles, save_results
+
+# Command line arguments by scenario name
+SCENARIOS = {
+    "import": None,
+    "help": ["--help"],
+    "list": ["--list", "--no-logs"],
+    "lookup": ["--no-map", "--no-logs", "147.229.2.90"],
+}
+# Targets of median overhead over bare interpreter [ms]; AsyncLocator (asyncio), caches (sqlite3)
+# and thread pool (concurrent.futures) are imported on first use. Lookup also loads reader of its
+# database file (geoip2, maxminddb)
+TARGETS_MS = {"import": 100.0, "help": 100.0, "list": 100.0, "lookup": 200.0}
+# Modules which only clustering, maps, batch calculations or async lookups need
+HEAVY_MODULES = ("numpy", "scipy", "sklearn", "kneed", "folium", "geopy", "aiohttp")
+# Root of repository, measured processes import package from it
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Small GeoLite2-City database used by lookup scenario
+MMDB_FILE = os.path.join(ROOT, "tests", "data", "GeoLite2-City-Test.mmdb")
+
+# Code run in measured process, prints imported heavy modules as the last line of stderr
+RUNNER = """
+import json, sys
+if sys.argv[1:] != ["import"]:
+    from ip2geotools_locator.cli import cmd
+    try:
+        cmd(sys.argv[1:])
+    except SystemExit:
+        pass
+else:
+    import ip2geotools_locator
+print(json.dumps([name for name in %r if name in sys.modules]), file=sys.stderr)
+""" % (HEAVY_MODULES,)
+
+
+def write_settings(directory):
+    """Write settings.json with the only active local database into directory."""
+    from ip2geotools_locator.utils import DB_TYPES, DEFAULT_SETTINGS
+
+    settings = json.loads(DEFAULT_SETTINGS)
+    for db_type in DB_TYPES:
+        for db_name, db_settings in settings[db_type].items():
+            db_settings["active"] = db_name == "max_mind_lite"
+    settings["noncommercial"]["max_mind_lite"]["db_file"] = MMDB_FILE
+    settings["cache"]["active"] = False
+    with open(os.path.join(directory, "settings.json"), "w") as settings_file:
+        json.dump(settings, settings_file)
+
+
+def run_process(arguments, directory):
+    """Run Python process with arguments in directory. Return (seconds, imported heavy modules)."""
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (ROOT, os.environ.get("PYTHONPATH")))))
+    started = time.perf_counter()
+    process = subprocess.run(arguments, cwd=directory, env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                             universal_newlines=True, check=False)
+    seconds = time.perf_counter() - started
+
+    lines = process.stderr.strip().splitlines()
+    return seconds, json.loads(lines[-1]) if lines and lines[-1].startswith("[") else None
+
+
+def run_scenario(scenario, repeat, directory):
+    """Run scenario repeat times together with bare interpreter and return dictionary of measured values."""
+    arguments = ["import"] if SCENARIOS[scenario] is None else SCENARIOS[scenario]
+    baseline = []
+    times = []
+    heavy_modules = set()
+
+    for _ in range(repeat):
+        baseline.append(run_process([sys.executable, "-c", "pass"], directory)[0])
+        seconds, modules = run_process([sys.executable, "-c", RUNNER] + arguments, directory)
+        if modules is None:
+            raise RuntimeError("Scenario %s has failed." % scenario)
+        times.append(seconds)
+        heavy_modules.update(modules)
+
+    time_ms = percentiles(times, 1000.0)
+    overhead_ms = time_ms["p50"] - percentiles(baseline, 1000.0)["p50"]
+    target_ms = TARGETS_MS[scenario]
+    return {"scenario": scenario, "runs": repeat, "time_ms": time_ms, "interpreter_ms": percentiles(baseline, 1000.0)["p50"],
+            "overhead_ms": overhead_ms, "heavy_modules": sorted(heavy_modules), "target_ms": target_ms,
+            "target_met": overhead_ms <= target_ms and not heavy_modules}
+
+
+@click.command()
+@click.option('--scenarios', default=",".join(SCENARIOS), help="Comma separated scenarios (%s). Default: all." % ", ".join(SCENARIOS))
+@click.option('--repeat', type=click.IntRange(min=1), default=10, help="Number of runs of every scenario. Default: 10.")
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help="Save results into JSON file.")
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), default=None, help="Compare median overhead with results saved by --output.")
+def main(scenarios, repeat, output, compare):
+    """Measure cold start time of command line interface."""
+    results = []
+    click.echo("%-8s %5s %10s %10s %11s %14s %12s  %s" % ("Scenario", "Runs", "p50 [ms]", "p95 [ms]", "Python [ms]", "Overhead [ms]", "Target [ms]",
+                                                          "Heavy modules"))
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_settings(directory)
+        for scenario in [item for item in scenarios.split(",") if item]:
+            if scenario not in SCENARIOS:
+                raise click.BadParameter("Unknown scenario %s, choose from %s." % (scenario, ", ".join(SCENARIOS)))
+            result = run_scenario(scenario, repeat, directory)
+            results.append(result)
+            click.echo("%-8s %5i %10.1f %10.1f %11.1f %14.1f %12s  %s" % (scenario, repeat, result["time_ms"]["p50"], result["time_ms"]["p95"],
+                                                                         result["interpreter_ms"], result["overhead_ms"],
+                                                                         "%g" % result["target_ms"],
+                                                                         ", ".join(result["heavy_modules"]) or "-"))
+
+    missed = [result["scenario"] for result in results if not result["target_met"]]
+    click.echo("\nTargets: overhead up to target without heavy modules. %s" % ("Missed by: %s." % ", ".join(missed) if missed else "Met."))
+
+    if output is not None:
+        save_results(os.path.abspath(output), "startup", {"repeat": repeat}, results)
+        click.echo("Results saved into %s." % output)
+
+    if compare is not None:
+        click.echo("\nMedian overhead [ms] compared with %s:" % compare)
+        for line in compare_results(compare, results, ("scenario",), lambda result: result["overhead_ms"], higher_is_better=False):
+            click.echo(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+End-to-end throughput benchmark of Locator with simulated databases.
+
+Simulated databases run in process through the real connector layer (rate limiters,
+metrics, caches and thread pool of Locator) and answer after deterministic latency,
+so runs are comparable. Every scenario locates given number of IP addresses by
+Locator.locate_many() and reports IP addresses per second and percentiles of lookup
+latency, measured from the moment Locator reads IP address from input until its
+record is returned.
+
+python -m tests.benchmarks.throughput --ips 200,1000 --providers 1,4,13 --jobs 1,8,32 --output results.json
+"""
+import ipaddress
+import itertools
+import json
+import os
+import random
+import tempfile
+import time
+import zlib
+
+import click
+from ip2geotools.errors import InvalidResponseError, IpAddressNotFoundError, ServiceError
+from ip2geotools.models import IpLocation
+
+from ip2geotools_locator.database_connectors import DatabaseConnector
+from ip2geotools_locator.main import Locator
+from ip2geotools_locator.utils import DEFAULT_SETTINGS
+from tests.benchmarks.common import compare_results, percentiles, save_results
+
+# Errors raised by simulated databases
+ERRORS = (ServiceError, IpAddressNotFoundError, InvalidResponseError)
+
+
+class SimulatedDB(DatabaseConnector):
+    """
+    Connector answering with location near Brno after simulated latency.
+    Latency (log-normal around median_latency) and errors are derived from database
+    name and IP address, so every run sees the same sequence.
+    """
+    def __init__(self, name, median_latency, error_rate, seed=0):
+        self.location_name = name
+        self.median_latency = median_latency
+        self.error_rate = error_rate
+        self.seed = seed
+
+    def _get(self, ip_address):
+        rng = random.Random(zlib.crc32(("%s %s %s" % (self.seed, self.location_name, ip_address)).encode()))
+        time.sleep(self.median_latency * rng.lognormvariate(0, 0.5))
+
+        if rng.random() < self.error_rate:
+            raise rng.choice(ERRORS)("Simulated error")
+        return IpLocation(ip_address, "Brno", "South Moravian", "CZ", 49.19 + rng.uniform(-0.1, 0.1), 16.61 + rng.uniform(-0.1, 0.1))
+
+
+class BenchmarkLocator(Locator):
+    """Locator querying simulated databases instead of databases from settings"""
+    def __init__(self, connectors, jobs):
+        super().__init__(generate_map=False)
+        self.settings = json.loads(DEFAULT_SETTINGS)
+        self.settings["jobs"] = jobs
+        # Simulated errors would open breakers and skew later lookups
+        self.settings["circuit_breaker"]["active"] = False
+        self.connectors = connectors
+        for connector in connectors.values():
+            connector.metrics = self._metrics
+
+    def _active_connectors(self):
+        databases = {name: {"active": True, "generate_marker": False, "cache_ttl": 0} for name in self.connectors}
+        return self.connectors, databases
+
+
+def run_scenario(ip_count, provider_count, jobs, median_latency, error_rate, method):
+    """Locate ip_count IP addresses and return dictionary of measured values."""
+    connectors = {"DB%02i" % index: SimulatedDB("DB%02i" % index, median_latency, error_rate, seed=index)
+                  for index in range(provider_count)}
+    locator = BenchmarkLocator(connectors, jobs)
+    ip_addresses = [str(ipaddress.IPv4Address(0x93E50000 + index)) for index in range(ip_count)]
+    started = []
+
+    def read_input():
+        for ip_address in ip_addresses:
+            started.append(time.perf_counter())
+            yield ip_address
+
+    latencies = []
+    locations = 0
+    run_started = time.perf_counter()
+    for record in locator.locate_many(read_input(), average=method == "average", median=method == "median",
+                                      clustering=method == "clustering"):
+        latencies.append(time.perf_counter() - started[len(latencies)])
+        locations += len(record.locations)
+    seconds = time.perf_counter() - run_started
+    locator.close()
+
+    outcomes = {}
+    for database_stats in locator.get_metrics()["databases"].values():
+        for outcome, count in database_stats["outcomes"].items():
+            outcomes[outcome] = outcomes.get(outcome, 0) + count
+
+    return {"ips": ip_count, "providers": provider_count, "jobs": jobs, "seconds": seconds,
+            "ips_per_second": ip_count / seconds, "latency_ms": percentiles(latencies, 1000.0),
+            "locations": locations, "errors": sum(count for outcome, count in outcomes.items() if outcome != "success"), "outcomes": outcomes}
+
+
+def integers(value):
+    """Parse comma separated list of positive integers."""
+    return [int(item) for item in value.split(",") if item]
+
+
+@click.command()
+@click.option('--ips', default="200,1000", help="Comma separated numbers of IP addresses. Default: 200,1000.")
+@click.option('--providers', default="1,4,13", help="Comma separated numbers of simulated databases. Default: 1,4,13.")
+@click.option('--jobs', default="1,8,32", help="Comma separated values of jobs setting. Default: 1,8,32.")
+@click.option('--latency-ms', type=click.FloatRange(min=0), default=2.0, help="Median latency of simulated database. Default: 2 ms.")
+@click.option('--error-rate', type=click.FloatRange(min=0, max=1), default=0.05, help="Share of requests answered by error. Default: 0.05.")
+@click.option('--method', type=click.Choice(["average", "median", "clustering", "none"]), default="average", help="Calculation method. Default: average.")
+@click.option('--output', type=click.Path(dir_okay=False), default=None, help="Save results into JSON file.")
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), default=None, help="Compare IPs/s with results saved by --output.")
+def main(ips, providers, jobs, latency_ms, error_rate, method, output, compare):
+    """Measure throughput and lookup latency of Locator with simulated databases."""
+    if output is not None:
+        output = os.path.abspath(output)
+    if compare is not None:
+        compare = os.path.abspath(compare)
+
+    parameters = {"latency_ms": latency_ms, "error_rate": error_rate, "method": method}
+    results = []
+    click.echo("%8s %10s %6s %10s %10s %10s %10s %10s" % ("IPs", "Providers", "Jobs", "Seconds", "IPs/s", "p50 [ms]", "p95 [ms]", "p99 [ms]"))
+
+    # Locator reads and writes settings.json and log in working directory
+    working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        try:
+            for ip_count, provider_count, job_count in itertools.product(integers(ips), integers(providers), integers(jobs)):
+                result = run_scenario(ip_count, provider_count, job_count, latency_ms / 1000.0, error_rate, method)
+                results.append(result)
+                click.echo("%8i %10i %6i %10.3f %10.1f %10.3f %10.3f %10.3f" % (ip_count, provider_count, job_count, result["seconds"],
+                                                                                result["ips_per_second"], result["latency_ms"]["p50"],
+                                                                                result["latency_ms"]["p95"], result["latency_ms"]["p99"]))
+        finally:
+            os.chdir(working_directory)
+
+    if output is not None:
+        save_results(output, "throughput", parameters, results)
+        click.echo("Results saved into %s." % output)
+
+    if compare is not None:
+        click.echo("\nIPs/s compared with %s:" % compare)
+        for line in compare_results(compare, results, ("ips", "providers", "jobs"), lambda result: result["ips_per_second"]):
+            click.echo(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,12 +4,985 @@
 """Tests for `ip2geotools_locator` package."""
 
 
+import asyncio
+import datetime
+import functools
+import io
+import ipaddress
+import json
+import os
+import shutil
+import socketserver
+import struct
+import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+import numpy
 from click.testing import CliRunner
+from ip2geotools.errors import LimitExceededError, ServiceError
+from ip2geotools.models import IpLocation
+
+import ip2geotools.databases.noncommercial
+from ip2geotools_locator import async_locator, cli, database_connectors, http_pool, main, profiling
+from ip2geotools_locator.caching import LRUCache, PersistentCache, PrefixCache
+from ip2geotools_locator.calculations import BatchCalculation, Centroid, Clustering, GeometricMedian
+from ip2geotools_locator.calculations.clustering import densest_cluster
+from ip2geotools_locator.database_connectors import (BUILTIN_CONNECTORS, CONNECTORS, DatabaseConnector, create_connector,
+                                                      get_connector_class)
+from ip2geotools_locator.database_connectors.ip2location import Ip2LocationDB
+from ip2geotools_locator.database_connectors.max_mind_lite import MaxMindLiteDB
+from ip2geotools_locator.database_connectors.readers import FileReaders, Ip2LocationReader, open_mmdb
+from ip2geotools_locator.metrics import Metrics
+from ip2geotools_locator.range_index import RangeIndex, build_consensus, compile_database, ip_numbers
+from ip2geotools_locator.throttling import CircuitBreaker, RateLimiter
+from ip2geotools_locator.utils import DB_TYPES, DEFAULT_SETTINGS, Location, find_quorum, haversine, merge_settings
+from tests.benchmarks import calculations, startup, throughput
+
+
+# Small GeoLite2-City database with networks 147.229.0.0/16, 8.8.8.0/24 and 203.0.113.0/25
+MMDB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "GeoLite2-City-Test.mmdb")
+PREFIX_LENGTH = {"ipv4": 24, "ipv6": 48}
+
+
+def write_ip2location_bin(file_path, ranges):
+    """
+    Write IPv4 IP2Location DB5 BIN file (country, region, city, latitude, longitude).
+    ranges are sorted tuples (first IP address, country, region, city, latitude, longitude),
+    the first one starting at 0.0.0.0. Country "-" means unknown range.
+    """
+    rows_at = 64
+    strings_at = rows_at + (len(ranges) + 1) * 24 + 4
+    rows = bytearray()
+    strings = bytearray()
+
+    def add_string(text):
+        position = strings_at + len(strings)
+        strings.extend(bytes([len(text)]) + text.encode())
+        return position
+
+    for first_ip, country, region, city, latitude, longitude in ranges:
+        country_position = add_string(country)
+        # Long name of country follows its code
+        add_string(country)
+        rows += struct.pack("<LLLLff", int(ipaddress.ip_address(first_ip)), country_position, add_string(region),
+                            add_string(city), latitude, longitude)
+
+    # Last row holds upper bound of IPv4 space
+    rows += struct.pack("<LLLLffL", 2 ** 32 - 1, 0, 0, 0, 0, 0, 2 ** 32 - 1)
+    header = struct.pack("<BBBBBLLLLLLBBB", 5, 6, 20, 1, 1, len(ranges), rows_at + 1, 0, 0, 0, 0, 1, 1, 1)
+
+    with open(file_path, "wb") as bin_file:
+        bin_file.write(header.ljust(rows_at, b"\0") + rows + strings)
+
+
+IP2LOCATION_RANGES = [("0.0.0.0", "-", "-", "-", 0.0, 0.0), ("147.229.0.0", "CZ", "South Moravian", "Brno", 49.19, 16.61),
+                      ("147.230.0.0", "-", "-", "-", 0.0, 0.0)]
+
+
+def fake_location(latitude, longitude):
+    """IpLocation as returned by ip2geotools"""
+    return IpLocation("10.0.0.1", "Brno", "South Moravian", "CZ", latitude, longitude)
+
+
+class FakeConnector:
+    """Connector returning fixed location after given delay"""
+    def __init__(self, location, delay=0.0):
+        self.location = location
+        self.delay = delay
+        self.threads = set()
+
+    def get_location(self, ip_address):
+        """Return fixed location"""
+        self.threads.add(threading.current_thread().name)
+        time.sleep(self.delay)
+        return self.location
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """HTTP/1.1 handler answering every GET with small JSON"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b'{"lat": "49.2", "lng": "16.6"}'
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(socketserver.ThreadingMixIn, HTTPServer):
+    """Threading HTTP server (http.server.ThreadingHTTPServer needs Python 3.7)"""
+    daemon_threads = True
+
 
-from ip2geotools_locator import main
-from ip2geotools_locator import cli
+def with_settings(connectors):
+    """Return connectors with settings of their databases as _active_connectors does"""
+    return connectors, {name: {"active": True, "generate_marker": False, "cache_ttl": 3600} for name in connectors}
+
+
+def fake_connectors(delay=0.0):
+    """Connectors of three databases with close locations"""
+    return {"A": FakeConnector(Location(49.0, 16.0), delay), "B": FakeConnector(Location(49.2, 16.2), delay),
+            "C": FakeConnector(Location(49.4, 16.4), delay)}
+
+
+def only_active(locator, *db_names):
+    """Set only given databases as active"""
+    for db_type in DB_TYPES:
+        for db_name, db_settings in locator.settings[db_type].items():
+            db_settings["active"] = db_name in db_names
+            db_settings["generate_marker"] = False
+
+
+def run_coroutine(coroutine):
+    """Run coroutine in new event loop and return its result (asyncio.run needs Python 3.7)"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
 
 
 class TestIp2geotools_locator(unittest.TestCase):
-    pass
+    def setUp(self):
+        # Locator reads and writes settings.json in working directory
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def test_merge_settings_fills_missing_keys(self):
+        defaults = json.loads(DEFAULT_SETTINGS)
+        merged = merge_settings(defaults, {"noncommercial": {"host_ip": {"active": False}}})
+
+        self.assertEqual(merged["jobs"], 1)
+        self.assertFalse(merged["noncommercial"]["host_ip"]["active"])
+        self.assertTrue(merged["noncommercial"]["host_ip"]["generate_marker"])
+        self.assertIn("commercial", merged)
+
+    def test_settings_from_older_file(self):
+        with open("settings.json", "w") as write_file:
+            json.dump({"noncommercial": {}, "commercial": {}}, write_file)
+
+        locator = main.Locator(generate_map=False)
+        self.assertEqual(locator.get_settings()["jobs"], 1)
+
+    def test_concurrent_query(self):
+        locator = main.Locator(generate_map=False)
+        locator.settings["jobs"] = 4
+        connectors = {"A": FakeConnector("a", 0.2), "B": FakeConnector("b", 0.2), "C": FakeConnector(None, 0.2)}
+
+        started = time.perf_counter()
+        locations, _ = locator._query_connectors(*with_settings(connectors), "127.0.0.1")
+        elapsed = time.perf_counter() - started
+        locator.close()
+
+        self.assertEqual(list(locations), ["A", "B", "C"])
+        self.assertEqual(locations["B"], "b")
+        self.assertLess(elapsed, 0.5)
+
+    def test_serial_query(self):
+        locator = main.Locator(generate_map=False)
+        connector = FakeConnector("a")
+
+        locations, _ = locator._query_connectors(*with_settings({"A": connector}), "127.0.0.1")
+
+        self.assertEqual(locations, {"A": "a"})
+        self.assertEqual(connector.threads, {threading.current_thread().name})
+
+    def test_cli_jobs_option(self):
+        runner = CliRunner()
+        result = runner.invoke(cli.cmd, ["--jobs", "3", "--settings", "--no-logs"])
+
+        self.assertIn("jobs - 3", result.output)
+
+    def test_async_fetch_locations(self):
+        async def fake_host_ip(session, ip_address):
+            return IpLocation(ip_address, latitude=49.19, longitude=16.61)
+
+        async def failing_skyhook(session, ip_address, login, password):
+            raise ServiceError()
+
+        async def unexpected_eurek(session, ip_address, api_key):
+            # Payload the coroutine cannot parse does not stop lookups in other databases
+            raise KeyError("query_status")
+
+        async def lookup():
+            async with async_locator.AsyncLocator() as locator:
+                only_active(locator, "host_ip", "skyhook", "eurek")
+                locations = await locator.fetch_locations("147.229.2.90")
+                calculated = await locator.calculate(locations={"A": locations["HostIP"], "B": locations["HostIP"]})
+            return locations, calculated
+
+        databases = {"host_ip": (fake_host_ip, ()), "skyhook": (failing_skyhook, ("login", "password")), "eurek": (unexpected_eurek, ("api_key",))}
+        with mock.patch.dict(async_locator.ASYNC_DATABASES, databases):
+            locations, calculated = run_coroutine(lookup())
+
+        self.assertEqual(list(locations), ["HostIP"])
+        self.assertEqual(locations["HostIP"].latitude, 49.19)
+        self.assertEqual(calculated["Average"], (49.19, 16.61))
+
+    def test_async_fetch_uses_caches(self):
+        calls = []
+
+        async def fake_host_ip(session, ip_address):
+            calls.append(ip_address)
+            return IpLocation(ip_address, latitude=49.19, longitude=16.61)
+
+        async def lookup():
+            async with async_locator.AsyncLocator() as locator:
+                only_active(locator, "host_ip")
+                locator.settings["memory_cache"]["active"] = True
+                first = await locator.fetch_locations("147.229.2.90")
+                second = await locator.fetch_locations("147.229.2.90")
+                stats = locator.get_cache_stats()
+            return first, second, stats
+
+        with mock.patch.dict(async_locator.ASYNC_DATABASES, {"host_ip": (fake_host_ip, ())}):
+            first, second, stats = run_coroutine(lookup())
+
+        self.assertEqual(calls, ["147.229.2.90"])
+        self.assertEqual(first, second)
+        self.assertEqual(stats["locations"]["hits"], 1)
+
+    def test_locate_many(self):
+        locator = main.Locator(generate_map=False)
+        locator.settings["jobs"] = 6
+        ip_addresses = ["10.0.0.%i" % i for i in range(10)]
+
+        with mock.patch.object(main.Locator, "_active_connectors", side_effect=lambda: with_settings(fake_connectors(0.05))):
+            started = time.perf_counter()
+            records = list(locator.locate_many(iter(ip_addresses), median=True))
+            elapsed = time.perf_counter() - started
+        locator.close()
+
+        self.assertEqual([record.ip_address for record in records], ip_addresses)
+        self.assertEqual(len(records[0].locations), 3)
+        self.assertEqual(records[0].calculated_locations["Average"], Location(49.2, 16.2))
+        self.assertEqual(records[0].calculated_locations["Median"], Location(49.2, 16.2))
+        # 10 IP addresses with 50 ms databases take 500 ms serially
+        self.assertLess(elapsed, 0.35)
+
+    def test_locate_many_serial(self):
+        locator = main.Locator(generate_map=False)
+
+        with mock.patch.object(main.Locator, "_active_connectors", side_effect=lambda: with_settings({"A": FakeConnector(Location(1.0, 2.0))})):
+            records = list(locator.locate_many(["10.0.0.1", "10.0.0.2"]))
+
+        self.assertEqual(records[1].ip_address, "10.0.0.2")
+        self.assertEqual(records[1].locations, {"A": Location(1.0, 2.0)})
+        self.assertIsNone(records[1].calculated_locations)
+
+    def test_cli_bulk_ndjson(self):
+        runner = CliRunner()
+        connectors = lambda: with_settings({"A": FakeConnector(fake_location(49.0, 16.0)), "B": FakeConnector(fake_location(50.0, 17.0))})
+
+        with mock.patch.object(main.Locator, "_active_connectors", side_effect=connectors):
+            result = runner.invoke(cli.cmd, ["--input", "-", "-a", "-j", "4", "--no-logs"], input="10.0.0.1\n\nnot-an-ip\n10.0.0.2\n")
+
+        lines = result.stdout.splitlines()
+        self.assertEqual(len(lines), 2)
+        record = json.loads(lines[1])
+        self.assertEqual(record["ip_address"], "10.0.0.2")
+        self.assertEqual(record["locations"]["A"]["city"], "Brno")
+        self.assertEqual(record["calculated_locations"]["Average"], {"latitude": 49.5, "longitude": 16.5})
+        self.assertFalse(os.path.exists("locations.html"))
+
+    def test_cli_bulk_csv(self):
+        runner = CliRunner()
+        connectors = lambda: with_settings({"A": FakeConnector(fake_location(49.0, 16.0))})
+
+        with mock.patch.object(main.Locator, "_active_connectors", side_effect=connectors):
+            result = runner.invoke(cli.cmd, ["--input", "-", "--output-format", "csv", "--no-logs"], input="10.0.0.1\n")
+
+        self.assertEqual(result.stdout.splitlines(), ["ip_address,source,latitude,longitude,country,region,city",
+                                                      "10.0.0.1,A,49.0,16.0,CZ,South Moravian,Brno"])
+
+    def test_cli_bulk_defaults_to_concurrent_jobs(self):
+        runner = CliRunner()
+        connectors = lambda: with_settings({"A": FakeConnector(fake_location(49.0, 16.0))})
+
+        with mock.patch.object(main.Locator, "_active_connectors", side_effect=connectors), \
+                mock.patch.object(cli, "stream_locations", wraps=cli.stream_locations) as stream_locations:
+            runner.invoke(cli.cmd, ["--input", "-", "--no-logs"], input="10.0.0.1\n")
+            runner.invoke(cli.cmd, ["--input", "-", "-j", "1", "--no-logs"], input="10.0.0.1\n")
+
+        self.assertEqual([call[0][0].get_settings()["jobs"] for call in stream_locations.call_args_list], [cli.BULK_JOBS, 1])
+
+    def test_stream_locations_flushes_records(self):
+        locator = main.Locator(generate_map=False)
+        output = mock.Mock(wraps=io.StringIO())
+
+        with mock.patch.object(main.Locator, "_active_connectors", side_effect=lambda: with_settings({"A": FakeConnector(fake_location(49.0, 16.0))})), \
+                mock.patch("sys.stdout", output):
+            cli.stream_locations(locator, ["10.0.0.1", "10.0.0.2"], "ndjson", True, False, False, False, False)
+
+        self.assertEqual(output.write.call_count, 2)
+        self.assertEqual(output.flush.call_count, 2)
+
+    def test_validate_ip_address(self):
+        self.assertIsNone(cli.validate_ip_address("147.229.2.90"))
+        self.assertIsNotNone(cli.validate_ip_address("147.229.2"))
+        self.assertIsNotNone(cli.validate_ip_address("147.229.2.256"))
+        self.assertIsNotNone(cli.validate_ip_address("147.229.2.x"))
+
+    def test_persistent_cache(self):
+        cache = PersistentCache("cache.sqlite3")
+        cache.set("HostIP", "10.0.0.1", fake_location(49.0, 16.0))
+
+        # Cache file is shared with other connections
+        location = PersistentCache("cache.sqlite3").get("HostIP", "10.0.0.1", 3600)
+        self.assertEqual((location.latitude, location.city, location.ip_address), (49.0, "Brno", "10.0.0.1"))
+        self.assertIsNone(cache.get("HostIP", "10.0.0.2", 3600))
+        self.assertIsNone(cache.get("DbIpCity", "10.0.0.1", 3600))
+
+        # Expired record
+        time.sleep(0.01)
+        self.assertIsNone(cache.get("HostIP", "10.0.0.1", 0.005))
+
+        self.assertEqual(cache.purge(), 1)
+        self.assertIsNone(cache.get("HostIP", "10.0.0.1", 3600))
+
+    def test_locator_uses_cache(self):
+        locator = main.Locator(generate_map=False)
+        locator.settings["cache"]["active"] = True
+        connector = mock.Mock(get_location=mock.Mock(return_value=fake_location(49.0, 16.0)))
+        connectors, databases = with_settings({"A": connector})
+
+        first, _ = locator._query_connectors(connectors, databases, "10.0.0.1")
+        second, _ = locator._query_connectors(connectors, databases, "10.0.0.1")
+
+        self.assertEqual(connector.get_location.call_count, 1)
+        self.assertEqual(second["A"].city, first["A"].city)
+
+        # Zero TTL bypasses cache
+        databases["A"]["cache_ttl"] = 0
+        locator._query_connectors(connectors, databases, "10.0.0.1")
+        self.assertEqual(connector.get_location.call_count, 2)
+        self.assertEqual(locator.purge_cache(), 1)
+
+    def test_lru_cache_limits(self):
+        cache = LRUCache(max_entries=2, max_bytes=10 ** 6)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        # "b" was least recently used
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+        small = LRUCache(max_entries=100, max_bytes=300)
+        for index in range(10):
+            small.set(index, "x" * 50)
+        self.assertLessEqual(small.size, 300)
+        self.assertLess(len(small), 10)
+
+        expiring = LRUCache(ttl=0.005)
+        expiring.set("a", 1)
+        time.sleep(0.01)
+        self.assertIsNone(expiring.get("a"))
+        self.assertEqual(expiring.stats()["expirations"], 1)
+
+    def test_locator_memory_cache(self):
+        locator = main.Locator(generate_map=False)
+        locator.settings["memory_cache"]["active"] = True
+        connectors, databases = with_settings({"A": mock.Mock(get_location=mock.Mock(return_value=fake_location(49.0, 16.0))),
+                                               "B": mock.Mock(get_location=mock.Mock(return_value=fake_location(50.0, 17.0)))})
+
+        with mock.patch.object(main.Locator, "_active_connectors", return_value=(connectors, databases)):
+            records = list(locator.locate_many(["10.0.0.1", "10.0.0.1", "10.0.0.1"]))
+
+        self.assertEqual(connectors["A"].get_location.call_count, 1)
+        self.assertEqual(records[2].calculated_locations["Average"], Location(49.5, 16.5))
+        stats = locator.get_cache_stats()
+        self.assertEqual(stats["locations"]["hits"], 4)
+        self.assertEqual(stats["calculations"]["hits"], 2)
+
+    def test_locator_creates_caches_once(self):
+        # Worker threads of concurrent fetch mode share caches created by the first of them
+        locator = main.Locator(generate_map=False)
+        locator.settings["memory_cache"]["active"] = True
+        locator.settings["prefix_cache"]["active"] = True
+        slow_cache = lambda *args: (time.sleep(0.01), LRUCache(*args))[1]
+
+        with mock.patch("ip2geotools_locator.caching.memory.LRUCache", side_effect=slow_cache) as cache_class:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                caches = list(executor.map(lambda _: (locator._get_memory_cache(), locator._get_prefix_cache()), range(8)))
+
+        # Cache of database responses and cache of calculations
+        self.assertEqual(cache_class.call_count, 2)
+        self.assertEqual(len({id(memory_cache) for memory_cache, _ in caches}), 1)
+        self.assertEqual(len({id(prefix_cache) for _, prefix_cache in caches}), 1)
+        self.assertIsNotNone(locator._calculation_cache)
+
+    def test_prefix_cache(self):
+        cache = PrefixCache()
+        cache.set("HostIP", "203.0.113.5", fake_location(49.0, 16.0), PREFIX_LENGTH)
+
+        location = cache.get("HostIP", "203.0.113.77", PREFIX_LENGTH)
+        self.assertEqual((location.ip_address, location.latitude), ("203.0.113.77", 49.0))
+        self.assertIsNone(cache.get("HostIP", "203.0.114.5", PREFIX_LENGTH))
+        self.assertIsNone(cache.get("DbIpCity", "203.0.113.5", PREFIX_LENGTH))
+        self.assertIsNone(cache.get("HostIP", "not-an-ip", PREFIX_LENGTH))
+
+        cache.set("HostIP", "2001:db8::1", fake_location(49.0, 16.0), PREFIX_LENGTH)
+        self.assertIsNotNone(cache.get("HostIP", "2001:db8:0:ffff::1", PREFIX_LENGTH))
+        # One hit or miss is counted per lookup
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (2, 2))
+
+    def test_prefix_cache_uses_database_network(self):
+        location = MaxMindLiteDB(MMDB_FILE).get_location("147.229.2.90")
+        self.assertEqual(str(location.network), "147.229.0.0/16")
+        self.assertEqual((location.country, location.region, location.city), ("CZ", "South Moravian", "Brno"))
+
+        cache = PrefixCache()
+        cache.set("MaxMind_GeoLite2City", "147.229.2.90", location, PREFIX_LENGTH)
+        self.assertEqual(cache.get("MaxMind_GeoLite2City", "147.229.200.1", PREFIX_LENGTH).city, "Brno")
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 0))
+        self.assertIsNone(MaxMindLiteDB(MMDB_FILE).get_location("10.0.0.1"))
+
+    def test_connector_registry(self):
+        # Built-in connectors are registered when they are used for the first time
+        self.assertEqual(len(BUILTIN_CONNECTORS), 13)
+        for db_name in BUILTIN_CONNECTORS:
+            self.assertEqual(get_connector_class(db_name).name, db_name)
+        self.assertEqual(len(CONNECTORS), 13)
+        self.assertIsNone(get_connector_class("unknown"))
+        self.assertIsInstance(create_connector("max_mind_lite", {"db_file": MMDB_FILE}), MaxMindLiteDB)
+        self.assertIsNone(create_connector("unknown", {}))
+
+        locator = main.Locator()
+        only_active(locator, "max_mind_lite")
+        locator.settings["noncommercial"]["max_mind_lite"]["db_file"] = MMDB_FILE
+
+        connectors, _ = locator._active_connectors()
+        self.assertEqual(list(connectors), ["MaxMind_GeoLite2City"])
+        # Connector is created once and reused
+        self.assertIs(locator._active_connectors()[0]["MaxMind_GeoLite2City"], connectors["MaxMind_GeoLite2City"])
+        locator.fetch_locations("147.229.2.90")
+        self.assertIn("MaxMind_GeoLite2City", locator.locations)
+
+    def test_connector_classes_exported(self):
+        # Classes imported from package by previous versions are imported on first access
+        from ip2geotools_locator.database_connectors import HostIpDB
+        from ip2geotools_locator.database_connectors.host_ip import HostIpDB as host_ip_class
+        self.assertIs(HostIpDB, host_ip_class)
+        for class_name, module_name in database_connectors.CONNECTOR_CLASSES.items():
+            connector_class = getattr(database_connectors, class_name)
+            self.assertEqual(connector_class.__module__, "ip2geotools_locator.database_connectors." + module_name)
+            self.assertIn(class_name, dir(database_connectors))
+        with self.assertRaises(AttributeError):
+            getattr(database_connectors, "UnknownDB")
+
+    def test_http_pool_reuses_connections(self):
+        server = _Server(("127.0.0.1", 0), KeepAliveHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:%i/json" % server.server_address[1]
+
+        pool = http_pool.HttpPool(pool_size=2, connect_timeout=1, read_timeout=1)
+        try:
+            for _ in range(3):
+                self.assertEqual(pool.get(url).json()["lat"], "49.2")
+            host_stats = pool.stats()["127.0.0.1:%i" % server.server_address[1]]
+            self.assertEqual(host_stats, {"requests": 3, "connections": 1, "reused": 2})
+        finally:
+            pool.close()
+            server.shutdown()
+            server.server_close()
+
+    def test_locator_installs_http_pool(self):
+        locator = main.Locator()
+        only_active(locator, "host_ip")
+        locator._active_connectors()
+
+        self.assertIs(ip2geotools.databases.noncommercial.requests.pool, locator._http_pool)
+        self.assertEqual(locator.get_http_stats(), {})
+
+        # Pool is shared by all Locators and uninstalled by the last one
+        other = main.Locator()
+        only_active(other, "host_ip")
+        other._active_connectors()
+        self.assertIs(other._http_pool, locator._http_pool)
+        locator.close()
+        self.assertIs(http_pool.installed_pool(), other._http_pool)
+        other.close()
+        self.assertIsNone(http_pool.installed_pool())
+
+    def test_file_readers_reopen_replaced_file(self):
+        readers = FileReaders(open_mmdb, check_interval=0)
+        shutil.copy(MMDB_FILE, "test.mmdb")
+
+        reader = readers.get("test.mmdb")
+        self.assertIs(readers.get("test.mmdb"), reader)
+        self.assertEqual(reader.city("147.229.2.90").city.names["en"], "Brno")
+
+        # New file with different inode replaces the old one
+        shutil.copy(MMDB_FILE, "new.mmdb")
+        os.replace("new.mmdb", "test.mmdb")
+        self.assertIsNot(readers.get("test.mmdb"), reader)
+        readers.close()
+
+    def test_ip2location_reader_modes(self):
+        write_ip2location_bin("test.bin", IP2LOCATION_RANGES)
+
+        for mode in Ip2LocationReader.MODES:
+            connector = Ip2LocationDB("test.bin", mode)
+            location = connector.get_location("147.229.2.90")
+            self.assertEqual((location.country, location.city), ("CZ", "Brno"))
+            self.assertAlmostEqual(location.latitude, 49.19, places=4)
+            self.assertIsNone(connector.get_location("8.8.8.8"))
+
+        self.assertIsNone(Ip2LocationDB("missing.bin").get_location("147.229.2.90"))
+        with self.assertRaises(ValueError):
+            Ip2LocationReader("test.bin", "unknown")
+
+    def test_ip2location_reader_threads(self):
+        write_ip2location_bin("test.bin", IP2LOCATION_RANGES)
+        reader = Ip2LocationReader("test.bin", "memory")
+        addresses = ["147.229.%i.1" % i for i in range(200)] + ["8.8.%i.8" % i for i in range(200)]
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            cities = list(executor.map(lambda ip: reader.get_all(ip).city, addresses))
+
+        self.assertEqual(cities, ["Brno"] * 200 + ["-"] * 200)
+        reader.close()
+
+    def test_range_index_lookup(self):
+        write_ip2location_bin("test.bin", IP2LOCATION_RANGES)
+        mmdb_index = compile_database("max_mind_lite", MMDB_FILE)
+        bin_index = compile_database("ip2location", "test.bin")
+
+        # Unknown ranges of IP2Location file are skipped
+        self.assertEqual((len(mmdb_index), len(bin_index)), (3, 1))
+        self.assertEqual(mmdb_index.get("147.229.2.90").city, "Brno")
+        self.assertIsNone(mmdb_index.get("1.1.1.1"))
+
+        addresses = ["147.229.2.90", "8.8.8.8", "1.1.1.1", "203.0.113.127", "203.0.113.128"]
+        self.assertEqual(mmdb_index.lookup(ip_numbers(addresses)).tolist(), [1, 0, -1, 2, -1])
+        latitudes, longitudes = bin_index.locations(ip_numbers(addresses))
+        self.assertAlmostEqual(latitudes[0], 49.19, places=4)
+        self.assertTrue(all(value != value for value in longitudes[1:]))
+
+        # Big arrays are sorted before search
+        many = ip_numbers(addresses * 1000)
+        self.assertEqual(mmdb_index.lookup(many).tolist(), [1, 0, -1, 2, -1] * 1000)
+
+        mmdb_index.save("index.npz")
+        self.assertEqual(RangeIndex.load("index.npz").get("8.8.8.8").region, "Kansas")
+
+    def test_cli_compile_index(self):
+        locator = main.Locator()
+        only_active(locator, "max_mind_lite", "host_ip")
+        locator.settings["noncommercial"]["max_mind_lite"]["db_file"] = MMDB_FILE
+        locator.save_settings()
+
+        result = CliRunner().invoke(cli.cmd, ["--compile-index", "indices", "--no-logs"])
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(os.listdir("indices"), ["max_mind_lite.npz"])
+
+    def test_build_consensus(self):
+        write_ip2location_bin("test.bin", [("0.0.0.0", "-", "-", "-", 0.0, 0.0), ("147.229.0.0", "CZ", "Moravia", "Brno", 49.0, 16.0),
+                                           ("147.229.128.0", "CZ", "Moravia", "Brno", 49.0, 16.0),
+                                           ("147.229.192.0", "CZ", "Moravia", "Zlin", 49.2, 17.6), ("147.230.0.0", "-", "-", "-", 0.0, 0.0)])
+        mmdb_index = compile_database("max_mind_lite", MMDB_FILE)
+        bin_index = compile_database("ip2location", "test.bin")
+
+        consensus = build_consensus([mmdb_index, bin_index], "Average")
+        # Only 147.229.0.0/16 is in both databases, equal neighbouring ranges are merged
+        self.assertEqual(consensus.tables[4]["starts"].tolist(), [int(ipaddress.ip_address("147.229.0.0")), int(ipaddress.ip_address("147.229.192.0"))])
+        self.assertEqual(consensus.tables[4]["ends"].tolist(), [int(ipaddress.ip_address("147.229.191.255")), int(ipaddress.ip_address("147.229.255.255"))])
+
+        expected = main.Locator.calculate_locations({"A": mmdb_index.get("147.229.200.1"), "B": bin_index.get("147.229.200.1")})
+        location = consensus.get("147.229.200.1")
+        self.assertEqual((location.latitude, location.longitude), tuple(expected["Average"]))
+        # City of the first database is used
+        self.assertEqual(location.city, "Brno")
+        self.assertIsNone(consensus.get("8.8.8.8"))
+
+    def test_locator_consensus(self):
+        write_ip2location_bin("test.bin", IP2LOCATION_RANGES)
+        locator = main.Locator()
+        only_active(locator, "max_mind_lite", "ip2location")
+        locator.settings["noncommercial"]["max_mind_lite"]["db_file"] = MMDB_FILE
+        locator.settings["noncommercial"]["ip2location"]["db_file"] = "test.bin"
+        locator.save_settings()
+
+        result = CliRunner().invoke(cli.cmd, ["--build-consensus", "-m", "--no-logs"])
+        self.assertEqual(result.exit_code, 0)
+
+        location = locator.get_consensus("147.229.2.90")
+        self.assertEqual((location.latitude, location.longitude), (round((49.1952 + 49.19) / 2, 4), round((16.608 + 16.61) / 2, 4)))
+        self.assertIsNone(locator.get_consensus("not-an-ip"))
+
+    def test_rate_limiter(self):
+        now = [0.0]
+        day = [datetime.date(2020, 1, 1)]
+        limiter = RateLimiter(per_second=2, burst=2, daily_quota=5, max_delay=0.6, clock=lambda: now[0], today=lambda: day[0])
+
+        # Burst, one delayed request and rejected request which would wait too long
+        self.assertEqual([limiter.reserve() for _ in range(4)], [0.0, 0.0, 0.5, None])
+        now[0] = 10.0
+        self.assertEqual([limiter.reserve() for _ in range(3)], [0.0, 0.0, None])
+        self.assertEqual(limiter.stats(), {"used_today": 5, "daily_quota": 5, "exhausted": True, "delayed": 1, "rejected": 2})
+
+        # Quota is renewed next day
+        day[0] = datetime.date(2020, 1, 2)
+        now[0] = 20.0
+        self.assertEqual(limiter.reserve(), 0.0)
+
+    def test_rate_limiter_shares_daily_quota(self):
+        # Limiters of two processes count daily quota in the same cache file
+        day = [datetime.date(2020, 1, 1)]
+        first, second = [RateLimiter(daily_quota=3, today=lambda: day[0],
+                                     quota_store=functools.partial(PersistentCache("cache.sqlite3").add_quota, "skyhook")) for _ in range(2)]
+
+        self.assertEqual([first.reserve(), first.reserve(), second.reserve(), second.reserve()], [0.0, 0.0, 0.0, None])
+        self.assertEqual(first.stats()["used_today"], 2)
+        self.assertEqual(second.stats()["used_today"], 3)
+        # Request over quota found by other limiter is counted, but not sent
+        self.assertIsNone(first.reserve())
+        self.assertEqual(PersistentCache("cache.sqlite3").add_quota("skyhook", "2020-01-01"), (4, False))
+
+        # Exhausted quota is shared too and next day starts from zero
+        day[0] = datetime.date(2020, 1, 2)
+        first.exhaust()
+        self.assertIsNone(RateLimiter(daily_quota=3, today=lambda: day[0],
+                                      quota_store=functools.partial(PersistentCache("cache.sqlite3").add_quota, "skyhook")).reserve())
+        self.assertEqual(PersistentCache("cache.sqlite3").add_quota("ipstack", "2020-01-02"), (0, False))
+
+        # Locator shares quota through persistent cache set as Active
+        locator = main.Locator()
+        locator.settings["cache"].update({"active": True, "db_file": "cache.sqlite3"})
+        rate_limiter = locator._get_rate_limiter("skyhook", {"rate_limit": {"daily_quota": 3}})
+        self.assertIsNotNone(rate_limiter.quota_store)
+        self.assertIsNone(locator._get_rate_limiter("host_ip", {"rate_limit": {"daily_quota": 0}}).quota_store)
+
+    def test_connector_stops_after_limit_exceeded(self):
+        calls = []
+
+        class LimitedDB(DatabaseConnector):
+            location_name = "Limited"
+
+            def _get(self, ip_address):
+                calls.append(ip_address)
+                raise LimitExceededError()
+
+        # Database without daily quota is skipped only for cool-down
+        now = [0.0]
+        connector = LimitedDB()
+        connector.rate_limiter = RateLimiter(cool_down=30, clock=lambda: now[0])
+        self.assertIsNone(connector.get_location("10.0.0.1"))
+        now[0] = 29.0
+        self.assertIsNone(connector.get_location("10.0.0.2"))
+        self.assertEqual(calls, ["10.0.0.1"])
+        self.assertFalse(connector.rate_limiter.exhausted)
+        now[0] = 30.0
+        self.assertIsNone(connector.get_location("10.0.0.3"))
+        self.assertEqual(calls, ["10.0.0.1", "10.0.0.3"])
+
+        # Daily quota is exhausted until the end of day
+        connector.rate_limiter = RateLimiter(daily_quota=100, clock=lambda: now[0])
+        self.assertIsNone(connector.get_location("10.0.0.4"))
+        now[0] = 1000.0
+        self.assertIsNone(connector.get_location("10.0.0.5"))
+        self.assertEqual(calls, ["10.0.0.1", "10.0.0.3", "10.0.0.4"])
+        self.assertTrue(connector.rate_limiter.exhausted)
+
+        # Used quota is kept when settings are changed
+        locator = main.Locator()
+        only_active(locator, "max_mind_lite")
+        locator._active_connectors()[0]["MaxMind_GeoLite2City"].rate_limiter.exhaust()
+        locator.set_settings(locator.get_settings())
+        self.assertTrue(locator._active_connectors()[0]["MaxMind_GeoLite2City"].rate_limiter.exhausted)
+        self.assertTrue(locator.get_rate_limit_stats()["max_mind_lite"]["exhausted"])
+
+    def test_circuit_breaker(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=lambda: now[0])
+
+        for _ in range(2):
+            self.assertTrue(breaker.allow())
+            breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+        # One probe is let through after timeout, failed probe opens breaker again
+        now[0] = 31.0
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+        now[0] = 62.0
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.stats(), {"state": "closed", "failures": 0, "times_opened": 2, "rejected": 2})
+
+    def test_circuit_breaker_skips_failing_database(self):
+        calls = []
+
+        class FailingDB(DatabaseConnector):
+            location_name = "Failing"
+
+            def _get(self, ip_address):
+                calls.append(ip_address)
+                raise ServiceError()
+
+        locator = main.Locator()
+        locator.settings["circuit_breaker"]["failure_threshold"] = 3
+        connector = FailingDB()
+        connector.circuit_breaker = locator._get_circuit_breaker("failing")
+
+        for index in range(10):
+            self.assertIsNone(connector.get_location("10.0.0.%i" % index))
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(locator.get_circuit_breakers()["failing"]["state"], "open")
+
+        with mock.patch.object(main.Locator, "get_circuit_breakers", return_value=locator.get_circuit_breakers()):
+            result = CliRunner().invoke(cli.cmd, ["--input", "-", "--no-logs"], input="")
+        self.assertIn("Circuit breaker of failing database is open (opened 1 times, 7 requests skipped).", result.stderr)
+
+    def test_metrics(self):
+        responses = [fake_location(49.0, 16.0), ServiceError(), LimitExceededError(), fake_location(49.0, None)]
+
+        class MeasuredDB(DatabaseConnector):
+            location_name = "Measured"
+
+            def _get(self, ip_address):
+                response = responses.pop(0)
+                if isinstance(response, Exception):
+                    raise response
+                return response
+
+        locator = main.Locator(generate_map=False)
+        locator.settings["memory_cache"]["active"] = True
+        connector = MeasuredDB()
+        connector.metrics = locator._metrics
+        connectors, databases = with_settings({"Measured": connector})
+
+        with mock.patch.object(main.Locator, "_active_connectors", return_value=(connectors, databases)):
+            list(locator.locate_many(["10.0.0.1", "10.0.0.1", "10.0.0.2", "10.0.0.3", "10.0.0.4"]))
+
+        stats = locator.get_metrics()
+        measured = stats["databases"]["Measured"]
+        self.assertEqual({outcome: count for outcome, count in measured["outcomes"].items() if count},
+                         {"success": 1, "service_error": 1, "limit_exceeded": 1, "invalid_response": 1})
+        self.assertEqual(measured["success_rate"], 0.25)
+        self.assertEqual(measured["latency"]["count"], 4)
+        self.assertEqual(stats["caches"]["memory"], {"hits": 1, "misses": 4, "hit_rate": 0.2})
+
+        text = locator.export_metrics()
+        self.assertIn('ip2geotools_locator_database_request_duration_seconds_bucket{database="Measured",le="+Inf"} 4', text)
+        self.assertIn('ip2geotools_locator_database_requests_total{database="Measured",outcome="service_error"} 1', text)
+        self.assertIn('ip2geotools_locator_cache_requests_total{cache="memory",result="hit"} 1', text)
+
+        histogram = Metrics(buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.5, 0.5, 5.0):
+            histogram.observe("A", "success", seconds)
+        self.assertEqual(histogram.stats()["databases"]["A"]["latency"]["buckets"], {0.1: 1, 1.0: 3})
+        self.assertEqual(histogram.stats()["databases"]["A"]["latency"]["p99"], float("inf"))
+
+    def test_profiler(self):
+        locator = main.Locator(generate_map=False)
+        connectors, databases = with_settings(fake_connectors())
+
+        with profiling.Profiler() as profiler:
+            with mock.patch.object(main.Locator, "_active_connectors", return_value=(connectors, databases)):
+                list(locator.locate_many(["10.0.0.1", "10.0.0.2"], median=True))
+        # Spans after stop are not recorded
+        locator.calculate_locations({"A": Location(1, 1), "B": Location(2, 2)})
+
+        stats = profiler.stats()
+        self.assertEqual(stats["database A"]["count"], 2)
+        self.assertEqual(stats["calculation Median"]["count"], 2)
+        self.assertEqual(stats["calculation Average"]["count"], 2)
+        self.assertIsNone(profiling.installed_profiler())
+        self.assertIn("database B", profiler.report())
+
+        with tempfile.TemporaryDirectory() as directory:
+            profile_file = os.path.join(directory, "run.pstats")
+            with mock.patch.object(main.Locator, "_active_connectors", return_value=(connectors, databases)):
+                result = CliRunner().invoke(cli.cmd, ["--no-logs", "--no-map", "--profile-file", profile_file, "-a", "147.229.2.90"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertTrue(os.path.getsize(profile_file) > 0)
+        self.assertIn("imports", result.stderr)
+        self.assertIn("lookup", result.stderr)
+
+    def test_throughput_benchmark(self):
+        result = throughput.run_scenario(ip_count=20, provider_count=3, jobs=4, median_latency=0.0, error_rate=0.5, method="average")
+        self.assertEqual((result["ips"], result["providers"], result["jobs"]), (20, 3, 4))
+        self.assertEqual(result["locations"] + result["errors"], 60)
+        self.assertLessEqual(result["latency_ms"]["p50"], result["latency_ms"]["p99"])
+
+        # Simulated databases are deterministic
+        self.assertEqual(throughput.run_scenario(20, 3, 1, 0.0, 0.5, "none")["errors"], result["errors"])
+
+    def test_calculations_benchmark(self):
+        self.assertEqual(calculations.make_locations("split", 5, seed=1), calculations.make_locations("split", 5, seed=1))
+        result = calculations.run_scenario("Median", "outlier", 5, repeat=3)
+        self.assertEqual(result["calls"], 3)
+        self.assertGreater(result["allocated_bytes"], 0)
+
+    def test_startup_benchmark(self):
+        # Command line interface does not load modules of features it does not use
+        with tempfile.TemporaryDirectory() as directory:
+            startup.write_settings(directory)
+            for scenario in ("help", "lookup"):
+                result = startup.run_scenario(scenario, repeat=3, directory=directory)
+                self.assertEqual(result["heavy_modules"], [])
+                self.assertEqual(result["runs"], 3)
+                self.assertTrue(result["target_met"], "%s overhead %.1f ms" % (scenario, result["overhead_ms"]))
+
+    def test_batch_calculation(self):
+        locations_list = [calculations.make_locations(pattern, size, seed) for pattern in calculations.PATTERNS
+                          for size in (2, 3, 4, 13) for seed in range(3)]
+        locations_list.append({"DB00": Location(49.0, 16.0)})
+        locations_list[0]["DB01"] = None
+
+        calculated = main.Locator.calculate_many(locations_list, median=True)
+        for locations, batch_locations in zip(locations_list, calculated):
+            locations = {name: location for name, location in locations.items() if location is not None}
+            if len(locations) < 2:
+                self.assertEqual(batch_locations, {})
+                continue
+            expected = main.Locator.calculate_locations(locations, median=True)
+            for method, location in expected.items():
+                self.assertAlmostEqual(batch_locations[method].latitude, location.latitude, places=4)
+                self.assertAlmostEqual(batch_locations[method].longitude, location.longitude, places=4)
+
+        # Missing locations may be masked or NaN
+        latitudes = numpy.ma.masked_array([[1.0, 2.0, 9.0], [1.0, 3.0, numpy.nan]], mask=[[False, False, True], [False, False, False]])
+        batch = BatchCalculation(latitudes, [[1.0, 2.0, 9.0], [1.0, 3.0, 5.0]])
+        self.assertEqual(batch.counts.tolist(), [2, 2])
+        self.assertEqual(batch.calculate("Median")[0].tolist(), [1.5, 2.0])
+
+    def test_centroid(self):
+        # Average of locations around antimeridian is on the other side of the Earth
+        fiji = {"A": Location(-17.8, 179.9), "B": Location(-17.6, -179.9)}
+        self.assertAlmostEqual(main.Locator.calculate_locations(fiji)["Average"].longitude, 0.0)
+        centroid = main.Locator.calculate_locations(fiji, average=False, centroid=True)["Centroid"]
+        self.assertAlmostEqual(centroid.latitude, -17.7, places=2)
+        self.assertAlmostEqual(abs(centroid.longitude), 180.0, places=3)
+
+        self.assertEqual(Centroid.calculate({"A": Location(49.0, 16.0), "B": Location(49.0, 16.0)}), Location(49.0, 16.0))
+        self.assertIsNone(Centroid.calculate({"A": Location(0.0, 0.0), "B": Location(0.0, 180.0)}))
+
+        locations_list = [calculations.make_locations("scattered", 5, seed) for seed in range(20)] + [fiji, {}]
+        batch_locations = main.Locator.calculate_many(locations_list, average=False, centroid=True)
+        for locations, calculated in zip(locations_list[:-1], batch_locations):
+            self.assertAlmostEqual(calculated["Centroid"].latitude, Centroid.calculate(locations).latitude, places=4)
+            self.assertAlmostEqual(calculated["Centroid"].longitude, Centroid.calculate(locations).longitude, places=4)
+        self.assertEqual(batch_locations[-1], {})
+
+    def test_geometric_median(self):
+        # Far outlier moves Average, but not Geometric median
+        locations = {"A": Location(49.18, 16.60), "B": Location(49.20, 16.60), "C": Location(49.18, 16.62), "D": Location(49.20, 16.62),
+                     "E": Location(50.08, 14.44)}
+        calculated = main.Locator.calculate_locations(locations, geometric_median=True)
+        self.assertGreater(calculated["Average"].latitude, 49.3)
+        self.assertAlmostEqual(calculated["GeometricMedian"].latitude, 49.19, delta=0.01)
+        self.assertAlmostEqual(calculated["GeometricMedian"].longitude, 16.61, delta=0.01)
+
+        fiji = {"A": Location(-17.8, 179.9), "B": Location(-17.8, -179.9), "C": Location(-17.7, 179.95)}
+        self.assertAlmostEqual(abs(GeometricMedian.calculate(fiji).longitude), 180.0, delta=0.1)
+        self.assertIsNone(GeometricMedian.calculate({"A": Location(0.0, 0.0), "B": Location(0.0, 180.0)}))
+
+        locations_list = [calculations.make_locations(pattern, size, seed) for pattern in calculations.PATTERNS
+                          for size in (2, 3, 8, 13) for seed in range(5)] + [fiji, {}]
+        batch_locations = main.Locator.calculate_many(locations_list, average=False, geometric_median=True)
+        for locations, calculated in zip(locations_list[:-1], batch_locations):
+            expected = GeometricMedian.calculate(locations)
+            self.assertAlmostEqual(calculated["GeometricMedian"].latitude, expected.latitude, places=4)
+            self.assertAlmostEqual(calculated["GeometricMedian"].longitude, expected.longitude, places=4)
+        self.assertEqual(batch_locations[-1], {})
+
+    def test_threshold_clustering(self):
+        locations = {"A": Location(49.19, 16.61), "B": Location(49.20, 16.60), "C": Location(49.21, 16.62),
+                     "D": Location(50.08, 14.44), "E": Location(50.09, 14.43)}
+        members, centroid = densest_cluster(locations)
+        self.assertEqual(members, ["A", "B", "C"])
+        self.assertAlmostEqual(centroid.latitude, 49.2, places=3)
+
+        # Clusters around antimeridian are found by great-circle distance
+        pacific = {"A": Location(-17.8, 179.95), "B": Location(-17.8, -179.95), "C": Location(-17.7, 179.99), "D": Location(-33.9, 151.2)}
+        self.assertEqual(densest_cluster(pacific)[0], ["A", "B", "C"])
+        self.assertAlmostEqual(abs(Clustering.calculate(pacific).longitude), 180.0, delta=0.05)
+
+        self.assertIsNone(Clustering.calculate({"A": Location(49.0, 16.0), "B": Location(49.0, 16.0)}))
+        self.assertAlmostEqual(Clustering.calculate(locations, engine="kmeans").latitude, 49.5, delta=0.7)
+
+        locations_list = [calculations.make_locations(pattern, size, seed) for pattern in calculations.PATTERNS
+                          for size in (2, 3, 5, 13) for seed in range(5)]
+        batch_locations = main.Locator.calculate_many(locations_list, average=False, clustering=True)
+        for locations, calculated in zip(locations_list, batch_locations):
+            expected = Clustering.calculate(locations)
+            if expected is None:
+                self.assertEqual(calculated, {})
+            else:
+                self.assertAlmostEqual(calculated["Clustering"].latitude, expected.latitude, places=4)
+                self.assertAlmostEqual(calculated["Clustering"].longitude, expected.longitude, places=4)
+
+    def test_find_quorum(self):
+        self.assertAlmostEqual(haversine(Location(49.1951, 16.6068), Location(50.0755, 14.4378)), 185.0, delta=1.0)
+
+        locations = {"A": Location(49.19, 16.60), "B": Location(49.20, 16.61), "C": Location(50.07, 14.43), "D": Location(49.21, 16.62)}
+        self.assertEqual(sorted(find_quorum(locations, 3, 10)), ["A", "B", "D"])
+        self.assertIsNone(find_quorum(locations, 4, 10))
+        self.assertEqual(len(find_quorum(locations, 4, 300)), 4)
+
+    def test_quorum_early_exit(self):
+        locator = main.Locator()
+        locator.settings["jobs"] = 4
+        locator.settings["quorum"].update({"active": True, "min_locations": 2, "max_spread_km": 50})
+        connectors = {"A": FakeConnector(fake_location(49.19, 16.60)), "Slow": FakeConnector(fake_location(0.0, 0.0), delay=1.0),
+                      "B": FakeConnector(fake_location(49.20, 16.61), delay=0.05)}
+
+        started = time.monotonic()
+        with mock.patch.object(main.Locator, "_active_connectors", return_value=with_settings(connectors)):
+            locator.fetch_locations("10.0.0.1")
+            record = next(locator.locate_many(["10.0.0.2"]))
+
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(list(locator.locations), ["A", "B"])
+        self.assertEqual(sorted(locator.quorum), ["A", "B"])
+        self.assertEqual(sorted(record.quorum), ["A", "B"])
+        locator.close()
+
+    def test_async_quorum(self):
+        def fetch(latitude, delay):
+            async def fetch_location(session, ip_address):
+                await asyncio.sleep(delay)
+                if latitude is None:
+                    raise TypeError("unexpected response")
+                return IpLocation(ip_address, latitude=latitude, longitude=16.6)
+            return fetch_location, ()
+
+        async def lookup():
+            async with async_locator.AsyncLocator() as locator:
+                only_active(locator, "host_ip", "skyhook", "eurek", "ip_info")
+                locator.settings["quorum"].update({"active": True, "min_locations": 2})
+                return await locator.fetch_locations("147.229.2.90"), locator.quorum
+
+        databases = {"host_ip": fetch(49.19, 0), "skyhook": fetch(49.2, 0.01), "eurek": fetch(0.0, 5), "ip_info": fetch(None, 0)}
+        started = time.monotonic()
+        with mock.patch.dict(async_locator.ASYNC_DATABASES, databases):
+            locations, quorum = run_coroutine(lookup())
+
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(sorted(locations), ["HostIP", "Skyhook"])
+        self.assertEqual(sorted(quorum), ["HostIP", "Skyhook"])